@@ -0,0 +1,393 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# big binaries of the project that git shouldnt carry (they are in .gitignore, this syncs them instead)
+default_paths = ["./runs", "./embedding_models", "./datasets"]
+default_store = "./.artifact_store"
+
+# random byte ---> value table of the rolling hash, fixed so every machine cuts the same data into the same chunks
+gear = np.random.default_rng(0x5EA1).integers(0, 2 ** 32, size=256, dtype=np.uint32)
+
+def chunk_candidates(data: np.ndarray, start: int, end: int, window: int=64, average_size: int=1024 * 1024) -> np.ndarray:
+    """
+    content defined cut points in data[start:end]: the positions after which the rolling hash of the last window bytes has its low bits all zero.\n
+    the hash is a windowed sum of gear values (one gather + one cumsum for the whole range), so it only depends on the last window bytes
+    and inserting / removing bytes only moves the cuts around the edit
+
+    Args:
+        data (np.ndarray): uint8 view of the file (e.g. a np.memmap)
+        start (int): first position to test
+        end (int): one past the last position to test
+        window (int): bytes the hash covers
+        average_size (int): power of two, a cut happens every average_size bytes on average
+
+    Returns:
+        np.ndarray: int64 cut offsets (the chunk ends before them), ascending
+    """
+
+    lead = min(start, window)
+
+    # uint32 sums wrap around, which the difference below undoes
+    sums = np.cumsum(gear[data[start - lead:end]], dtype=np.uint32)
+    hashes = sums[lead:].copy()
+
+    if len(sums) > window:
+        hashes[window - lead:] -= sums[:len(sums) - window]
+
+    return np.flatnonzero((hashes & np.uint32(average_size - 1)) == 0).astype(np.int64) + start + 1
+
+def select_cuts(candidates: np.ndarray, size: int, min_size: int, max_size: int) -> list[int]:
+    """
+    turns candidate cut offsets into chunk ends: candidates closer than min_size to the last cut are dropped and a cut is forced every max_size bytes without one
+
+    Returns:
+        list[int]: end offset of every chunk, the last one is size
+    """
+
+    cuts = []
+    last = 0
+
+    for cut in candidates.tolist() + [size]:
+        while cut - last > max_size:
+            last += max_size
+            cuts.append(last)
+
+        if cut - last >= min_size or (cut == size and cut > last):
+            cuts.append(cut)
+            last = cut
+
+    return cuts
+
+class chunk_store:
+    """
+    content addressed store: every chunk is a file named by its sha256 (chunks/ab/abcd...), every snapshot a json manifest listing each file's chunks (manifests/).\n
+    a chunk is written once no matter how many files / snapshots contain it, and a store can be pushed to another directory by copying only the chunks it is missing
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.chunks_dir = os.path.join(root, "chunks")
+        self.manifests_dir = os.path.join(root, "manifests")
+
+        os.makedirs(self.chunks_dir, exist_ok=True)
+        os.makedirs(self.manifests_dir, exist_ok=True)
+
+    def chunk_path(self, digest: str) -> str:
+        return os.path.join(self.chunks_dir, digest[:2], digest)
+
+    def has(self, digest: str) -> bool:
+        return os.path.exists(self.chunk_path(digest))
+
+    def put(self, digest: str, data) -> bool:
+        """
+        writes a chunk if the store doesnt have it yet (atomic rename, so a crashed write never leaves a bad chunk)
+
+        Returns:
+            bool: the chunk was new
+        """
+
+        path = self.chunk_path(digest)
+
+        if os.path.exists(path):
+            return False
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # a tmp file of its own, so concurrent puts of the same chunk never write into / rename each others file
+        descriptor, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(data)
+
+        os.replace(tmp_path, path)
+
+        return True
+
+    def manifest_names(self) -> list[str]:
+        # oldest first (the names are timestamps)
+        return sorted(name[:-len(".json")] for name in os.listdir(self.manifests_dir) if name.endswith(".json"))
+
+    def load_manifest(self, name: str=None) -> dict:
+        """
+        returns the manifest called name (None ---> the newest one, or None if the store has none)
+        """
+
+        names = self.manifest_names()
+
+        if name is None:
+            if not names:
+                return None
+
+            name = names[-1]
+
+        with open(os.path.join(self.manifests_dir, name + ".json")) as file:
+            return json.load(file)
+
+    def save_manifest(self, manifest: dict) -> str:
+        path = os.path.join(self.manifests_dir, manifest["name"] + ".json")
+
+        with open(path + ".tmp", "w") as file:
+            json.dump(manifest, file, indent=1)
+
+        os.replace(path + ".tmp", path)
+
+        return path
+
+def list_files(paths: list[str]) -> list[str]:
+    # every file under paths (files are taken as they are), skipping the tmp files of running writers
+    files = []
+
+    for path in paths:
+        if os.path.isfile(path):
+            files.append(path)
+            continue
+
+        for directory, _, names in os.walk(path):
+            files += [os.path.join(directory, name) for name in sorted(names) if not name.endswith(".tmp")]
+
+    return files
+
+def snapshot(paths: list[str], store: chunk_store, workers: int=None, average_size: int=1024 * 1024, min_size: int=256 * 1024,
+             max_size: int=8 * 1024 * 1024, segment_size: int=4 * 1024 * 1024) -> tuple[dict, dict]:
+    """
+    chunks + hashes the files under paths into store and saves a manifest of them.\n
+    files whose size and mtime match the previous manifest reuse its chunk list without being read. the rest are cut into content defined chunks
+    (segments of every file in parallel), the chunks sha256 hashed in parallel (hashlib releases the gil) and only chunks the store doesnt have are written
+
+    Args:
+        paths (list[str]): files / directories to snapshot
+        store (chunk_store): the store
+        workers (int): hashing / chunking threads (None ---> cpu count)
+        average_size (int): average chunk size (power of two)
+        min_size (int): smallest chunk (except a file's last one)
+        max_size (int): biggest chunk
+        segment_size (int): bytes per parallel chunking task
+
+    Returns:
+        dict: the manifest
+        dict: report (bytes scanned, new / deduplicated bytes, time)
+    """
+
+    start = time.perf_counter()
+    workers = workers or os.cpu_count()
+    previous = store.load_manifest() or {"files": {}}
+
+    manifest = {"name": datetime.now().strftime("%Y-%m-%d_%H-%M-%S-%f"), "created": datetime.now().isoformat(), "files": {}}
+    report = {"files": 0, "unchanged_files": 0, "bytes": 0, "hashed_bytes": 0, "chunks": 0, "new_chunks": 0, "new_bytes": 0, "deduplicated_bytes": 0}
+
+    changed = []
+
+    for path in list_files(paths):
+        stat = os.stat(path)
+        key = os.path.relpath(path).replace(os.sep, "/")
+        old_entry = previous["files"].get(key)
+
+        report["files"] += 1
+        report["bytes"] += stat.st_size
+
+        if old_entry is not None and old_entry["size"] == stat.st_size and old_entry["mtime_ns"] == stat.st_mtime_ns:
+            manifest["files"][key] = old_entry
+            report["unchanged_files"] += 1
+        else:
+            changed.append((key, path, stat))
+
+    seen = set()
+
+    with ThreadPoolExecutor(workers) as pool:
+        for key, path, stat in changed:
+            data = np.memmap(path, dtype=np.uint8, mode="r") if stat.st_size else np.zeros(0, dtype=np.uint8)
+
+            segments = [(segment_start, min(segment_start + segment_size, stat.st_size)) for segment_start in range(0, stat.st_size, segment_size)]
+            candidates = list(pool.map(lambda segment: chunk_candidates(data, *segment, average_size=average_size), segments))
+            cuts = select_cuts(np.concatenate(candidates) if candidates else np.zeros(0, dtype=np.int64), stat.st_size, min_size, max_size)
+
+            bounds = list(zip([0] + cuts[:-1], cuts))
+            digests = list(pool.map(lambda bound: hashlib.sha256(data[bound[0]:bound[1]]).hexdigest(), bounds))
+
+            # one write per chunk the store doesnt have yet (repeats within this file and this snapshot are written once)
+            unique = {digest: bound for digest, bound in zip(digests, bounds) if digest not in seen}
+            new = [(digest, bound) for digest, bound in unique.items() if not store.has(digest)]
+            seen.update(unique)
+
+            list(pool.map(lambda item: store.put(item[0], data[item[1][0]:item[1][1]]), new))
+
+            report["hashed_bytes"] += stat.st_size
+            report["new_chunks"] += len(new)
+            report["new_bytes"] += sum(last - first for _, (first, last) in new)
+
+            manifest["files"][key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "chunks": [[digest, last - first] for digest, (first, last) in zip(digests, bounds)]}
+
+            del data
+
+    report["chunks"] = sum(len(entry["chunks"]) for entry in manifest["files"].values())
+    report["deduplicated_bytes"] = report["bytes"] - report["new_bytes"]
+    report["seconds"] = time.perf_counter() - start
+
+    store.save_manifest(manifest)
+
+    return manifest, report
+
+def push(store: chunk_store, target: chunk_store, manifest_name: str=None, workers: int=None) -> dict:
+    """
+    copies a manifest and every chunk of it that target doesnt have yet (chunks first, so target never has a manifest with missing chunks)
+
+    Args:
+        store (chunk_store): source store
+        target (chunk_store): target store (e.g. a mounted directory of the training box)
+        manifest_name (str): manifest to push (None ---> the newest)
+        workers (int): copy threads (None ---> cpu count)
+
+    Returns:
+        dict: report (chunks / bytes copied, bytes the target already had, time)
+    """
+
+    start = time.perf_counter()
+    manifest = store.load_manifest(manifest_name)
+
+    if manifest is None:
+        raise FileNotFoundError(f"no manifest in {store.root}, snapshot first")
+
+    chunk_sizes = {digest: size for entry in manifest["files"].values() for digest, size in entry["chunks"]}
+    missing = [digest for digest in chunk_sizes if not target.has(digest)]
+
+    def copy(digest):
+        path = target.chunk_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        shutil.copyfile(store.chunk_path(digest), f"{path}.{os.getpid()}.tmp")
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+    with ThreadPoolExecutor(workers or os.cpu_count()) as pool:
+        list(pool.map(copy, missing))
+
+    target.save_manifest(manifest)
+
+    copied_bytes = sum(chunk_sizes[digest] for digest in missing)
+
+    return {"manifest": manifest["name"], "chunks": len(chunk_sizes), "copied_chunks": len(missing), "copied_bytes": copied_bytes,
+            "skipped_bytes": sum(chunk_sizes.values()) - copied_bytes, "seconds": time.perf_counter() - start}
+
+def restore(store: chunk_store, out_dir: str, manifest_name: str=None) -> dict:
+    """
+    rebuilds the files of a manifest under out_dir from the chunks (with their recorded mtime, so a later snapshot of out_dir doesnt rehash them).
+    files that already have the recorded size and mtime are left alone, and so are files that arent in the manifest
+
+    Returns:
+        dict: report (files / bytes written, time)
+    """
+
+    start = time.perf_counter()
+    manifest = store.load_manifest(manifest_name)
+
+    if manifest is None:
+        raise FileNotFoundError(f"no manifest in {store.root}")
+
+    report = {"manifest": manifest["name"], "files": 0, "written_files": 0, "written_bytes": 0}
+
+    for key, entry in manifest["files"].items():
+        path = os.path.join(out_dir, key)
+        report["files"] += 1
+
+        if os.path.exists(path) and os.stat(path).st_size == entry["size"] and os.stat(path).st_mtime_ns == entry["mtime_ns"]:
+            continue
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        with open(path + ".tmp", "wb") as file:
+            for digest, _ in entry["chunks"]:
+                with open(store.chunk_path(digest), "rb") as chunk:
+                    shutil.copyfileobj(chunk, file)
+
+        os.replace(path + ".tmp", path)
+        os.utime(path, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+
+        report["written_files"] += 1
+        report["written_bytes"] += entry["size"]
+
+    report["seconds"] = time.perf_counter() - start
+
+    return report
+
+def prune(store: chunk_store, keep_manifests: int=3) -> dict:
+    """
+    deletes all but the newest keep_manifests manifests and every chunk none of the kept ones uses (e.g. checkpoints checkpoint_manager already deleted)
+
+    Returns:
+        dict: report (manifests / chunks / bytes deleted, time)
+    """
+
+    start = time.perf_counter()
+    names = store.manifest_names()
+    kept = names[-keep_manifests:] if keep_manifests > 0 else []
+
+    used = {digest for name in kept for entry in store.load_manifest(name)["files"].values() for digest, _ in entry["chunks"]}
+    report = {"deleted_manifests": 0, "deleted_chunks": 0, "deleted_bytes": 0}
+
+    for name in names:
+        if name not in kept:
+            os.remove(os.path.join(store.manifests_dir, name + ".json"))
+            report["deleted_manifests"] += 1
+
+    for directory, _, chunk_names in os.walk(store.chunks_dir):
+        for digest in chunk_names:
+            if digest not in used:
+                report["deleted_bytes"] += os.path.getsize(os.path.join(directory, digest))
+                report["deleted_chunks"] += 1
+                os.remove(os.path.join(directory, digest))
+
+    report["seconds"] = time.perf_counter() - start
+
+    return report
+
+def print_report(title: str, report: dict):
+    print(title)
+
+    for name, value in report.items():
+        if name.endswith("bytes"):
+            value = f"{value / 1024 ** 2:.1f}MB"
+        elif name == "seconds":
+            value = f"{value:.2f}s"
+
+        print(f"  {name:20} {value}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="content addressed, incremental sync of the big training artifacts (checkpoints, embedding models, datasets), git only carries the source")
+    parser.add_argument("command", choices=["snapshot", "push", "sync", "restore", "prune"], help="sync = snapshot + push")
+    parser.add_argument("paths", nargs="*", default=default_paths, help="files / directories to snapshot")
+    parser.add_argument("--store", default=default_store, help="local chunk store")
+    parser.add_argument("--target", default=None, help="store to push to (push / sync), or to restore from (restore, default --store)")
+    parser.add_argument("--out", default=".", help="directory to restore into")
+    parser.add_argument("--manifest", default=None, help="manifest name to push / restore (default: the newest)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--average-chunk-mb", type=int, default=1, help="average chunk size, power of two")
+    parser.add_argument("--keep", type=int, default=3, help="manifests prune keeps (in --store, and in --target if given)")
+    args = parser.parse_args()
+
+    store = chunk_store(args.store)
+
+    if args.command in ["snapshot", "sync"]:
+        average_size = args.average_chunk_mb * 1024 * 1024
+        manifest, report = snapshot([path for path in args.paths if os.path.exists(path)], store, args.workers, average_size, average_size // 4, average_size * 8)
+        print_report(f"snapshot {manifest['name']} ---> {args.store}", report)
+
+    if args.command in ["push", "sync"]:
+        if args.target is None:
+            parser.error("push / sync need --target")
+
+        print_report(f"push ---> {args.target}", push(store, chunk_store(args.target), args.manifest if args.command == "push" else None, args.workers))
+
+    if args.command == "restore":
+        source = chunk_store(args.target) if args.target is not None else store
+        print_report(f"restore ---> {args.out}", restore(source, args.out, args.manifest))
+
+    if args.command == "prune":
+        for root in [args.store] + ([args.target] if args.target is not None else []):
+            print_report(f"prune {root}", prune(chunk_store(root), args.keep))
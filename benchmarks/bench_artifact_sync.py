@@ -0,0 +1,93 @@
+import os
+import time
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+import synthetic                  # also puts the repo root on sys.path
+import artifact_sync
+
+def directory_mb(path: str) -> float:
+    return sum(os.path.getsize(os.path.join(directory, name)) for directory, _, names in os.walk(path) for name in names) / 1024 ** 2
+
+def git(*args, cwd):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+def training_round(project_dir: str, round_idx: int, args, rng):
+    # what happens between two syncs of a training box: a new checkpoint (old ones beyond keep_last deleted), the dataset grows a bit
+    weights_dir = os.path.join(project_dir, "runs", "run", "weights")
+
+    with open(os.path.join(weights_dir, f"checkpoint_{round_idx}.pth"), "wb") as file:
+        file.write(rng.integers(0, 256, args.checkpoint_mb * 1024 ** 2, dtype=np.uint8).tobytes())
+
+    for old_idx in range(round_idx - args.keep_last + 1):
+        old_path = os.path.join(weights_dir, f"checkpoint_{old_idx}.pth")
+
+        if os.path.exists(old_path):
+            os.remove(old_path)
+
+    with open(os.path.join(project_dir, "datasets", "train.txt"), "ab") as file:
+        file.write(rng.integers(97, 123, int(args.dataset_mb * args.dataset_growth * 1024 ** 2), dtype=np.uint8).tobytes())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="syncing a training box's artifacts N times: git add + commit of the whole tree (project_checkpoint.sh) vs artifact_sync.py")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--checkpoint-mb", type=int, default=64)
+    parser.add_argument("--dataset-mb", type=int, default=256)
+    parser.add_argument("--model-mb", type=int, default=64)
+    parser.add_argument("--dataset-growth", type=float, default=0.01, help="fraction appended to the dataset every round")
+    parser.add_argument("--keep-last", type=int, default=3, help="checkpoints kept, like checkpoint_manager")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # the same artifacts twice: one tree for git, one for artifact_sync
+        projects = {name: os.path.join(tmp_dir, name) for name in ["git", "sync"]}
+        remote_git = os.path.join(tmp_dir, "remote.git")
+        remote_store = artifact_sync.chunk_store(os.path.join(tmp_dir, "remote_store"))
+
+        git("init", "-q", "--bare", remote_git, cwd=tmp_dir)
+
+        for name, project_dir in projects.items():
+            rng = np.random.default_rng(0)
+
+            for directory in ["runs/run/weights", "datasets", "embedding_models"]:
+                os.makedirs(os.path.join(project_dir, directory))
+
+            with open(os.path.join(project_dir, "datasets", "train.txt"), "wb") as file:
+                file.write(rng.integers(97, 123, args.dataset_mb * 1024 ** 2, dtype=np.uint8).tobytes())
+
+            with open(os.path.join(project_dir, "embedding_models", "model.model"), "wb") as file:
+                file.write(rng.integers(0, 256, args.model_mb * 1024 ** 2, dtype=np.uint8).tobytes())
+
+        git("init", "-q", cwd=projects["git"])
+        git("remote", "add", "origin", remote_git, cwd=projects["git"])
+
+        store = artifact_sync.chunk_store(os.path.join(projects["sync"], ".artifact_store"))
+        paths = [os.path.join(projects["sync"], directory) for directory in ["runs", "embedding_models", "datasets"]]
+
+        print(f"checkpoint: {args.checkpoint_mb}MB (keep {args.keep_last})   dataset: {args.dataset_mb}MB (+{args.dataset_growth:.0%} per round)   model: {args.model_mb}MB\n")
+        print(f"{'round':>5} {'git add+commit+push s':>22} {'remote .git MB':>15} {'sync s':>8} {'pushed MB':>10} {'deduplicated MB':>16} {'remote store MB':>16}")
+
+        rngs = {name: np.random.default_rng(1) for name in projects}
+
+        for round_idx in range(args.rounds):
+            for name, project_dir in projects.items():
+                training_round(project_dir, round_idx, args, rngs[name])
+
+            start = time.perf_counter()
+            git("add", ".", cwd=projects["git"])
+            git("-c", "user.name=bench", "-c", "user.email=bench@localhost", "commit", "-q", "-m", f"round {round_idx}", cwd=projects["git"])
+            git("push", "-q", "origin", "HEAD:main", cwd=projects["git"])
+            git_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            _, snapshot_report = artifact_sync.snapshot(paths, store)
+            push_report = artifact_sync.push(store, remote_store)
+            sync_s = time.perf_counter() - start
+
+            print(f"{round_idx:5} {git_s:22.2f} {directory_mb(remote_git):15.0f} {sync_s:8.2f} {push_report['copied_bytes'] / 1024 ** 2:10.1f} "
+                  f"{snapshot_report['deduplicated_bytes'] / 1024 ** 2:16.1f} {directory_mb(remote_store.root):16.0f}")
+
+        prune_report = artifact_sync.prune(remote_store, keep_manifests=1)
+        print(f"\nremote store after prune (newest manifest only): {directory_mb(remote_store.root):.0f}MB ({prune_report['deleted_bytes'] / 1024 ** 2:.0f}MB of deleted checkpoints freed), git history keeps every checkpoint ever committed")
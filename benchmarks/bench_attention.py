@@ -0,0 +1,60 @@
+import time
+import argparse
+import torch
+
+import synthetic                  # also puts the repo root on sys.path
+import rean_model
+
+def time_step(net, segment, repeats, backward=True):
+    # one warmup step, then the average over repeats
+    for current_repeat in range(repeats + 1):
+        if current_repeat == 1:
+            if segment.is_cuda:
+                torch.cuda.synchronize()
+            start = time.perf_counter()
+
+        outputs = net(segment)
+
+        if backward:
+            outputs.square().mean().backward()
+            net.zero_grad(set_to_none=True)
+
+    if segment.is_cuda:
+        torch.cuda.synchronize()
+
+    return (time.perf_counter() - start) / repeats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="REAN forward / backward: fused scaled_dot_product_attention path vs nn.MultiheadAttention path")
+    parser.add_argument("--context-length", type=int, default=128)
+    parser.add_argument("--attn-heads", type=int, default=8)
+    parser.add_argument("--vector-size", type=int, default=784)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+
+    net = rean_model.REAN(args.vector_size, args.attn_heads, max_context_length=args.context_length).to(args.device)
+    segment = torch.randn(args.batch_size, args.context_length, args.vector_size, device=args.device)
+
+    # both paths share the weights, so they have to agree
+    with torch.no_grad():
+        net.set_fused_attention(True)
+        fused_outputs = net(segment)
+        net.set_fused_attention(False)
+        max_diff = (fused_outputs - net(segment)).abs().max().item()
+
+    print(f"device: {args.device}   shape: ({args.batch_size}, {args.context_length}, {args.vector_size})   heads: {args.attn_heads}   max |fused - multihead|: {max_diff:.2e}")
+
+    for name, backward in (("forward", False), ("forward + backward", True)):
+        times = {}
+
+        for fused in (False, True):
+            net.set_fused_attention(fused)
+
+            with torch.set_grad_enabled(backward):
+                times[fused] = time_step(net, segment, args.repeats, backward)
+
+        print(f"{name:20} multihead {times[False] * 1000:9.2f}ms   fused {times[True] * 1000:9.2f}ms   ({times[False] / times[True]:.2f}x)")
@@ -0,0 +1,105 @@
+import os
+import time
+import random
+import argparse
+import tempfile
+import itertools
+
+import synthetic                  # also puts the repo root on sys.path
+import tokenizer
+import embedding_table
+import block_shuffle
+
+def drop_page_cache(path: str):
+    # evicts the file from the os page cache (no root needed), so the reads below actually hit the disk
+    with open(path, "rb") as file:
+        os.fsync(file.fileno())
+        os.posix_fadvise(file.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+def sequential_read(path: str, chunk_size: int=1024 * 1024 * 16) -> float:
+    # MB/s of plain front to back reading, the ceiling for everything else
+    start = time.perf_counter()
+    total = 0
+
+    with open(path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            total += len(chunk)
+
+    return total / 1024 ** 2 / (time.perf_counter() - start)
+
+def random_window_reads(path: str, indices: list, context_length: int) -> float:
+    # MB/s of the DataLoader(shuffle=True) pattern: one seek + small read per example, like REAN_dataset.pull_tokens
+    window_bytes = (context_length + 1) * tokenizer.average_token_length
+    start = time.perf_counter()
+
+    with open(path, "rb") as file:
+        for index in indices:
+            file.seek(index * tokenizer.average_token_length)
+            file.read(window_bytes)
+
+    return len(indices) * window_bytes / 1024 ** 2 / (time.perf_counter() - start)
+
+def block_reads(dataset, blocks: list) -> float:
+    # MB/s of block_shuffle's reads: whole blocks, in shuffled block order
+    start = time.perf_counter()
+    total = sum(len(block_shuffle.read_block(dataset, first_index, last_index).data) for first_index, last_index in blocks)
+
+    return total / 1024 ** 2 / (time.perf_counter() - start)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="raw .txt reading: random access per example vs block_shuffle's sequential blocks (page cache dropped before every run)")
+    parser.add_argument("--megabytes", type=int, default=256, help="size of the synthetic .txt")
+    parser.add_argument("--context-length", type=int, default=128)
+    parser.add_argument("--examples", type=int, default=20000, help="examples read by the random access and end to end runs")
+    parser.add_argument("--block-examples", type=int, default=65536)
+    parser.add_argument("--shuffle-buffer", type=int, default=65536)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--warm", action="store_true", help="keep the page cache (measures the cpu side only)")
+    args = parser.parse_args()
+
+    import normal_train_2_pyver as train_script
+
+    text = synthetic.synthetic_text()
+    model = synthetic.synthetic_model(text, vector_size=32)
+    train_script.embeddings_table = embedding_table.embedding_table.from_model(model)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "corpus.txt")
+
+        with open(path, "w", encoding="utf-8") as file:
+            for _ in range(args.megabytes * 1024 ** 2 // len(text.encode()) + 1):
+                file.write(text)
+
+        num_examples = os.path.getsize(path) // tokenizer.average_token_length - args.context_length * 2
+        dataset = train_script.REAN_dataset(path, num_examples, args.context_length, verify_dataset_size=False, token_ids=True)
+
+        cold = (lambda: None) if args.warm else (lambda: drop_page_cache(path))
+        rnd = random.Random(0)
+        indices = [rnd.randrange(num_examples) for _ in range(args.examples)]
+
+        stream = block_shuffle.block_shuffled_dataset(dataset, args.batch_size, args.block_examples, args.shuffle_buffer)
+
+        print(f"file: {os.path.getsize(path) / 1024 ** 2:.0f}MB   examples: {num_examples}   blocks: {len(stream.epoch_blocks())} x {args.block_examples} examples   page cache: {'warm' if args.warm else 'dropped'}\n")
+
+        print("I/O only")
+        cold()
+        print(f"  sequential read                {sequential_read(path):10.1f} MB/s")
+        cold()
+        print(f"  random window reads            {random_window_reads(path, indices, args.context_length):10.1f} MB/s")
+        cold()
+        print(f"  block_shuffle block reads      {block_reads(dataset, stream.epoch_blocks()):10.1f} MB/s")
+
+        print("\nend to end (reading + tokenizing + ids)")
+        cold()
+        start = time.perf_counter()
+
+        for index in indices:
+            dataset.construct_ids(index)
+
+        print(f"  random access REAN_dataset     {len(indices) / (time.perf_counter() - start):10.0f} examples/s")
+
+        cold()
+        start = time.perf_counter()
+        batches = list(itertools.islice(iter(stream), args.examples // args.batch_size))
+
+        print(f"  block_shuffled_dataset         {len(batches) * args.batch_size / (time.perf_counter() - start):10.0f} examples/s")
@@ -0,0 +1,136 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+# name: what the child process loads before its first token
+paths = {"script + word2vec": "pickled net via torch.load, the training script's stream_sequence, embeddings from the word2vec model",
+         "store + load_net": "inference_server.load_net checkpoint, memory mapped embedding store, generation_session",
+         "artifact": "rean_runtime.py on an export_artifact.py torchscript graph"}
+
+def child(path: str, work_dir: str, prompt: str, num_tokens: int):
+    # runs in a fresh interpreter: nothing is imported before this, so the import + load time counts like it would for a prediction job
+    first_token_time = None
+    token_times = []
+
+    def tokens():
+        if path == "script + word2vec":
+            import torch
+            import embedding_table
+            import tokenizer
+            from gensim.models import Word2Vec
+            import normal_train_2_pyver as script
+
+            script.embeddings_table = embedding_table.embedding_table.from_model(Word2Vec.load(os.path.join(work_dir, "w2v.model")))
+            net = torch.load(os.path.join(work_dir, "net.pth"), map_location=script.run_device, weights_only=False).eval()
+
+            return script.stream_sequence(tokenizer.tokenize_segment(prompt), num_tokens, net)
+
+        if path == "store + load_net":
+            import torch
+            import tokenizer
+            import embedding_table
+            import generation
+            import inference_server
+
+            table = embedding_table.mapped_embedding_table(os.path.join(work_dir, "store"))
+            net, context_length = inference_server.load_net(os.path.join(work_dir, "checkpoint.pth"), torch.device("cpu"))
+            decoder = embedding_table.nearest_token_decoder(table, not_in_vocab_token="[NIV]", NIV_threshold=0.01)
+
+            return generation.generation_session(net, table, decoder, tokenizer.tokenize_segment(prompt), context_length).stream(num_tokens)
+
+        import rean_runtime
+
+        return rean_runtime.rean_runtime(os.path.join(work_dir, "artifact")).stream(prompt, num_tokens)
+
+    for _ in tokens():
+        token_times.append(time.time())
+
+        if first_token_time is None:
+            first_token_time = token_times[0]
+
+    steps = [later - earlier for earlier, later in zip(token_times, token_times[1:])]
+
+    print(json.dumps({"first_token_time": first_token_time, "token_ms": statistics.median(steps) * 1000}))
+
+def prepare(work_dir: str, vector_size: int, attn_heads: int, context_length: int):
+    # the same random net + synthetic vocab saved every way the paths load it
+    import torch
+    import embedding_table
+    import checkpointing
+    import export_artifact
+    from rean_model import REAN
+
+    text = synthetic.synthetic_text()
+    model = synthetic.synthetic_model(text, vector_size=vector_size)
+    model.save(os.path.join(work_dir, "w2v.model"))
+
+    table = embedding_table.embedding_table.from_model(model)
+    embedding_table.save_store(table, os.path.join(work_dir, "store"))
+
+    torch.manual_seed(0)
+    net = REAN(vector_size, attn_heads, max_context_length=context_length).eval()
+
+    torch.save(net, os.path.join(work_dir, "net.pth"))
+
+    optimizer = torch.optim.Adam(net.parameters())
+    manager = checkpointing.checkpoint_manager(work_dir, "checkpoint.pth")
+    manager.save(net, optimizer, torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, 10), batch=0, epoch=0, epoch_batch=0, shuffle_seed=0,
+                 config={"vector_size": vector_size, "attn_heads": attn_heads, "context_length": context_length})
+    manager.wait()
+
+    start = time.perf_counter()
+    export_artifact.export(net, table, os.path.join(work_dir, "artifact"), context_length)
+
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="cold start (process spawn ---> first token) and steady state per token latency of the inference paths, each run in a fresh process")
+    parser.add_argument("--paths", default=",".join(paths), help=f"comma separated, from: {', '.join(paths)}")
+    parser.add_argument("--vector-size", type=int, default=784)
+    parser.add_argument("--attn-heads", type=int, default=8)
+    parser.add_argument("--context-length", type=int, default=128)
+    parser.add_argument("--tokens", type=int, default=64)
+    parser.add_argument("--repeats", type=int, default=3, help="fresh processes per path (the files stay in the page cache between them)")
+    parser.add_argument("--prompt", default="[human] kato mira nelu sope [network] ")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--work-dir", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        # the child only needs the repo root on sys.path, importing synthetic would also pull in its imports
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        child(args.child, args.work_dir, args.prompt, args.tokens)
+        sys.exit()
+
+    import synthetic                  # also puts the repo root on sys.path
+
+    selected_paths = [path.strip() for path in args.paths.split(",")]
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        export_s = prepare(work_dir, args.vector_size, args.attn_heads, args.context_length)
+
+        print(f"vector_size: {args.vector_size}   heads: {args.attn_heads}   context: {args.context_length}   tokens: {args.tokens}   export took {export_s:.1f}s")
+        print("cold start: from spawning the process to its first token (interpreter + imports + loading + first step), median of the repeats\n")
+        print(f"{'path':20} {'cold start ms':>14} {'ms/token':>9}")
+
+        for path in selected_paths:
+            cold_ms = []
+            token_ms = []
+
+            for _ in range(args.repeats):
+                start = time.time()
+                output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", path, "--work-dir", work_dir, "--prompt", args.prompt,
+                                         "--tokens", str(args.tokens)], capture_output=True, text=True, check=True).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+
+                cold_ms.append((result["first_token_time"] - start) * 1000)
+                token_ms.append(result["token_ms"])
+
+            print(f"{path:20} {statistics.median(cold_ms):14.0f} {statistics.median(token_ms):9.2f}")
+
+        print("\n" + "\n".join(f"{path}: {description}" for path, description in paths.items() if path in selected_paths))
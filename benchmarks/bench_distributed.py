@@ -0,0 +1,119 @@
+import os
+import time
+import socket
+import argparse
+import tempfile
+import torch
+import torch.multiprocessing as mp
+from torch.utils.data import DataLoader
+from torch.nn.parallel import DistributedDataParallel
+
+import synthetic                  # also puts the repo root on sys.path
+import tokenizer
+import embedding_table
+import runtime
+import samplers
+import distributed
+from rean_model import REAN
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def worker(rank, world_size, port, args, store_dir, ids, results):
+    # the environment torchrun would set up
+    os.environ.update({"RANK": str(rank), "LOCAL_RANK": str(rank), "WORLD_SIZE": str(world_size), "LOCAL_WORLD_SIZE": str(world_size),
+                       "MASTER_ADDR": "127.0.0.1", "MASTER_PORT": str(port)})
+
+    rank, world_size, used_device = distributed.setup(args.device, args.backend)
+    runtime.configure_threads(used_device, processes=world_size)
+
+    torch.manual_seed(0)
+
+    table = embedding_table.mapped_embedding_table(store_dir)
+    net = REAN(vector_size=table.vector_size, attn_heads=args.attn_heads, max_context_length=args.context_length).to(used_device)
+    train_net = DistributedDataParallel(net, device_ids=[used_device] if used_device.type == "cuda" else None) if world_size > 1 else net
+    optimizer = torch.optim.Adam(net.parameters(), lr=0.00003)
+    loss = torch.nn.MSELoss()
+
+    sampler = samplers.sharded_resumable_sampler(len(ids), num_replicas=world_size, rank=rank)
+    loader = iter(DataLoader(ids, batch_size=args.batch_size, sampler=sampler, drop_last=True))
+
+    def step():
+        vectorized_batch = table.vectorize_ids(next(loader).to(used_device), used_device)
+
+        with runtime.autocast(used_device, args.bf16):
+            loss_value = loss(train_net(vectorized_batch[:, :-1]), vectorized_batch[:, 1:])
+
+        loss_value.backward()
+        optimizer.step()
+        optimizer.zero_grad()
+
+        return loss_value
+
+    for _ in range(args.warmup):
+        step()
+
+    distributed.barrier()
+    start = time.perf_counter()
+
+    for _ in range(args.steps):
+        loss_value = step()
+
+    # the same loss on every rank after the reduce, and the slowest rank decides the step time
+    loss_value = distributed.reduce_mean(loss_value.detach())
+    elapsed = distributed.reduce_sum(torch.tensor([time.perf_counter() - start], device=used_device)).item() / world_size
+
+    if rank == 0:
+        results[world_size] = {"seconds": elapsed, "examples": args.steps * args.batch_size * world_size, "loss": loss_value.item()}
+
+    distributed.cleanup()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="data parallel training throughput (examples/sec) vs number of processes, on a synthetic corpus")
+    parser.add_argument("--processes", default="1,2,4", help="comma separated process counts to run")
+    parser.add_argument("--backend", default=None, help="None ---> nccl on gpus, gloo on cpu")
+    parser.add_argument("--device", default=None, help="device when running 1 process, None ---> cuda if there is one")
+    parser.add_argument("--vector-size", type=int, default=784)
+    parser.add_argument("--attn-heads", type=int, default=8)
+    parser.add_argument("--context-length", type=int, default=128)
+    parser.add_argument("--batch-size", type=int, default=16, help="per process (weak scaling: the global batch grows with the processes)")
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--bf16", action="store_true", help="bf16 autocast on cpu")
+    args = parser.parse_args()
+
+    process_counts = [int(count) for count in args.processes.split(",")]
+
+    if torch.cuda.is_available() and max(process_counts) > torch.cuda.device_count():
+        raise ValueError(f"{max(process_counts)} processes but only {torch.cuda.device_count()} gpus (nccl needs one per process)")
+
+    text = synthetic.synthetic_text()
+    table = embedding_table.embedding_table.from_model(synthetic.synthetic_model(text, vector_size=args.vector_size))
+
+    # enough windows for every process to run warmup + steps batches
+    token_ids = table.ids(tokenizer.tokenize_segment(text))
+    num_windows = (args.warmup + args.steps) * args.batch_size * max(process_counts)
+    starts = torch.randint(0, len(token_ids) - args.context_length - 1, (num_windows,), generator=torch.Generator().manual_seed(0))
+    ids = torch.stack([token_ids[start:start + args.context_length + 1] for start in starts.tolist()])
+
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    print(f"cores: {cores}   gpus: {torch.cuda.device_count()}   per process batch: {args.batch_size}   context_length: {args.context_length}   vector_size: {args.vector_size}")
+
+    with tempfile.TemporaryDirectory() as store_dir:
+        embedding_table.save_store(table, store_dir)
+
+        results = mp.Manager().dict()
+
+        for world_size in process_counts:
+            mp.spawn(worker, args=(world_size, free_port(), args, store_dir, ids, results), nprocs=world_size, join=True)
+
+    print(f"\n{'processes':>9} {'examples/s':>11} {'speedup':>8} {'efficiency':>10} {'loss':>8}")
+
+    base = results[process_counts[0]]["examples"] / results[process_counts[0]]["seconds"] / process_counts[0]
+
+    for world_size in process_counts:
+        examples_per_sec = results[world_size]["examples"] / results[world_size]["seconds"]
+
+        print(f"{world_size:9} {examples_per_sec:11.1f} {examples_per_sec / base:7.2f}x {examples_per_sec / base / world_size * 100:9.1f}% {results[world_size]['loss']:8.4f}")
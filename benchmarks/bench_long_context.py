@@ -0,0 +1,118 @@
+import os
+import time
+import resource
+import argparse
+import torch
+import torch.multiprocessing as mp
+
+import synthetic                  # also puts the repo root on sys.path
+import runtime
+from rean_model import REAN
+
+# name: (fused_attention, activation_checkpointing, use micro batches)
+modes = {"multihead": (False, False, False),
+         "fused": (True, False, False),
+         "fused + ckpt": (True, True, False),
+         "fused + ckpt + accum": (True, True, True)}
+
+def peak_rss_mb() -> float:
+    # peak resident memory of this process so far (ru_maxrss is in KB on linux)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def current_rss_mb() -> float:
+    with open("/proc/self/statm") as file:
+        return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+
+def run_config(mode, context_length, args, results):
+    # one training step setup per fresh process, so the cpu peak memory of one config doesnt hide the next one's
+    fused_attention, activation_checkpointing, accumulate = modes[mode]
+    used_device = torch.device(args.device)
+
+    torch.manual_seed(0)
+
+    net = REAN(args.vector_size, args.attn_heads, max_context_length=context_length, fused_attention=fused_attention, activation_checkpointing=activation_checkpointing).to(used_device)
+    optimizer = torch.optim.Adam(net.parameters(), lr=0.00003)
+    loss = torch.nn.MSELoss()
+
+    segment = torch.randn(args.batch_size, context_length + 1, args.vector_size, device=used_device)
+    micro_batches = segment.chunk(args.accumulation if accumulate else 1)
+
+    def step():
+        for micro_batch in micro_batches:
+            with runtime.autocast(used_device, args.bf16):
+                loss_value = loss(net(micro_batch[:, :-1]), micro_batch[:, 1:])
+
+            (loss_value * (len(micro_batch) / len(segment))).backward()
+
+        optimizer.step()
+        optimizer.zero_grad(set_to_none=True)
+
+    def sync():
+        if used_device.type == "cuda":
+            torch.cuda.synchronize(used_device)
+
+    try:
+        # optimizer state gets allocated here, so it counts as setup (the step's activations are freed again after it)
+        step()
+        sync()
+
+        if used_device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats(used_device)
+            setup_mb = torch.cuda.memory_allocated(used_device) / 1024 ** 2
+        else:
+            # the peak rss already includes this warmup step, which is as big as the timed ones
+            setup_mb = current_rss_mb()
+
+        start = time.perf_counter()
+
+        for _ in range(args.repeats):
+            step()
+
+        sync()
+        elapsed = (time.perf_counter() - start) / args.repeats
+
+        peak_mb = torch.cuda.max_memory_allocated(used_device) / 1024 ** 2 if used_device.type == "cuda" else peak_rss_mb()
+
+        results[(mode, context_length)] = {"step_s": elapsed, "tokens_per_s": args.batch_size * context_length / elapsed, "step_peak_mb": peak_mb - setup_mb}
+    except torch.cuda.OutOfMemoryError:
+        results[(mode, context_length)] = None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="peak memory + throughput of a REAN training step vs context length, for the attention / activation checkpointing / gradient accumulation options")
+    parser.add_argument("--context-lengths", default="128,512,1024,2048")
+    parser.add_argument("--modes", default=",".join(modes), help=f"comma separated, from: {', '.join(modes)}")
+    parser.add_argument("--vector-size", type=int, default=784)
+    parser.add_argument("--attn-heads", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=8, help="examples per optimizer step")
+    parser.add_argument("--accumulation", type=int, default=4, help="micro batches per step for the accum mode")
+    parser.add_argument("--repeats", type=int, default=2)
+    parser.add_argument("--bf16", action="store_true", help="bf16 autocast on cpu")
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    context_lengths = [int(length) for length in args.context_lengths.split(",")]
+    selected_modes = [mode.strip() for mode in args.modes.split(",")]
+
+    # glibc hands big freed blocks back to the os right away with this, so the cpu rss follows the live tensors (read by the child at startup)
+    os.environ.setdefault("MALLOC_MMAP_THRESHOLD_", "65536")
+
+    context = mp.get_context("spawn")
+    results = context.Manager().dict()
+
+    print(f"device: {args.device}   batch: {args.batch_size}   vector_size: {args.vector_size}   heads: {args.attn_heads}   accumulation: {args.accumulation}")
+    print("step peak MB: memory on top of the weights + optimizer state during a step (cuda: allocated, cpu: process rss)\n")
+    print(f"{'mode':22} {'context':>8} {'step peak MB':>13} {'tokens/s':>10} {'step s':>8}")
+
+    for context_length in context_lengths:
+        for mode in selected_modes:
+            process = context.Process(target=run_config, args=(mode, context_length, args, results))
+            process.start()
+            process.join()
+
+            result = results.get((mode, context_length))
+
+            if result is None:
+                print(f"{mode:22} {context_length:8} {'OOM' if process.exitcode == 0 else f'died ({process.exitcode})':>13}")
+                continue
+
+            print(f"{mode:22} {context_length:8} {result['step_peak_mb']:13.1f} {result['tokens_per_s']:10.0f} {result['step_s']:8.3f}")
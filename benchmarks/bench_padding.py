@@ -0,0 +1,67 @@
+import time
+import random
+import argparse
+import torch
+
+import synthetic                  # also puts the repo root on sys.path
+import tokenizer
+import embedding_table
+import runtime
+import generation
+from rean_model import REAN
+
+def padded_sequences(prompts, num_tokens, net, table, decoder, context_length):
+    # the previous predict_sequences: every window left padded to context_length and attended over as if the padding were tokens
+    used_device = next(net.parameters()).device
+    window = table.batch_ids(prompts, context_length).to(used_device)
+
+    with torch.no_grad():
+        for _ in range(num_tokens):
+            ids = decoder.decode_ids(net.predict(table.vectorize_ids(window))).to(used_device)
+            window = torch.cat((window[:, 1:], ids.unsqueeze(1)), dim=1)
+
+def timed(func, repeats: int) -> float:
+    func()
+    start = time.perf_counter()
+
+    for _ in range(repeats):
+        func()
+
+    return (time.perf_counter() - start) / repeats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="batched generation from short prompts: padding every window to context_length vs length buckets with masked padding")
+    parser.add_argument("--prompt-lengths", default="4,16,32,64,128,mixed", help="comma separated, mixed ---> random lengths up to the context length")
+    parser.add_argument("--prompts", type=int, default=16)
+    parser.add_argument("--tokens", type=int, default=16)
+    parser.add_argument("--vector-size", type=int, default=784)
+    parser.add_argument("--attn-heads", type=int, default=8)
+    parser.add_argument("--context-length", type=int, default=128)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--device", default=None)
+    args = parser.parse_args()
+
+    used_device = runtime.pick_device(args.device)
+
+    text = synthetic.synthetic_text()
+    table = embedding_table.embedding_table.from_model(synthetic.synthetic_model(text, vector_size=args.vector_size))
+    decoder = embedding_table.nearest_token_decoder(table, device=used_device, not_in_vocab_token="[NIV]")
+    tokens = tokenizer.tokenize_segment(text)
+
+    torch.manual_seed(0)
+    net = REAN(args.vector_size, args.attn_heads, args.context_length).to(used_device).eval()
+
+    rnd = random.Random(0)
+
+    print(f"device: {used_device}   prompts: {args.prompts}   tokens: {args.tokens}   context: {args.context_length}\n")
+    print(f"{'prompt length':>14} {'padded ms/token':>16} {'bucketed ms/token':>18} {'speedup':>8}")
+
+    for prompt_length in args.prompt_lengths.split(","):
+        lengths = [rnd.randint(0, args.context_length) if prompt_length == "mixed" else int(prompt_length) for _ in range(args.prompts)]
+        starts = [rnd.randrange(len(tokens) - length) for length in lengths]
+        prompts = [tokens[start:start + length] for start, length in zip(starts, lengths)]
+
+        padded = timed(lambda: padded_sequences(prompts, args.tokens, net, table, decoder, args.context_length), args.repeats) / args.tokens
+        bucketed = timed(lambda: generation.predict_sequences(prompts, args.tokens, net, table, decoder, args.context_length), args.repeats) / args.tokens
+
+        print(f"{prompt_length:>14} {padded * 1000:16.2f} {bucketed * 1000:18.2f} {padded / bucketed:7.2f}x")
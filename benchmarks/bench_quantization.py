@@ -0,0 +1,101 @@
+import io
+import time
+import argparse
+import torch
+
+import synthetic                  # also puts the repo root on sys.path
+import tokenizer
+import embedding_table
+import generation
+import quantization
+from rean_model import REAN
+
+def state_bytes(net) -> int:
+    # serialized size of the state_dict (quantized weights are packed params, not plain tensors)
+    buffer = io.BytesIO()
+    torch.save(net.state_dict(), buffer)
+    return buffer.tell()
+
+def timeit(func, repeats):
+    func()
+    start = time.perf_counter()
+
+    for _ in range(repeats):
+        func()
+
+    return (time.perf_counter() - start) / repeats
+
+def next_token_ids(net, table, decoder, windows, batch_size):
+    # top-1 decoded next token for every (context_length,) id window
+    with torch.no_grad():
+        return torch.cat([decoder.decode_ids(net.predict(table.vectorize_ids(windows[idx:idx + batch_size]))) for idx in range(0, len(windows), batch_size)])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="accuracy / memory / latency of the int8 and fp16 inference modes vs float32 (on cpu)")
+    parser.add_argument("--checkpoint", default=None, help="trained checkpoint (checkpoint_manager format), default: a random REAN on a synthetic word2vec model")
+    parser.add_argument("--embeddings-model", default=None, help="word2vec model that goes with --checkpoint")
+    parser.add_argument("--text", default=None, help="text file to take the eval windows from, default: synthetic text")
+    parser.add_argument("--windows", type=int, default=512, help="number of next token predictions compared")
+    parser.add_argument("--context-length", type=int, default=128)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--generate-tokens", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+
+    if args.checkpoint is not None:
+        from gensim.models import Word2Vec
+        import inference_server
+
+        model = Word2Vec.load(args.embeddings_model)
+        net, context_length = inference_server.load_net(args.checkpoint, torch.device("cpu"), args.context_length)
+    else:
+        model = synthetic.synthetic_model(synthetic.synthetic_text())
+        context_length = args.context_length
+        net = REAN(model.vector_size, 8, max_context_length=context_length).eval()
+
+    text = open(args.text, encoding="utf-8").read(args.windows * context_length * 16) if args.text is not None else synthetic.synthetic_text(seed=1)
+    tokens = tokenizer.tokenize_segment(text)
+
+    table = embedding_table.embedding_table.from_model(model)
+    decoder = embedding_table.nearest_token_decoder(table)
+
+    ids = table.ids(tokens)
+    stride = max((len(ids) - context_length) // args.windows, 1)
+    windows = torch.stack([ids[start:start + context_length] for start in range(0, stride * args.windows, stride)])
+
+    reference = next_token_ids(net, table, decoder, windows, args.batch_size)
+    reference_vectors = table.vectorize_ids(windows[:args.batch_size])
+    prompts = [tokens[start:start + context_length // 2] for start in range(0, stride * 8, stride)]
+
+    float_table_bytes = table.vectors.numel() * 4 + decoder.normed_vectors.numel() * 4
+
+    print(f"vocab: {table.vocab_size}   vector_size: {table.vector_size}   windows: {len(windows)}   context_length: {context_length}")
+    print(f"{'mode':12} {'net file MB':>11} {'table MB':>9} {'top-1 agree':>12} {'decode agree':>13} {'predict ms':>11} {'generate ms':>12}")
+
+    for mode in ("fp32", "fp16", "int8"):
+        if mode == "fp32":
+            current_net, current_table, current_decoder = net, table, decoder
+            table_bytes = float_table_bytes
+        else:
+            current_net, current_table, current_decoder = quantization.quantize_for_inference(net, table, mode)
+            table_bytes = current_table.memory_bytes() + current_decoder.inverse_norms.numel() * 4
+
+        # whole path: quantized net + quantized lookup + quantized decoding
+        agreement = (next_token_ids(current_net, current_table, current_decoder, windows, args.batch_size) == reference).float().mean().item()
+
+        # decoding only: the same float32 prediction vectors thru the quantized decoder
+        with torch.no_grad():
+            vectors = torch.cat([net.predict(table.vectorize_ids(windows[idx:idx + args.batch_size])) for idx in range(0, len(windows), args.batch_size)])
+        decode_agreement = (current_decoder.decode_ids(vectors) == decoder.decode_ids(vectors)).float().mean().item()
+
+        with torch.no_grad():
+            predict_time = timeit(lambda: current_net.predict(reference_vectors), args.repeats)
+
+        generate_time = timeit(lambda: generation.predict_sequences(prompts, args.generate_tokens, current_net, current_table, current_decoder, context_length=context_length), 1)
+
+        print(f"{mode:12} {state_bytes(current_net) / 1024 ** 2:11.1f} {table_bytes / 1024 ** 2:9.1f} {agreement * 100:11.1f}% {decode_agreement * 100:12.1f}% {predict_time * 1000:11.1f} {generate_time * 1000:12.1f}")
+
+    print(f"\nnet file MB: saved state_dict size (fp16 dynamic linears serialize their weights as float32, so only int8 shrinks it)")
+    print(f"predict ms: one net.predict on ({args.batch_size}, {context_length}, {table.vector_size})   generate ms: predict_sequences for {len(prompts)} prompts x {args.generate_tokens} tokens")
@@ -0,0 +1,61 @@
+import os
+import re
+import time
+import argparse
+import tempfile
+
+import synthetic
+import tokenizer
+
+def legacy_tokenize_segment(text, con_chars=tokenizer.default_con_chars):
+    # the old tokenize_segment (pattern rebuilt on every call), kept here to compare against
+    pattern = fr"""
+        [{re.escape(con_chars)}]+        # Match one or more constant characters (words)
+        (?:[\s]+)?                       # Optionally include following whitespace
+      | [^\s{re.escape(con_chars)}]      # Match any single character not in constant characters or whitespace (punctuation)
+        (?:[\s]+)?                       # Optionally include following whitespace
+    """
+
+    return re.findall(pattern, text, re.VERBOSE)
+
+def tokens_per_sec(func, num_tokens):
+    start = time.perf_counter()
+    func()
+    return num_tokens / (time.perf_counter() - start)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="tokenizer throughput in tokens/sec")
+    parser.add_argument("--words", type=int, default=1000000, help="size of the synthetic corpus")
+    parser.add_argument("--segment-chars", type=int, default=1100, help="chars per short segment (about a 128 token window)")
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    text = synthetic.synthetic_text(args.words)
+    current_tokenizer = tokenizer.get_tokenizer()
+
+    tokens = legacy_tokenize_segment(text)
+    num_tokens = len(tokens)
+
+    segments = [text[idx:idx + args.segment_chars] for idx in range(0, len(text), args.segment_chars)]
+    segment_tokens = sum(len(legacy_tokenize_segment(segment)) for segment in segments)
+
+    token_ids = {token: idx for idx, token in enumerate(sorted(set(tokens)))}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "corpus.txt")
+
+        with open(path, "w") as file:
+            file.write(text)
+
+        results = {"legacy tokenize_segment (short segments)": tokens_per_sec(lambda: [legacy_tokenize_segment(segment) for segment in segments], segment_tokens),
+                   "tokenize_segment (short segments)": tokens_per_sec(lambda: [tokenizer.tokenize_segment(segment) for segment in segments], segment_tokens),
+                   "tokenize_batch (short segments)": tokens_per_sec(lambda: current_tokenizer.tokenize_batch(segments), segment_tokens),
+                   "legacy tokenize_segment (whole text)": tokens_per_sec(lambda: legacy_tokenize_segment(text), num_tokens),
+                   "tokenize (whole text)": tokens_per_sec(lambda: current_tokenizer.tokenize(text), num_tokens),
+                   "tokenize_ids (whole text)": tokens_per_sec(lambda: current_tokenizer.tokenize_ids(text, token_ids), num_tokens),
+                   "tokenize_file": tokens_per_sec(lambda: list(current_tokenizer.tokenize_file(path, read_size=1024 * 1024)), num_tokens),
+                   f"tokenize_file ({args.processes} processes)": tokens_per_sec(lambda: list(current_tokenizer.tokenize_file(path, read_size=1024 * 1024, processes=args.processes)), num_tokens)}
+
+    print(f"corpus: {len(text)} chars, {num_tokens} tokens, {len(segments)} segments")
+    for name, result in results.items():
+        print(f"{name:45} {result / 1e6:8.2f}M tokens/s")
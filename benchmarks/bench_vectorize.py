@@ -0,0 +1,57 @@
+import time
+import argparse
+import numpy as np
+import torch
+
+import synthetic
+import tokenizer
+import embedding_table
+
+def legacy_vectorize_segment(segment, model, default=0, used_device=torch.device("cpu")):
+    # the old per token vectorize_segment from normal_train_2_pyver.py, kept here to compare against
+    vectorized = np.ones((len(segment), model.vector_size)) * default
+
+    for current_word, current_word_idx in zip(segment, range(len(segment))):
+        if current_word in model.wv:
+            try:
+                vectorized[current_word_idx] = model.wv.get_vector(current_word, norm=False)
+            except:
+                pass
+
+    return torch.tensor(vectorized, dtype=torch.float32, device=used_device)
+
+def timeit(func, repeats):
+    start = time.perf_counter()
+
+    for _ in range(repeats):
+        func()
+
+    return (time.perf_counter() - start) / repeats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="vectorize_segment: per token loop vs embedding_table gather")
+    parser.add_argument("--context-length", type=int, default=129)
+    parser.add_argument("--batch-size", type=int, default=768)
+    parser.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+
+    text = synthetic.synthetic_text()
+    model = synthetic.synthetic_model(text)
+    table = embedding_table.embedding_table.from_model(model)
+
+    tokens = tokenizer.tokenize_segment(text)
+    segments = [tokens[idx * args.context_length:(idx + 1) * args.context_length] for idx in range(args.batch_size)]
+
+    # both have to give the same vectors
+    for segment in segments[:32]:
+        assert torch.equal(legacy_vectorize_segment(segment, model), table.vectorize(segment))
+
+    legacy_time = timeit(lambda: legacy_vectorize_segment(segments[0], model), args.repeats)
+    table_time = timeit(lambda: table.vectorize(segments[0]), args.repeats)
+
+    legacy_batch_time = timeit(lambda: torch.stack([legacy_vectorize_segment(segment, model) for segment in segments]), max(args.repeats // 10, 1))
+    table_batch_time = timeit(lambda: table.vectorize_batch(segments, args.context_length), max(args.repeats // 10, 1))
+
+    print(f"vocab: {table.vocab_size} ids   vector_size: {table.vector_size}")
+    print(f"segment ({args.context_length} tokens):    legacy {legacy_time * 1000:8.3f}ms   table {table_time * 1000:8.3f}ms   ({legacy_time / table_time:.1f}x)")
+    print(f"batch ({args.batch_size} x {args.context_length}):   legacy {legacy_batch_time * 1000:8.3f}ms   table {table_batch_time * 1000:8.3f}ms   ({legacy_batch_time / table_batch_time:.1f}x)")
@@ -0,0 +1,116 @@
+import json
+import time
+import random
+import asyncio
+import argparse
+
+default_prompts = ["human: how do i cook poratoes and garlic? network: ",
+                   "human: what are some good circuit training excercises? network: ",
+                   "human: tell me about graphics cards and ",
+                   "network: as an ai language ",
+                   "human: what are some good training exercises for fitness? network: "]
+
+async def complete(host: str, port: int, prompt: str, max_tokens: int) -> tuple[float, float, int]:
+    """
+    sends one streaming completion request to inference_server.py
+
+    Returns:
+        float: seconds to the first token
+        float: seconds to the whole completion
+        int: tokens received
+    """
+
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection(host, port)
+
+    body = json.dumps({"prompt": prompt, "max_tokens": max_tokens, "stream": True}).encode()
+    writer.write(f"POST /complete HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+
+    status = await reader.readline()
+    if b" 200 " not in status:
+        raise RuntimeError(f"server answered {status.decode().strip()}")
+
+    # skip the headers
+    while (await reader.readline()).strip():
+        pass
+
+    first_token = None
+    tokens = 0
+
+    # chunked ndjson, one line per chunk
+    while True:
+        size = int((await reader.readline()).strip(), 16)
+
+        if size == 0:
+            break
+
+        message = json.loads(await reader.readexactly(size))
+        await reader.readline()
+
+        if "token" in message:
+            tokens += 1
+
+            if first_token is None:
+                first_token = time.perf_counter() - start
+
+    writer.close()
+
+    return first_token if first_token is not None else time.perf_counter() - start, time.perf_counter() - start, tokens
+
+def percentiles(values: list[float]) -> str:
+    values = sorted(values)
+
+    return "   ".join(f"p{percentile} {values[min(int(len(values) * percentile / 100), len(values) - 1)] * 1000:8.1f}ms" for percentile in (50, 90, 99)) + f"   max {values[-1] * 1000:8.1f}ms"
+
+async def run_load(args):
+    rnd = random.Random(args.seed)
+    jobs = asyncio.Queue()
+
+    for _ in range(args.requests):
+        jobs.put_nowait((rnd.choice(default_prompts), rnd.randint(args.min_tokens, args.max_tokens)))
+
+    first_tokens, latencies = [], []
+    total_tokens = 0
+    errors = 0
+
+    async def client():
+        nonlocal total_tokens, errors
+
+        while not jobs.empty():
+            prompt, max_tokens = jobs.get_nowait()
+
+            try:
+                first_token, latency, tokens = await complete(args.host, args.port, prompt, max_tokens)
+            except (OSError, RuntimeError, ValueError) as error:
+                errors += 1
+                print(f"request failed: {error}")
+                continue
+
+            first_tokens.append(first_token)
+            latencies.append(latency)
+            total_tokens += tokens
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(args.concurrency)))
+    seconds = time.perf_counter() - start
+
+    print(f"{len(latencies)} requests ({errors} failed), concurrency {args.concurrency}, {seconds:.1f}s")
+    print(f"throughput:          {len(latencies) / seconds:8.2f} requests/s   {total_tokens / seconds:8.1f} tokens/s")
+
+    if latencies:
+        print(f"time to first token: {percentiles(first_tokens)}")
+        print(f"total latency:       {percentiles(latencies)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="concurrent streaming load against inference_server.py, reports latency percentiles and throughput")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--concurrency", type=int, default=16, help="clients sending requests at the same time")
+    parser.add_argument("--requests", type=int, default=128, help="total requests")
+    parser.add_argument("--min-tokens", type=int, default=16)
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    asyncio.run(run_load(args))
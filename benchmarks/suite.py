@@ -0,0 +1,258 @@
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import statistics
+import tempfile
+import numpy as np
+import torch
+
+import synthetic                  # also puts the repo root on sys.path
+import tokenizer
+import token_shards
+import embedding_table
+from rean_model import REAN
+
+# baselines are per machine and not committed: record one before a change with --save-baseline NAME,
+# then compare against it on the same machine with --baseline benchmarks/baselines/NAME.json
+baselines_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+def cpu_name() -> str:
+    """
+    the cpu model, platform.processor() is empty on most linux boxes so it falls back to /proc/cpuinfo\n
+
+    Returns:
+        str: the model name ("" if it cant be found)
+    """
+
+    if platform.processor():
+        return platform.processor()
+
+    try:
+        with open("/proc/cpuinfo") as file:
+            for line in file:
+                if line.startswith("model name"):
+                    return line.partition(":")[2].strip()
+    except OSError:
+        pass
+
+    return ""
+
+def training_script(table, decoder, net):
+    """
+    imports normal_train_2_pyver.py (no side effects) with the synthetic table / decoder / net standing in for the lazily loaded real ones.\n
+    gives the exact vectorize_segment / pad_or_truncate / predict_sequence / REAN_dataset the training run uses
+
+    Returns:
+        module: the training script
+    """
+
+    import normal_train_2_pyver as script
+
+    script.embeddings_table = table
+    script.embeddings_decoder = decoder
+    script.net = net
+
+    return script
+
+def measure(func, repeats: int, used_device: torch.device, warmup: int=1) -> dict:
+    """
+    times func: warmup calls, then repeats timed calls (the device is synced around each one)
+
+    Returns:
+        dict: median / min / max seconds per call and the number of repeats
+    """
+
+    def sync():
+        if used_device.type == "cuda":
+            torch.cuda.synchronize(used_device)
+
+    for _ in range(warmup):
+        func()
+
+    times = []
+
+    for _ in range(repeats):
+        sync()
+        start = time.perf_counter()
+        func()
+        sync()
+        times.append(time.perf_counter() - start)
+
+    return {"median_s": statistics.median(times), "min_s": min(times), "max_s": max(times), "repeats": repeats}
+
+def run_suite(args) -> dict:
+    """
+    builds the synthetic corpus, word2vec model, token shards and net (all seeded), then times every hot path
+
+    Returns:
+        dict: {"meta": machine + settings, "results": {benchmark: timings + throughput}}
+    """
+
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    torch.manual_seed(args.seed)
+
+    used_device = torch.device(args.device)
+
+    text = synthetic.synthetic_text(args.words, seed=args.seed)
+    model = synthetic.synthetic_model(text, vector_size=args.vector_size, seed=args.seed)
+
+    table = embedding_table.embedding_table.from_model(model)
+    decoder = embedding_table.nearest_token_decoder(table, device=used_device)
+    net = REAN(vector_size=args.vector_size, attn_heads=args.attn_heads, max_context_length=args.context_length).to(used_device)
+
+    script = training_script(table, decoder, net)
+
+    tokens = tokenizer.tokenize_segment(text)
+    window_text = "".join(tokens[1000:1000 + args.context_length])
+    window_tokens = tokens[1000:1000 + args.context_length]
+    window_vectors = script.vectorize_segment(window_tokens)
+    short_vectors = window_vectors[:args.context_length // 2]
+
+    prompt = tokens[2000:2000 + args.context_length // 4]
+
+    results = {}
+
+    def add(name, func, repeats, items=None, unit=None):
+        results[name] = measure(func, repeats, used_device)
+
+        if items is not None:
+            results[name][f"{unit}_per_s"] = items / results[name]["median_s"]
+
+        print(f"{name:40} {results[name]['median_s'] * 1000:10.3f}ms" + (f"   {results[name][f'{unit}_per_s']:12.0f} {unit}/s" if items is not None else ""))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        text_path = os.path.join(tmp_dir, "corpus.txt")
+        shards_path = os.path.join(tmp_dir, "shards")
+
+        with open(text_path, "w", encoding="utf-8") as file:
+            file.write(text)
+
+        token_shards.build_token_shards(text_path, shards_path, table.token_ids)
+
+        text_dataset = script.REAN_dataset(text_path, 1000, args.context_length, verify_dataset_size=False)
+        shards_dataset = script.REAN_dataset(text_path, 1000, args.context_length, verify_dataset_size=False, shards_path=shards_path)
+
+        rnd = random.Random(args.seed)
+        indices = [rnd.randrange(len(tokens) // 2) for _ in range(args.repeats)]
+        next_index = iter(indices * 1000).__next__
+
+        add("tokenize_segment", lambda: tokenizer.tokenize_segment(window_text), args.repeats * 10, len(window_tokens), "tokens")
+        add("pull_tokens (text)", lambda: text_dataset.pull_tokens(next_index(), args.context_length + 1), args.repeats * 10, args.context_length + 1, "tokens")
+        add("pull_tokens (shards)", lambda: shards_dataset.pull_tokens(next_index(), args.context_length + 1), args.repeats * 10, args.context_length + 1, "tokens")
+        add("construct_example (text)", lambda: text_dataset.construct_example(next_index()), args.repeats * 10, 1, "examples")
+        add("construct_example (shards)", lambda: shards_dataset.construct_example(next_index()), args.repeats * 10, 1, "examples")
+
+        del text_dataset, shards_dataset
+
+    add("vectorize_segment", lambda: script.vectorize_segment(window_tokens), args.repeats * 10, len(window_tokens), "tokens")
+    add("devectorize_segment", lambda: script.devectorize_segment(window_vectors), args.repeats * 10, len(window_vectors), "tokens")
+    add("pad_or_truncate", lambda: script.pad_or_truncate(short_vectors, args.context_length), args.repeats * 10)
+
+    segment = torch.randn(args.batch_size, args.context_length, args.vector_size, device=used_device)
+    batch_tokens = args.batch_size * args.context_length
+
+    def forward():
+        with torch.no_grad():
+            net(segment)
+
+    def forward_backward():
+        net(segment).square().mean().backward()
+        net.zero_grad(set_to_none=True)
+
+    add("REAN forward", forward, args.repeats, batch_tokens, "tokens")
+    add("REAN forward + backward", forward_backward, args.repeats, batch_tokens, "tokens")
+
+    net.eval()
+    add("predict_sequence", lambda: script.predict_sequence(prompt, args.generate_tokens, net=net), max(args.repeats // 2, 1), args.generate_tokens, "tokens")
+    add("predict_sequence (kv cache)", lambda: script.predict_sequence(prompt, args.generate_tokens, net=net, use_kv_cache=True), max(args.repeats // 2, 1), args.generate_tokens, "tokens")
+
+    meta = {"python": platform.python_version(), "torch": torch.__version__, "platform": platform.platform(), "processor": cpu_name(),
+            "cpus": os.cpu_count(), "torch_threads": torch.get_num_threads(), "device": str(used_device),
+            "device_name": torch.cuda.get_device_name(used_device) if used_device.type == "cuda" else None,
+            "settings": {key: value for key, value in vars(args).items() if key not in ("out", "baseline", "save_baseline", "tolerance")}}
+
+    return {"meta": meta, "results": results}
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    compares the median times of report against baseline
+
+    Args:
+        report (dict): output of run_suite
+        baseline (dict): an earlier output of run_suite
+        tolerance (float): allowed slowdown, 0.25 ---> up to 25% slower is fine
+
+    Returns:
+        list[str]: the benchmarks that regressed
+    """
+
+    if report["meta"]["settings"] != baseline["meta"]["settings"]:
+        print("WARNING: the baseline was run with different settings, the comparison is not apples to apples")
+
+    if (report["meta"]["cpus"], report["meta"]["device_name"], report["meta"]["processor"]) != (baseline["meta"]["cpus"], baseline["meta"]["device_name"], baseline["meta"]["processor"]):
+        print("WARNING: the baseline was run on a different machine")
+
+    regressions = []
+
+    print(f"\n{'benchmark':40} {'baseline':>12} {'now':>12} {'ratio':>8}")
+
+    for name, result in report["results"].items():
+        if name not in baseline["results"]:
+            print(f"{name:40} {'-':>12} {result['median_s'] * 1000:10.3f}ms     (new)")
+            continue
+
+        ratio = result["median_s"] / baseline["results"][name]["median_s"]
+        regressed = ratio > 1 + tolerance
+
+        if regressed:
+            regressions.append(name)
+
+        print(f"{name:40} {baseline['results'][name]['median_s'] * 1000:10.3f}ms {result['median_s'] * 1000:10.3f}ms {ratio:7.2f}x" + ("   REGRESSION" if regressed else ""))
+
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="REAN hot path benchmark suite (synthetic corpus + word2vec model, no external data needed)")
+    parser.add_argument("--words", type=int, default=200000, help="size of the synthetic corpus")
+    parser.add_argument("--vector-size", type=int, default=784)
+    parser.add_argument("--attn-heads", type=int, default=8)
+    parser.add_argument("--context-length", type=int, default=128, help="keep at the training script's context_length (its padding defaults use it)")
+    parser.add_argument("--batch-size", type=int, default=32, help="batch for REAN forward / backward (the training run uses 768)")
+    parser.add_argument("--generate-tokens", type=int, default=32, help="tokens per predict_sequence call")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--out", default=None, help="write the results as json here")
+    parser.add_argument("--baseline", default=None, help="baseline json to compare against (exits with 1 on a regression), e.g. benchmarks/baselines/NAME.json from an earlier --save-baseline NAME on this machine")
+    parser.add_argument("--save-baseline", default=None, help="also store the results as a baseline under this name in benchmarks/baselines/ (run it before the change, on the machine you compare on)")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs the baseline before it counts as a regression")
+    args = parser.parse_args()
+
+    report = run_suite(args)
+
+    if args.out is not None:
+        with open(args.out, "w") as file:
+            json.dump(report, file, indent=4)
+
+    if args.save_baseline is not None:
+        os.makedirs(baselines_dir, exist_ok=True)
+
+        with open(os.path.join(baselines_dir, args.save_baseline + ".json"), "w") as file:
+            json.dump(report, file, indent=4)
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+        regressions = compare(report, baseline, args.tolerance)
+
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+
+        print("\nno regressions")
@@ -0,0 +1,65 @@
+import os
+import sys
+import random
+
+# benchmarks import the project modules from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tokenizer
+
+# made up words, shaped like the cleaned datasets (lowercase words, punctuation, [human] / [network] turns)
+syllables = ["ka", "to", "mi", "ra", "ne", "so", "lu", "pe", "di", "ga", "vo", "ti", "che", "ro", "an", "el"]
+punctuation = [".", ",", ":", "-", "(", ")", "'", "?"]
+
+def synthetic_text(num_words: int = 200000, vocab_words: int = 5000, seed: int = 0) -> str:
+    """
+    generates a fake corpus with a zipf-ish word distribution, so no external dataset is needed to benchmark
+
+    Args:
+        num_words (int): number of words in the corpus
+        vocab_words (int): number of distinct words to draw from
+        seed (int): random seed (same seed ---> same text)
+
+    Returns:
+        str: the corpus
+    """
+
+    rnd = random.Random(seed)
+
+    words = ["".join(rnd.choice(syllables) for _ in range(rnd.randint(1, 4))) for _ in range(vocab_words)]
+    weights = [1 / (rank + 1) for rank in range(vocab_words)]
+
+    result = []
+    for current_word in rnd.choices(words, weights=weights, k=num_words):
+        roll = rnd.random()
+
+        if roll < 0.01:
+            result.append(rnd.choice(["[human] ", "[network] "]))
+        elif roll < 0.1:
+            result.append(current_word + rnd.choice(punctuation) + " ")
+        else:
+            result.append(current_word + " ")
+
+    return "".join(result)
+
+def synthetic_model(text: str, vector_size: int = 784, min_count: int = 2, epochs: int = 1, seed: int = 0):
+    """
+    trains a small Word2Vec model on text (tokenized with the project tokenizer, like the real embeddings models)
+
+    Args:
+        text (str): corpus to train on
+        vector_size (int): embedding dim (784 like the real model)
+        min_count (int): ignore tokens rarer than this, so some tokens end up not in vocab
+        epochs (int): training epochs
+        seed (int): random seed
+
+    Returns:
+        Word2Vec: the model
+    """
+
+    from gensim.models import Word2Vec
+
+    tokens = tokenizer.tokenize_segment(text)
+    sentences = [tokens[idx:idx + 1000] for idx in range(0, len(tokens), 1000)]
+
+    return Word2Vec(sentences, vector_size=vector_size, window=5, min_count=min_count, workers=1, epochs=epochs, seed=seed)
@@ -0,0 +1,273 @@
+import io
+import queue
+import threading
+import numpy as np
+import torch
+from torch.utils.data import IterableDataset, get_worker_info
+import tokenizer
+
+class data_block:
+    """
+    one contiguous piece of a REAN_dataset, read with a single sequential read: the raw .txt bytes behind examples first_index...last_index - 1,
+    or the token ids behind them when the dataset reads token shards. REAN_dataset.construct_ids(index, block) builds examples from it without touching the disk
+    """
+
+    def __init__(self, first_index: int, last_index: int, data, start: int, at_end: bool):
+        """
+        Args:
+            first_index (int): first example index in the block
+            last_index (int): one past the last example index
+            data (bytes | np.ndarray): the .txt bytes, or the shard token ids
+            start (int): byte offset (text) / token index (shards) of data[0]
+            at_end (bool): data runs to the end of the file / shards, so running out of it is a real eof
+        """
+
+        self.first_index = first_index
+        self.last_index = last_index
+        self.data = data
+        self.start = start
+        self.at_end = at_end
+
+    def __len__(self):
+        return self.last_index - self.first_index
+
+    def open_text(self) -> io.TextIOWrapper:
+        # decodes like open(path, errors="ignore") does (same default encoding and newline handling), seek() takes byte offsets relative to self.start
+        return io.TextIOWrapper(io.BytesIO(self.data), errors="ignore")
+
+def read_block(dataset, first_index: int, last_index: int) -> data_block:
+    """
+    reads everything the examples first_index...last_index - 1 of dataset need in one go.\n
+    text: from first_index * average_token_length, plus a generous tail for the last windows (a window that still runs off the end falls back to a file read)
+    """
+
+    context_length = dataset.context_length
+
+    if dataset.shards is not None:
+        # a copy, so the ids are actually read here (slice() is a view of the memory map)
+        data = np.array(dataset.shards.slice(first_index, last_index - first_index + context_length + 1))
+
+        return data_block(first_index, last_index, data, first_index, first_index + len(data) >= len(dataset.shards))
+
+    start = first_index * tokenizer.average_token_length
+    length = (last_index - first_index + (context_length + 1) * 4) * tokenizer.average_token_length + 4096
+
+    with open(dataset.path, "rb") as file:
+        file.seek(start)
+        data = file.read(length)
+
+    return data_block(first_index, last_index, data, start, len(data) < length)
+
+class block_shuffled_dataset(IterableDataset):
+    """
+    streams a REAN_dataset in shuffled order while reading it sequentially.\n
+    the example indices are cut into contiguous blocks of block_examples. every epoch the blocks are shuffled (by seed and epoch) and dealt out to the
+    (rank, DataLoader worker) pairs. each worker reads its blocks in order on a readahead thread (one big read per block instead of one seek per example),
+    shuffles the examples of each block and mixes them with earlier blocks thru a shuffle_buffer sized reservoir.
+    every example is produced exactly once per epoch (with several ranks, a few are repeated so all ranks get the same number of batches),
+    and the order only depends on (seed, epoch, ranks, workers).
+
+    yields whole batches (use DataLoader(batch_size=None)) of token ids, or (question, answer) vectors when the dataset isnt in token_ids mode
+    """
+
+    def __init__(self, dataset, batch_size: int, block_examples: int=65536, shuffle_buffer: int=65536, readahead_blocks: int=4,
+                 num_workers: int=0, num_replicas: int=1, rank: int=0, seed: int=0):
+        """
+        Args:
+            dataset (REAN_dataset): the dataset to stream (text or token shards)
+            batch_size (int): examples per yielded batch
+            block_examples (int): examples per sequential read (text: about block_examples * average_token_length bytes)
+            shuffle_buffer (int): examples mixed across blocks, bigger ---> more random but more blocks stay in memory
+            readahead_blocks (int): blocks read ahead of the one being used
+            num_workers (int): the DataLoader's num_workers (the blocks are split between them)
+            num_replicas (int): data parallel processes
+            rank (int): this process
+            seed (int): shuffle seed
+        """
+
+        if len(dataset) == 0:
+            raise ValueError("block_shuffled_dataset needs a dataset with at least one example")
+
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.block_examples = block_examples
+        self.shuffle_buffer = shuffle_buffer
+        self.readahead_blocks = readahead_blocks
+        self.num_workers = num_workers
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.seed = seed
+        self.epoch = 0
+        self.skip_examples = 0
+        self.skip_epoch = None
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def skip(self, num_examples: int):
+        """
+        makes the current epoch (set_epoch it first) start num_examples in (counted over all ranks, like samplers.sharded_resumable_sampler).\n
+        exact when resuming with the same number of ranks, workers and batch size. skipped examples are never read
+        """
+
+        self.skip_examples = num_examples
+        self.skip_epoch = self.epoch
+
+    def epoch_blocks(self) -> list[tuple[int, int]]:
+        # (first_index, last_index) of every block, in this epoch's order
+        block_starts = np.arange(0, len(self.dataset), self.block_examples)
+        order = np.random.default_rng([self.seed, self.epoch]).permutation(len(block_starts))
+
+        return [(int(block_starts[idx]), int(min(block_starts[idx] + self.block_examples, len(self.dataset)))) for idx in order]
+
+    def replica_examples(self, blocks: list, replica: int, replicas: int) -> int:
+        """
+        how many examples a replica (rank, worker) produces: its own blocks, or with several ranks the most any replica has (so all ranks run the same number of batches)
+        """
+
+        if self.num_replicas > 1:
+            return max(sum(last - first for first, last in blocks[other::replicas]) for other in range(replicas))
+
+        return sum(last - first for first, last in blocks[replica::replicas])
+
+    def __len__(self):
+        # batches this rank gets per epoch (all its workers together)
+        workers = max(self.num_workers, 1)
+        blocks = self.epoch_blocks()
+
+        return sum(-(-self.replica_examples(blocks, self.rank * workers + worker, self.num_replicas * workers) // self.batch_size) for worker in range(workers))
+
+    def readahead(self, blocks: list, results: queue.Queue, stop: threading.Event):
+        # background thread: reads the blocks in order, at most readahead_blocks ahead of the consumer
+        try:
+            for first_index, last_index in blocks:
+                block = read_block(self.dataset, first_index, last_index)
+
+                while not stop.is_set():
+                    try:
+                        results.put(block, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+
+                if stop.is_set():
+                    return
+        except Exception as error:
+            results.put(error)
+
+    def make_batch(self, entries: list):
+        # entries: (index, block or None), None ---> the example wasnt in a loaded block (only after a skip) and is read directly
+        token_ids = torch.stack([self.dataset.construct_ids(index, block) for index, block in entries])
+
+        if self.dataset.token_ids_mode:
+            return token_ids
+
+        vectorized_batch = self.dataset.embeddings.vectorize_ids(token_ids)
+
+        return vectorized_batch[:, :-1], vectorized_batch[:, 1:]
+
+    def __iter__(self):
+        worker_info = get_worker_info()
+        workers = 1 if worker_info is None else worker_info.num_workers
+        worker = 0 if worker_info is None else worker_info.id
+
+        if workers != max(self.num_workers, 1):
+            raise ValueError(f"block_shuffled_dataset was made for {self.num_workers} workers, but the DataLoader has {workers}")
+
+        skipped_batches = 0
+
+        if self.skip_epoch == self.epoch and self.skip_examples:
+            skipped_batches = self.skip_examples // (self.batch_size * self.num_replicas)
+
+        # the DataLoader takes batches from the workers round robin starting at worker 0, so after a skip the workers swap roles
+        # to keep the uninterrupted epoch's order (role r made batches r, r + workers, ...)
+        role = (worker + skipped_batches) % workers
+        skip_examples = max(-(-(skipped_batches - role) // workers), 0) * self.batch_size
+
+        replica = self.rank * workers + role
+        replicas = self.num_replicas * workers
+
+        epoch_blocks = self.epoch_blocks()
+        blocks = epoch_blocks[replica::replicas]
+        target_examples = self.replica_examples(epoch_blocks, replica, replicas)
+        rng = np.random.default_rng([self.seed, self.epoch, replica])
+
+        # blocks whose examples all went into the buffer before the skip point arent read (their leftovers in the buffer are read one by one)
+        added = 0
+        first_loaded = len(blocks)
+
+        for block_idx, (first_index, last_index) in enumerate(blocks):
+            added += last_index - first_index
+
+            if added > skip_examples:
+                first_loaded = block_idx
+                break
+
+        loaded = queue.Queue(maxsize=self.readahead_blocks)
+        stop = threading.Event()
+        reader = threading.Thread(target=self.readahead, args=(blocks[first_loaded:], loaded, stop), daemon=True)
+        reader.start()
+
+        produced = 0
+        entries = []
+        buffer = []
+
+        def emit(entry):
+            nonlocal produced
+            produced += 1
+
+            if produced > skip_examples:
+                entries.append(entry)
+
+        try:
+            block = None
+
+            for block_idx, (first_index, last_index) in enumerate(blocks):
+                # the randomness is drawn for every block (loaded or not), so a skip lands on exactly the same order
+                order = rng.permutation(last_index - first_index) + first_index
+                draws = rng.integers(0, self.shuffle_buffer, size=len(order))
+
+                if block_idx >= first_loaded:
+                    block = loaded.get()
+
+                    if isinstance(block, Exception):
+                        raise block
+                else:
+                    block = None
+
+                for index, draw in zip(order.tolist(), draws.tolist()):
+                    if len(buffer) < self.shuffle_buffer:
+                        buffer.append((index, block))
+                        continue
+
+                    emit(buffer[draw])
+                    buffer[draw] = (index, block)
+
+                    if len(entries) == self.batch_size:
+                        yield self.make_batch(entries)
+                        entries = []
+
+            for draw in rng.permutation(len(buffer)).tolist():
+                emit(buffer[draw])
+
+                if len(entries) == self.batch_size:
+                    yield self.make_batch(entries)
+                    entries = []
+
+            buffer = []
+
+            # pad up to the other replicas with examples of the last block (still in memory, only read when this replica has to pad)
+            if target_examples > produced and block is None:
+                block = read_block(self.dataset, *(blocks[-1] if blocks else epoch_blocks[0]))
+
+            for pad_idx in range(target_examples - produced):
+                emit((block.first_index + pad_idx % len(block), block))
+
+                if len(entries) == self.batch_size:
+                    yield self.make_batch(entries)
+                    entries = []
+
+            if entries:
+                yield self.make_batch(entries)
+        finally:
+            stop.set()
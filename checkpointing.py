@@ -0,0 +1,258 @@
+import os
+import json
+import queue
+import threading
+from datetime import datetime, timedelta
+import torch
+
+class checkpoint_manager:
+    """
+    saves resumable training checkpoints without stalling the training loop.\n
+    save() only copies the model / optimizer / scheduler state_dicts into (pinned, reused) cpu buffers, the torch.save happens on a background thread
+    and lands on disk with an atomic rename. only the last keep_last checkpoints are kept, plus the best one by test loss.
+    a checkpoint saved without a test loss can get one later from a checkpoint_evaluator process (see report_test_loss)
+    """
+
+    def __init__(self, save_dir: str, checkpoint_name: str="REAN_checkpoint_date_[DATE]_batch_[BATCH]_epoch_[EPOCH].pth", keep_last: int=3, keep_best: bool=True):
+        """
+        Args:
+            save_dir (str): directory for the checkpoints (and checkpoints.json, which tracks them)
+            checkpoint_name (str): file name, [DATE] [BATCH] and [EPOCH] are filled in
+            keep_last (int): how many of the newest checkpoints to keep
+            keep_best (bool): also keep the checkpoint with the lowest test loss
+        """
+
+        self.save_dir = save_dir
+        self.checkpoint_name = checkpoint_name
+        self.keep_last = keep_last
+        self.keep_best = keep_best
+
+        os.makedirs(save_dir, exist_ok=True)
+
+        self.index_path = os.path.join(save_dir, "checkpoints.json")
+        self.reported_path = os.path.join(save_dir, reported_test_losses_file)
+        self.index = {"checkpoints": [], "best": None}
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as file:
+                self.index = json.load(file)
+
+        # cpu copies of the state tensors, allocated on the first save and reused
+        self.buffers = {}
+
+        self.jobs = queue.Queue(maxsize=1)
+        self.error = None
+        self.writer_thread = threading.Thread(target=self.writer_loop, daemon=True)
+        self.writer_thread.start()
+
+    def copy_to_buffers(self, state, prefix=""):
+        # walks (nested) dicts / lists of a state_dict and copies every tensor into its cpu buffer
+        if isinstance(state, torch.Tensor):
+            buffer = self.buffers.get(prefix)
+
+            if buffer is None or buffer.shape != state.shape or buffer.dtype != state.dtype:
+                buffer = torch.empty(state.shape, dtype=state.dtype, device="cpu", pin_memory=state.is_cuda)
+                self.buffers[prefix] = buffer
+
+            buffer.copy_(state.detach(), non_blocking=state.is_cuda)
+
+            return buffer
+
+        if isinstance(state, dict):
+            return {key: self.copy_to_buffers(value, f"{prefix}/{key}") for key, value in state.items()}
+
+        if isinstance(state, (list, tuple)):
+            return type(state)(self.copy_to_buffers(value, f"{prefix}/{idx}") for idx, value in enumerate(state))
+
+        return state
+
+    def save(self, net, optimizer, scheduler, batch: int, epoch: int, test_loss: float=None, **extra):
+        """
+        snapshots the training state and queues it to be written.\n
+        blocks only for the copy to cpu (and, if the previous checkpoint is still being written, until that one is done, since the buffers are reused)
+
+        Args:
+            net (nn.Module): the net
+            optimizer: the optimizer
+            scheduler: the lr scheduler
+            batch (int): global batch counter
+            epoch (int): current epoch
+            test_loss (float): latest test loss, used to pick the best checkpoint (None ---> not a candidate)
+            **extra: anything else to store (e.g. epoch_batch, sampler_seed, config)
+        """
+
+        if self.error is not None:
+            raise self.error
+
+        # the buffers might still be getting written
+        self.jobs.join()
+
+        snapshot = self.copy_to_buffers({"model": net.state_dict(), "optimizer": optimizer.state_dict(), "scheduler": scheduler.state_dict()})
+        snapshot.update(batch=batch, epoch=epoch, test_loss=test_loss, **extra)
+
+        # non blocking copies have to be done before the writer reads them
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+
+        file_name = (self.checkpoint_name
+                     .replace("[DATE]", (datetime.utcnow() + timedelta(hours=3)).strftime('%Y-%m-%d %H:%M:%S'))
+                     .replace("[BATCH]", str(batch))
+                     .replace("[EPOCH]", str(epoch)))
+
+        self.jobs.put((snapshot, file_name))
+
+    def writer_loop(self):
+        while True:
+            snapshot, file_name = self.jobs.get()
+
+            try:
+                self.write(snapshot, file_name)
+            except Exception as error:
+                self.error = error
+            finally:
+                self.jobs.task_done()
+
+    def write(self, snapshot: dict, file_name: str):
+        path = os.path.join(self.save_dir, file_name)
+
+        # atomic: a crash mid write never leaves a broken checkpoint under the real name
+        torch.save(snapshot, path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+        self.index["checkpoints"].append({"file": file_name, "batch": snapshot["batch"], "epoch": snapshot["epoch"], "test_loss": snapshot["test_loss"]})
+
+        self.apply_reported_test_losses()
+
+        # rotate: drop everything but the newest keep_last (and the best)
+        keep = self.index["checkpoints"][-self.keep_last:] if self.keep_last > 0 else []
+
+        for current in self.index["checkpoints"]:
+            if current not in keep and current != self.index["best"]:
+                try:
+                    os.remove(os.path.join(self.save_dir, current["file"]))
+                except FileNotFoundError:
+                    pass
+
+        self.index["checkpoints"] = [current for current in self.index["checkpoints"] if current in keep or current == self.index["best"]]
+
+        self.write_index()
+
+    def apply_reported_test_losses(self):
+        # fills in the test losses a checkpoint_evaluator reported for checkpoints saved without one, then picks the best
+        reported = {}
+
+        if os.path.exists(self.reported_path):
+            with open(self.reported_path) as file:
+                reported = json.load(file)
+
+        for current in self.index["checkpoints"]:
+            if current["test_loss"] is None:
+                current["test_loss"] = reported.get(current["file"])
+
+            if current["test_loss"] is not None and self.keep_best:
+                if self.index["best"] is None or current["test_loss"] < self.index["best"]["test_loss"]:
+                    self.index["best"] = current
+
+    def write_index(self):
+        with open(self.index_path + ".tmp", "w") as file:
+            json.dump(self.index, file, indent=4)
+        os.replace(self.index_path + ".tmp", self.index_path)
+
+    def collect_test_losses(self):
+        """
+        waits for the queued checkpoints, then takes in the test losses reported since the last save (e.g. the evaluator's pass over the last checkpoint)
+        """
+
+        self.wait()
+
+        self.apply_reported_test_losses()
+        self.write_index()
+
+    def wait(self):
+        """
+        blocks until every queued checkpoint is on disk
+        """
+
+        self.jobs.join()
+
+        if self.error is not None:
+            raise self.error
+
+    def latest(self) -> str:
+        """
+        returns the path of the newest checkpoint, None if there are none
+        """
+
+        if not self.index["checkpoints"]:
+            return None
+
+        return os.path.join(self.save_dir, self.index["checkpoints"][-1]["file"])
+
+    def best(self) -> str:
+        """
+        returns the path of the checkpoint with the lowest test loss, None if there is none
+        """
+
+        if self.index["best"] is None:
+            return None
+
+        return os.path.join(self.save_dir, self.index["best"]["file"])
+
+# written by the evaluator process (report_test_loss), read by the training process' checkpoint_manager. only one process writes each file
+reported_test_losses_file = "reported_test_losses.json"
+
+def report_test_loss(save_dir: str, file_name: str, test_loss: float):
+    """
+    records the test loss of a checkpoint evaluated outside the training process (see metrics.checkpoint_evaluator),
+    checkpoint_manager takes it in at its next save (or collect_test_losses) and can then keep it as the best
+
+    Args:
+        save_dir (str): checkpoint directory of the training run
+        file_name (str): the checkpoint's file name, as in checkpoints.json
+        test_loss (float): its test loss
+    """
+
+    path = os.path.join(save_dir, reported_test_losses_file)
+    reported = {}
+
+    if os.path.exists(path):
+        with open(path) as file:
+            reported = json.load(file)
+
+    reported[file_name] = test_loss
+
+    # atomic, the training process might be reading it
+    with open(path + ".tmp", "w") as file:
+        json.dump(reported, file, indent=4)
+    os.replace(path + ".tmp", path)
+
+def load_checkpoint(path: str, net, optimizer=None, scheduler=None, map_location=None) -> dict:
+    """
+    restores a checkpoint written by checkpoint_manager into net (and optimizer / scheduler if given)
+
+    Args:
+        path (str): checkpoint file
+        net (nn.Module): net to load the weights into
+        optimizer: optimizer to restore (None ---> skip)
+        scheduler: lr scheduler to restore (None ---> skip)
+        map_location: passed to torch.load (default: the net's device)
+
+    Returns:
+        dict: the rest of the checkpoint (batch, epoch, test_loss and any extras)
+    """
+
+    map_location = map_location or next(net.parameters()).device
+    checkpoint = torch.load(path, map_location=map_location, weights_only=False)
+
+    net.load_state_dict(checkpoint.pop("model"))
+
+    optimizer_state = checkpoint.pop("optimizer")
+    scheduler_state = checkpoint.pop("scheduler")
+
+    if optimizer is not None:
+        optimizer.load_state_dict(optimizer_state)
+
+    if scheduler is not None:
+        scheduler.load_state_dict(scheduler_state)
+
+    return checkpoint
@@ -0,0 +1,312 @@
+import re
+import os
+import time
+import argparse
+import multiprocessing
+from collections import deque
+
+# same settings as assWipe©_dataset_cleaner.ipynb
+freaky_dataset_path = fr"./datasets/comparison_data_v2.json"
+clean_dataset_path = fr"./datasets/comparison_clean.txt"
+
+allowed_chars = "abcdefghijklmnopqrstuvwxyz .:-()[]1234567890\\/'"
+
+chunk_size = 1024 * 1024 * 16
+
+replace_sequences = {r'"user_input":': "[human]",
+                     r'"response":': "[network]",
+                     r'.,': ".",
+                     r'"score": 0.0,': "",
+                     r'"score": 1.0,': "",
+                     r'"score": 2.0,': "",
+                     r'"score": 3.0,': "",
+                     r'"score": 4.0,': "",
+                     r'"score": 5.0,': "",
+                     r'"score": 6.0,': "",
+                     r'"score": 7.0,': "",
+                     r'"score": 8.0,': "",
+                     r'"score": 9.0,': "",
+                     r'"score": 10.0,': "",
+                     r'"source": "text-davinci-003"': "",
+                     r'"source": "gpt4"': "",
+                     r'"source": "icm-1.3b"': "",
+                     r'\n': " ",
+                     r'below is an instruction that describes a task. write a response that appropriately completes the request': "",
+                     r'instruction:': "",
+                     r' ] ': " ",
+                     r' [ ': " ",
+                     r' s': "'s",
+                     r' :': ":",
+                     r'responses and': ""}
+
+double_spaces = re.compile(" {2,}")
+
+class char_filter_table(dict):
+    """
+    str.translate table that keeps allowed chars and turns everything else into a space.\n
+    filled in lazily (once per distinct char), so it works for the whole unicode range without a 1M entry dict
+    """
+
+    def __init__(self, allowed_chars=allowed_chars):
+        super(char_filter_table, self).__init__()
+        self.allowed_chars = set(allowed_chars)
+
+    def __missing__(self, ordinal):
+        self[ordinal] = ordinal if chr(ordinal) in self.allowed_chars else ord(" ")
+        return self[ordinal]
+
+# one table per process (workers build their own)
+filter_tables = {}
+
+def shares_chars(text: str, pattern: str) -> bool:
+    # can an occurrence of pattern overlap text (by at least one char), whatever is around it. never for "" (what a deletion joins is checked per chunk, see replace_pass)
+    for offset in range(1 - len(pattern), len(text)):
+        start, end = max(offset, 0), min(offset + len(pattern), len(text))
+
+        if start < end and text[start:end] == pattern[start - offset:end - offset]:
+            return True
+
+    return False
+
+class replace_pass:
+    """
+    consecutive replace sequences done in one ordered alternation regex pass, with the same result as one str.replace each, in order (see replace_passes).\n
+    that only holds where no deleted match joins the text around it into another sequence and no two sequences overlap.
+    both are caught from the split text (the chars around every match, overlapping sequences are matched as one), the pass then falls back to one str.replace each
+    """
+
+    def __init__(self, sequences: list[tuple[str, str]]):
+        self.sequences = sequences
+        self.replacements = dict(sequences)
+
+        # the end of one sequence is the start of another
+        self.overlaps = {first + second[size:] for first, _ in sequences for second, _ in sequences if first != second
+                         for size in range(1, min(len(first), len(second))) if first.endswith(second[:size])}
+
+        # longest first, so an overlap is matched as a whole
+        alternatives = sorted(self.overlaps, key=len, reverse=True) + [pattern for pattern, _ in sequences]
+        self.regex = re.compile("(" + "|".join(re.escape(alternative) for alternative in alternatives) + ")")
+
+        # (char before, char after) of a deleted match that could be two neighbouring chars of a sequence
+        self.joints = {(pattern[idx - 1], pattern[idx]) for pattern, _ in sequences for idx in range(1, len(pattern))} if not all(self.replacements.values()) else set()
+
+    def joined(self, gaps: list[str]) -> bool:
+        if not self.joints:
+            return False
+
+        # two matches next to each other, or a match between two chars that a deletion could join (conservative: not only deletions are checked)
+        return "" in gaps[1:-1] or not self.joints.isdisjoint(zip([gap[-1:] for gap in gaps[:-1]], [gap[:1] for gap in gaps[1:]]))
+
+    def apply(self, text: str) -> str:
+        if len(self.sequences) == 1:
+            return text.replace(*self.sequences[0])
+
+        # [text, match, text, match, ..., text]
+        parts = self.regex.split(text)
+
+        if self.overlaps.isdisjoint(parts[1::2]) and not self.joined(parts[0::2]):
+            parts[1::2] = [self.replacements[match] for match in parts[1::2]]
+
+            return "".join(parts)
+
+        for current_replace, replacement in self.sequences:
+            text = text.replace(current_replace, replacement)
+
+        return text
+
+def replace_passes(replace_sequences: dict=replace_sequences) -> list[replace_pass]:
+    """
+    groups the replace sequences into passes, same result as applying them one by one.\n
+    a sequence joins the previous one's pass if they all start with the same punctuation char (the regex engine jumps between its occurrences, so the pass
+    costs about one str.replace), no earlier replacement in the pass can be part of a later sequence's match and no pattern contains another one.
+    the rest (e.g. " s" and " :", a regex stops at every space) are a str.replace each, which is faster than a regex on them.
+    the order dependent steps (e.g. the literal \\n ---> " " making new " s" matches) always end up in different passes
+
+    Returns:
+        list[replace_pass]: the passes, in order
+    """
+
+    groups = []
+
+    for current_replace, replacement in replace_sequences.items():
+        group = groups[-1] if groups else []
+        first_char = current_replace[:1]
+
+        if (group and not first_char.isalnum() and not first_char.isspace() and all(earlier[:1] == first_char for earlier, _ in group)
+                and all(not shares_chars(earlier_replacement, current_replace) and current_replace not in earlier[1:] and earlier not in current_replace[1:] for earlier, earlier_replacement in group)):
+            group.append((current_replace, replacement))
+        else:
+            groups.append([(current_replace, replacement)])
+
+    return [replace_pass(group) for group in groups]
+
+# one plan per process and table
+replace_plans = {}
+
+def clean_text(text: str, replace_sequences: dict=replace_sequences, allowed_chars: str=allowed_chars) -> str:
+    """
+    cleans a piece of text exactly like the notebook does: lowercase ---> replace_sequences ---> unwanted chars to spaces ---> collapse double spaces
+
+    Args:
+        text (str): raw text
+        replace_sequences (dict[str, str]): sequences to replace, applied in order
+        allowed_chars (str): every other char becomes a space
+
+    Returns:
+        str: the clean text
+    """
+
+    text = text.lower()
+
+    # the replacements are order dependent (e.g. "\n" ---> " " can create a new " s"), replace_passes only merges the ones that cant affect each other
+    plan_key = tuple(replace_sequences.items())
+
+    if plan_key not in replace_plans:
+        replace_plans[plan_key] = replace_passes(replace_sequences)
+
+    for current_pass in replace_plans[plan_key]:
+        text = current_pass.apply(text)
+
+    if allowed_chars not in filter_tables:
+        filter_tables[allowed_chars] = char_filter_table(allowed_chars)
+
+    text = text.translate(filter_tables[allowed_chars])
+
+    # same as looping replace("  ", " ") until there are no double spaces left
+    return double_spaces.sub(" ", text)
+
+def barrier_pattern(replace_sequences: dict=replace_sequences) -> re.Pattern:
+    """
+    chars that (even after lower()) appear in none of the replace sequences or their replacements can never be part of a match, at any step.
+    so the text can be cut right after one of them and cleaned in pieces with the exact same result as cleaning it whole.\n
+    returns a regex matching candidate barrier chars (candidates still have to pass is_barrier)
+    """
+
+    pattern_chars = set("".join(replace_sequences.keys()) + "".join(replace_sequences.values()))
+    pattern_chars |= {char.upper() for char in pattern_chars}
+
+    return re.compile("[^" + re.escape("".join(sorted(pattern_chars))) + "]")
+
+def is_barrier(char: str, pattern_chars: set) -> bool:
+    return not set(char.lower()) & pattern_chars
+
+def read_chunks(file, chunk_size: int=chunk_size, replace_sequences: dict=replace_sequences):
+    """
+    reads a text file in roughly chunk_size pieces, every piece ends right after a barrier char (see barrier_pattern), so no replace sequence can span two pieces.\n
+    if a piece has no barrier at all it keeps growing until one is found (or EOF)
+
+    Args:
+        file: text file opened for reading
+        chunk_size (int): chars to read at a time
+
+    Yields:
+        str: pieces of the file, in order
+    """
+
+    candidates = barrier_pattern(replace_sequences)
+    pattern_chars = set("".join(replace_sequences.keys()) + "".join(replace_sequences.values()))
+
+    carry = ""
+
+    while True:
+        data = file.read(chunk_size)
+
+        if not data:
+            if carry:
+                yield carry
+            return
+
+        text = carry + data
+
+        # find the last barrier, only looking at the end of the text first
+        cut = None
+        search_start = max(len(text) - 65536, 0)
+
+        while cut is None:
+            for candidate in reversed(list(candidates.finditer(text, search_start))):
+                if is_barrier(candidate.group(), pattern_chars):
+                    cut = candidate.end()
+                    break
+
+            if search_start == 0:
+                break
+
+            search_start = max(search_start - len(text) // 4 - 65536, 0)
+
+        if cut is None:
+            carry = text
+            continue
+
+        yield text[:cut]
+        carry = text[cut:]
+
+def clean_file(in_path: str=freaky_dataset_path, out_path: str=clean_dataset_path, chunk_size: int=chunk_size, processes: int=None, replace_sequences: dict=replace_sequences, allowed_chars: str=allowed_chars) -> dict:
+    """
+    streams in_path thru clean_text on a process pool and writes the result to out_path, in order.\n
+    only about 2 * processes chunks are in flight at a time, so memory is bounded by chunk_size, not by the file size
+
+    Args:
+        in_path (str): raw dataset
+        out_path (str): where to write the clean dataset
+        chunk_size (int): chars per chunk
+        processes (int): worker processes (default: cpu count), 1 ---> no pool
+
+    Returns:
+        dict: stats (chars read / written, seconds)
+    """
+
+    processes = processes or os.cpu_count()
+    start = time.perf_counter()
+
+    stats = {"chars_in": 0, "chars_out": 0}
+    ends_with_space = False
+
+    def write(clean_chunk):
+        nonlocal ends_with_space
+
+        # a run of spaces can be split between two chunks, collapse it here
+        if ends_with_space and clean_chunk.startswith(" "):
+            clean_chunk = clean_chunk[1:]
+
+        if clean_chunk:
+            clean_file.write(clean_chunk)
+            ends_with_space = clean_chunk.endswith(" ")
+            stats["chars_out"] += len(clean_chunk)
+
+    with open(in_path, 'r', encoding='utf-8', errors='ignore') as freaky_file, open(out_path, 'w', encoding='utf-8', errors='ignore') as clean_file:
+        chunks = read_chunks(freaky_file, chunk_size, replace_sequences)
+
+        if processes == 1:
+            for chunk in chunks:
+                stats["chars_in"] += len(chunk)
+                write(clean_text(chunk, replace_sequences, allowed_chars))
+        else:
+            with multiprocessing.Pool(processes) as pool:
+                in_flight = deque()
+
+                for chunk in chunks:
+                    stats["chars_in"] += len(chunk)
+                    in_flight.append(pool.apply_async(clean_text, (chunk, replace_sequences, allowed_chars)))
+
+                    # keep the output in order and the memory bounded
+                    while len(in_flight) >= processes * 2:
+                        write(in_flight.popleft().get())
+
+                while in_flight:
+                    write(in_flight.popleft().get())
+
+    stats["seconds"] = time.perf_counter() - start
+
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="clean a raw dataset dump into REAN training text (same cleaning as assWipe©_dataset_cleaner.ipynb)")
+    parser.add_argument("input", nargs="?", default=freaky_dataset_path)
+    parser.add_argument("output", nargs="?", default=clean_dataset_path)
+    parser.add_argument("--chunk-size", type=int, default=chunk_size, help="chars per chunk")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes (default: cpu count)")
+    args = parser.parse_args()
+
+    stats = clean_file(args.input, args.output, args.chunk_size, args.processes)
+
+    print(f"{args.input} ---> {args.output}: {stats['chars_in']} chars in, {stats['chars_out']} chars out, {stats['seconds']:.1f}s ({stats['chars_in'] / max(stats['seconds'], 1e-9) / 1024 / 1024:.1f}M chars/s)")
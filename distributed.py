@@ -0,0 +1,111 @@
+import os
+import datetime
+import torch
+import torch.distributed as dist
+import runtime
+
+def launched_distributed() -> bool:
+    """
+    True if this process was started by torchrun (or anything else that sets WORLD_SIZE / RANK)
+    """
+
+    return int(os.environ.get("WORLD_SIZE", "1")) > 1
+
+def setup(preferred_device: str=None, backend: str=None, timeout_minutes: int=30) -> tuple[int, int, torch.device]:
+    """
+    joins the process group torchrun set up (RANK / WORLD_SIZE / LOCAL_RANK / MASTER_ADDR / MASTER_PORT from the environment).\n
+    nccl with one gpu per process when there are gpus, else gloo on the cpu. without torchrun it does nothing and returns (0, 1, device)
+
+    Args:
+        preferred_device (str): device to use when not launched distributed, None ---> runtime.pick_device's choice
+        backend (str): override, None ---> "nccl" if cuda is available, else "gloo"
+        timeout_minutes (int): how long a collective waits for the slowest rank before failing
+
+    Returns:
+        int: rank of this process
+        int: world size (number of processes)
+        torch.device: the device this process trains on
+    """
+
+    if not launched_distributed():
+        return 0, 1, runtime.pick_device(preferred_device)
+
+    backend = backend or ("nccl" if torch.cuda.is_available() else "gloo")
+
+    if backend == "nccl":
+        local_rank = int(os.environ.get("LOCAL_RANK", "0"))
+        used_device = torch.device("cuda", local_rank)
+        torch.cuda.set_device(used_device)
+    else:
+        used_device = torch.device("cpu")
+
+    if not dist.is_initialized():
+        dist.init_process_group(backend=backend, timeout=datetime.timedelta(minutes=timeout_minutes))
+
+    return dist.get_rank(), dist.get_world_size(), used_device
+
+def cleanup():
+    if dist.is_available() and dist.is_initialized():
+        dist.destroy_process_group()
+
+def is_main_process() -> bool:
+    # rank 0 (or not distributed at all) does the logging, checkpointing and sample generation
+    return get_rank() == 0
+
+def get_rank() -> int:
+    return dist.get_rank() if dist.is_available() and dist.is_initialized() else 0
+
+def get_world_size() -> int:
+    return dist.get_world_size() if dist.is_available() and dist.is_initialized() else 1
+
+def local_world_size() -> int:
+    # processes on this machine (they share its cores)
+    return int(os.environ.get("LOCAL_WORLD_SIZE", "1"))
+
+def barrier():
+    if get_world_size() > 1:
+        dist.barrier()
+
+def reduce_mean(tensor: torch.Tensor) -> torch.Tensor:
+    """
+    mean of tensor over all ranks (every rank gets the result), a no-op when not distributed.\n
+    the tensor has to be on the process' device (cuda for nccl), no sync with the host happens here
+    """
+
+    if get_world_size() == 1:
+        return tensor
+
+    tensor = tensor.detach().clone().float()
+    dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+
+    return tensor / get_world_size()
+
+def reduce_sum(tensor: torch.Tensor) -> torch.Tensor:
+    """
+    sum of tensor over all ranks (every rank gets the result), a no-op when not distributed
+    """
+
+    if get_world_size() == 1:
+        return tensor
+
+    tensor = tensor.detach().clone()
+    dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+
+    return tensor
+
+def reduce_weighted_mean(value: torch.Tensor, weight: int) -> torch.Tensor:
+    """
+    weighted mean of a scalar over all ranks, e.g. mean losses of eval shards that differ in size by an example
+    """
+
+    if get_world_size() == 1:
+        return value
+
+    totals = torch.stack([value.detach().float() * weight, torch.tensor(float(weight), device=value.device)])
+    dist.all_reduce(totals, op=dist.ReduceOp.SUM)
+
+    return totals[0] / totals[1]
+
+def unwrap(net: torch.nn.Module) -> torch.nn.Module:
+    # the plain REAN inside a DistributedDataParallel wrapper (for checkpoints, generation and single process eval)
+    return net.module if isinstance(net, torch.nn.parallel.DistributedDataParallel) else net
@@ -0,0 +1,381 @@
+import os
+import json
+import argparse
+import warnings
+import numpy as np
+import torch
+import torch.nn as nn
+
+# id reserved for tokens that are not in the embeddings vocab (also used as padding), its vector is all "default"
+niv_id = 0
+niv_token = "[NIV]"
+
+# embedding store layout (see save_store / mapped_embedding_table)
+store_vectors_file = "vectors.npy"
+store_vocab_file = "vocab.json"     # id -> token list, same layout as token_shards.py's vocab.json
+
+def token_ids_from_model(model) -> dict:
+    """
+    builds the token -> id map from a word2vec model.\n
+    id 0 is reserved for not in vocab / padding, so every vocab word gets its gensim index + 1
+
+    Args:
+        model (Word2Vec): the embeddings model whos vocab to use
+
+    Returns:
+        dict[str, int]: token -> id
+    """
+
+    return {token: idx + 1 for idx, token in enumerate(model.wv.index_to_key)}
+
+class embedding_table:
+    """
+    token -> id map + one contiguous float32 (vocab_size + 1, vector_size) matrix, built ONCE from the word2vec model.\n
+    row niv_id is the not in vocab / padding vector, so vectorizing is just an id lookup + a single gather
+    """
+
+    def __init__(self, token_ids: dict, vectors: np.ndarray, default: float = 0):
+        self.token_ids = token_ids
+        self.id_to_token = [niv_token] + [None] * (len(token_ids))
+        for token, token_id in token_ids.items():
+            self.id_to_token[token_id] = token
+
+        self.vectors = torch.from_numpy(np.ascontiguousarray(vectors, dtype=np.float32))
+        self.vector_size = self.vectors.shape[1]
+        self.vocab_size = self.vectors.shape[0]
+        self.vectors[niv_id] = default
+
+        # copies of the matrix on other devices, made on first use
+        self.device_vectors = {}
+
+    @classmethod
+    def from_model(cls, model, default: float = 0):
+        """
+        builds the table from a gensim Word2Vec model
+
+        Args:
+            model (Word2Vec): the embeddings model
+            default (float): value to fill the not in vocab / padding vector with
+
+        Returns:
+            embedding_table: the table
+        """
+
+        vectors = np.empty((len(model.wv.index_to_key) + 1, model.vector_size), dtype=np.float32)
+        vectors[1:] = model.wv.vectors
+
+        return cls(token_ids_from_model(model), vectors, default)
+
+    def vectors_on(self, device) -> torch.Tensor:
+        """
+        returns the embedding matrix on the given device (copied there once and kept)
+        """
+
+        device = torch.device(device)
+
+        if device == self.vectors.device:
+            return self.vectors
+
+        if device not in self.device_vectors:
+            self.device_vectors[device] = self.vectors.to(device)
+
+        return self.device_vectors[device]
+
+    def ids(self, segment: list[str]) -> torch.Tensor:
+        """
+        turns a list of tokens into a tensor of ids, tokens not in the vocab get niv_id
+
+        Args:
+            segment (list[str]): list of tokens
+
+        Returns:
+            torch.Tensor: int64 tensor of shape (len(segment),)
+        """
+
+        get = self.token_ids.get
+
+        return torch.tensor([get(token, niv_id) for token in segment], dtype=torch.int64)
+
+    def vectorize_ids(self, ids: torch.Tensor, used_device=None) -> torch.Tensor:
+        """
+        gathers the vectors of ids of any shape, returns a tensor of shape (*ids.shape, vector_size)
+
+        Args:
+            ids (torch.Tensor): integer tensor of token ids
+            used_device (torch.device): device to do the gather on and return the result on (default: ids.device)
+
+        Returns:
+            torch.Tensor: float32 embedding vectors
+        """
+
+        used_device = ids.device if used_device is None else torch.device(used_device)
+
+        return self.vectors_on(used_device)[ids.to(used_device, dtype=torch.int64)]
+
+    def vectorize(self, segment: list[str], used_device=torch.device("cpu")) -> torch.Tensor:
+        """
+        encodes a list of tokens to a (len(segment), vector_size) float32 tensor with a single gather
+
+        Args:
+            segment (list[str]): list of tokens
+            used_device (torch.device): device of the result
+
+        Returns:
+            torch.Tensor: float32 tensor of shape (len(segment), vector_size)
+        """
+
+        return self.vectorize_ids(self.ids(segment), used_device)
+
+    def batch_ids(self, segments: list[list[str]], length: int) -> torch.Tensor:
+        """
+        turns many token lists into one (len(segments), length) id tensor, left padded with niv_id / truncated to the last length tokens (same as pad_or_truncate)
+
+        Args:
+            segments (list[list[str]]): token lists
+            length (int): length to pad / truncate every segment to
+
+        Returns:
+            torch.Tensor: int64 tensor of shape (len(segments), length)
+        """
+
+        get = self.token_ids.get
+
+        batch = torch.full((len(segments), length), niv_id, dtype=torch.int64)
+
+        for row, segment in enumerate(segments):
+            segment = segment[-length:] if length else []
+
+            if segment:
+                batch[row, length - len(segment):] = torch.tensor([get(token, niv_id) for token in segment], dtype=torch.int64)
+
+        return batch
+
+    def vectorize_batch(self, segments: list[list[str]], length: int, used_device=torch.device("cpu")) -> torch.Tensor:
+        """
+        encodes many token lists into one (len(segments), length, vector_size) tensor with a single gather
+
+        Args:
+            segments (list[list[str]]): token lists
+            length (int): length to pad / truncate every segment to
+            used_device (torch.device): device of the result
+
+        Returns:
+            torch.Tensor: float32 tensor of shape (len(segments), length, vector_size)
+        """
+
+        return self.vectorize_ids(self.batch_ids(segments, length), used_device)
+
+    def as_embedding(self) -> nn.Embedding:
+        """
+        returns the table as a frozen nn.Embedding (padding_idx = niv_id), for doing the lookup inside a module
+        """
+
+        return nn.Embedding.from_pretrained(self.vectors.clone(), freeze=True, padding_idx=niv_id)
+
+def save_store(table: embedding_table, store_dir: str):
+    """
+    writes a table as an embedding store: the (vocab_size, vector_size) float32 matrix as a .npy (memory mappable) + the vocab as json.\n
+    open it with mapped_embedding_table
+
+    Args:
+        table (embedding_table): the table to save
+        store_dir (str): directory to write into
+    """
+
+    os.makedirs(store_dir, exist_ok=True)
+
+    # temp files + rename, so a half written store is never picked up
+    vectors_path = os.path.join(store_dir, store_vectors_file)
+    np.save(vectors_path + ".tmp.npy", table.vectors.numpy())
+    os.replace(vectors_path + ".tmp.npy", vectors_path)
+
+    vocab_path = os.path.join(store_dir, store_vocab_file)
+    with open(vocab_path + ".tmp", "w") as file:
+        json.dump(table.id_to_token, file)
+    os.replace(vocab_path + ".tmp", vocab_path)
+
+class mapped_embedding_table(embedding_table):
+    """
+    embedding_table backed by a store from save_store. the vectors are a read only memory map of vectors.npy,
+    so every process that opens the store (DataLoader workers, eval / inference processes) shares the same page cache pages instead of holding its own copy.\n
+    nothing is read until first use, and pickling only sends the store path (a worker re-opens the memory map on its side)
+    """
+
+    def __init__(self, store_dir: str):
+        """
+        Args:
+            store_dir (str): directory written by save_store
+        """
+
+        self.store_dir = store_dir
+
+        self.mapped_vectors = None
+        self.mapped_id_to_token = None
+        self.mapped_token_ids = None
+
+        # copies of the matrix on other devices, made on first use
+        self.device_vectors = {}
+
+    @property
+    def vectors(self) -> torch.Tensor:
+        if self.mapped_vectors is None:
+            array = np.load(os.path.join(self.store_dir, store_vectors_file), mmap_mode="r")
+
+            # torch warns about the memory map being read only, which is the point
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", UserWarning)
+                self.mapped_vectors = torch.from_numpy(array)
+
+        return self.mapped_vectors
+
+    @property
+    def id_to_token(self) -> list:
+        if self.mapped_id_to_token is None:
+            with open(os.path.join(self.store_dir, store_vocab_file)) as file:
+                self.mapped_id_to_token = json.load(file)
+
+        return self.mapped_id_to_token
+
+    @property
+    def token_ids(self) -> dict:
+        if self.mapped_token_ids is None:
+            self.mapped_token_ids = {token: token_id for token_id, token in enumerate(self.id_to_token) if token_id != niv_id}
+
+        return self.mapped_token_ids
+
+    @property
+    def vector_size(self) -> int:
+        return self.vectors.shape[1]
+
+    @property
+    def vocab_size(self) -> int:
+        return self.vectors.shape[0]
+
+    def __getstate__(self):
+        return {"store_dir": self.store_dir}
+
+    def __setstate__(self, state):
+        self.__init__(state["store_dir"])
+
+class nearest_token_decoder:
+    """
+    decodes embedding vectors back into tokens by cosine similarity, like gensim's similar_by_vector but batched on the run device.\n
+    the L2 normalised vocab matrix is kept resident on the device, so decoding a whole (batch, vector_size) or (batch, seq, vector_size) tensor is one matmul + argmax
+    """
+
+    def __init__(self, table: embedding_table, device=torch.device("cpu"), not_in_vocab_token=niv_token, NIV_threshold=0.01, vocab_chunk_size=None):
+        """
+        Args:
+            table (embedding_table): vocab table to decode into
+            device (torch.device): device to keep the normalised matrix on (and do the decoding on)
+            not_in_vocab_token (str): token to return when nothing in the vocab is similar enough
+            NIV_threshold (float): best cosine similarity has to be above this, otherwise not_in_vocab_token
+            vocab_chunk_size (int): if set, the similarities are computed over this many vocab rows at a time to bound memory
+        """
+
+        self.table = table
+        self.device = torch.device(device)
+        self.not_in_vocab_token = not_in_vocab_token
+        self.NIV_threshold = NIV_threshold
+        self.vocab_chunk_size = vocab_chunk_size
+
+        # skip the not in vocab row, it isnt a word (row i here is id i + 1)
+        vectors = table.vectors[niv_id + 1:].to(self.device)
+        self.normed_vectors = vectors / vectors.norm(dim=1, keepdim=True).clamp_min(1e-12)
+
+    def similarities_topk(self, vectors: torch.Tensor, k: int = 1) -> tuple[torch.Tensor, torch.Tensor]:
+        """
+        finds the k most similar vocab entries for every vector
+
+        Args:
+            vectors (torch.Tensor): tensor of shape (..., vector_size)
+            k (int): how many matches to return per vector
+
+        Returns:
+            torch.Tensor: cosine similarities of shape (..., k), best first
+            torch.Tensor: matching token ids of shape (..., k)
+        """
+
+        shape = vectors.shape[:-1]
+
+        queries = vectors.reshape(-1, vectors.shape[-1]).to(self.device, dtype=torch.float32)
+        queries = queries / queries.norm(dim=1, keepdim=True).clamp_min(1e-12)
+
+        num_vectors = self.table.vocab_size - (niv_id + 1)
+        chunk_size = self.vocab_chunk_size or num_vectors
+
+        best_sims = None
+        best_ids = None
+
+        # go over the vocab in chunks, only ever holding (queries, chunk_size) similarities
+        for chunk_start in range(0, num_vectors, chunk_size):
+            sims = self.chunk_similarities(queries, chunk_start, chunk_start + chunk_size)
+            chunk_sims, chunk_ids = sims.topk(min(k, sims.shape[1]), dim=1)
+            chunk_ids += chunk_start + niv_id + 1
+
+            if best_sims is None:
+                best_sims, best_ids = chunk_sims, chunk_ids
+            else:
+                merged_sims = torch.cat((best_sims, chunk_sims), dim=1)
+                merged_ids = torch.cat((best_ids, chunk_ids), dim=1)
+
+                best_sims, order = merged_sims.topk(k, dim=1)
+                best_ids = merged_ids.gather(1, order)
+
+        return best_sims.reshape(*shape, -1), best_ids.reshape(*shape, -1)
+
+    def chunk_similarities(self, queries: torch.Tensor, chunk_start: int, chunk_end: int) -> torch.Tensor:
+        """
+        cosine similarities of normalised (queries, vector_size) queries to the vocab rows chunk_start...chunk_end (row i is id i + 1)
+        """
+
+        return queries @ self.normed_vectors[chunk_start:chunk_end].T
+
+    def decode_ids(self, vectors: torch.Tensor) -> torch.Tensor:
+        """
+        decodes vectors to token ids, vectors with no match above NIV_threshold get niv_id
+
+        Args:
+            vectors (torch.Tensor): tensor of shape (..., vector_size)
+
+        Returns:
+            torch.Tensor: int64 ids of shape (...), on the decoder's device
+        """
+
+        sims, ids = self.similarities_topk(vectors, 1)
+
+        return torch.where(sims[..., 0] > self.NIV_threshold, ids[..., 0], niv_id)
+
+    def decode(self, vectors: torch.Tensor) -> list:
+        """
+        decodes vectors to tokens
+
+        Args:
+            vectors (torch.Tensor): tensor of shape (batch, vector_size) or (batch, seq, vector_size)
+
+        Returns:
+            list: list of tokens (nested list of tokens per batch for 3d input)
+        """
+
+        ids = self.decode_ids(vectors).cpu().tolist()
+
+        return self.ids_to_tokens(ids)
+
+    def ids_to_tokens(self, ids):
+        if isinstance(ids, list):
+            return [self.ids_to_tokens(current) for current in ids]
+
+        return self.not_in_vocab_token if ids == niv_id else self.table.id_to_token[ids]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="build a memory mapped embedding store (see mapped_embedding_table) from a word2vec model")
+    parser.add_argument("--model", required=True, help="word2vec model, e.g. ./embedding_models/b4cksh0t5_checkp3.model")
+    parser.add_argument("--out", required=True, help="store directory to write")
+    args = parser.parse_args()
+
+    from gensim.models import Word2Vec
+
+    table = embedding_table.from_model(Word2Vec.load(args.model))
+    save_store(table, args.out)
+
+    print(f"{args.model} ---> {args.out}: {table.vocab_size} ids x {table.vector_size} dims")
@@ -0,0 +1,134 @@
+import os
+import copy
+import json
+import argparse
+import warnings
+import torch
+import torch.nn as nn
+import embedding_table
+from rean_model import REAN
+
+artifact_file = "artifact.json"
+vocab_file = "vocab.json"
+graph_files = {"torchscript": "graph.pt", "onnx": "graph.onnx"}
+
+class next_token_graph(nn.Module):
+    """
+    the whole next token step in one module: embedding lookup ---> REAN.predict (with the rows' lengths) ---> nearest token decoding, token ids in and token ids out.\n
+    the embedding matrix and the normalised decoding matrix are buffers of the module, so the exported graph needs nothing but the vocab list next to it.
+    decodes exactly like nearest_token_decoder (same normalisation, top-1, NIV_threshold)
+    """
+
+    def __init__(self, net: REAN, table: embedding_table.embedding_table, NIV_threshold: float=0.01):
+        super(next_token_graph, self).__init__()
+
+        self.net = net
+        self.NIV_threshold = NIV_threshold
+
+        vectors = table.vectors.detach().to(torch.float32).clone()
+        decode_vectors = vectors[embedding_table.niv_id + 1:]
+
+        self.register_buffer("vectors", vectors)
+        self.register_buffer("normed_vectors", decode_vectors / decode_vectors.norm(dim=1, keepdim=True).clamp_min(1e-12))
+
+    def forward(self, window_ids: torch.Tensor, lengths: torch.Tensor) -> torch.Tensor:
+        """
+        Args:
+            window_ids (torch.Tensor): (batch, context_length) int64 ids, left padded with niv_id
+            lengths (torch.Tensor): (batch,) int64 real tokens at the end of each row (the padding before them is masked, see REAN.forward)
+
+        Returns:
+            torch.Tensor: (batch,) int64 id of the next token (niv_id if nothing is similar enough)
+        """
+
+        prediction = self.net.predict(self.vectors[window_ids], lengths)
+
+        queries = prediction.to(torch.float32)
+        queries = queries / queries.norm(dim=1, keepdim=True).clamp_min(1e-12)
+
+        best_sims, best_ids = (queries @ self.normed_vectors.T).topk(1, dim=1)
+
+        return torch.where(best_sims[:, 0] > self.NIV_threshold, best_ids[:, 0] + embedding_table.niv_id + 1, torch.full_like(best_ids[:, 0], embedding_table.niv_id))
+
+def export(net: REAN, table: embedding_table.embedding_table, out_dir: str, context_length: int, export_format: str="torchscript",
+           NIV_threshold: float=0.01, not_in_vocab_token: str="[NIV]", source: str=None) -> str:
+    """
+    writes a self contained cpu inference artifact: the traced / exported next_token_graph + the vocab + a small json describing them.\n
+    rean_runtime.py loads it with nothing but torch (or onnxruntime) and the tokenizer, no model classes, gensim or training script
+
+    Args:
+        net (REAN): the trained net
+        table (embedding_table): its vocab table
+        out_dir (str): artifact directory (made if missing)
+        context_length (int): window length the graph is traced for (the net's context length)
+        export_format (str): "torchscript" (torch.jit.trace + freeze) or "onnx" (needs the onnx package)
+        NIV_threshold (float): decoding threshold, see nearest_token_decoder
+        not_in_vocab_token (str): token the runtime returns for niv_id
+        source (str): where the weights came from, only recorded in artifact.json
+
+    Returns:
+        str: path of the written graph file
+    """
+
+    if export_format not in graph_files:
+        raise ValueError(f"export_format has to be one of {list(graph_files)}, got {export_format}")
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    # a cpu copy, the caller's net stays where it is
+    graph = next_token_graph(copy.deepcopy(net).cpu().eval(), table, NIV_threshold).eval()
+
+    # batch 2 so the batch dim is traced as a dimension, not a constant
+    example_ids = torch.zeros((2, context_length), dtype=torch.int64)
+    example_lengths = torch.full((2,), context_length, dtype=torch.int64)
+    graph_path = os.path.join(out_dir, graph_files[export_format])
+
+    with torch.no_grad(), warnings.catch_warnings():
+        # the table lookups in positional_encoding / causal_mask are python branches, fixed for the traced context_length
+        warnings.simplefilter("ignore", torch.jit.TracerWarning)
+
+        if export_format == "torchscript":
+            traced = torch.jit.freeze(torch.jit.trace(graph, (example_ids, example_lengths)))
+            torch.jit.save(traced, graph_path + ".tmp")
+        else:
+            torch.onnx.export(graph, (example_ids, example_lengths), graph_path + ".tmp", input_names=["window_ids", "lengths"], output_names=["next_ids"],
+                              dynamic_axes={"window_ids": {0: "batch"}, "lengths": {0: "batch"}, "next_ids": {0: "batch"}}, opset_version=17, dynamo=False)
+
+    os.replace(graph_path + ".tmp", graph_path)
+
+    with open(os.path.join(out_dir, vocab_file), "w", encoding="utf-8") as file:
+        json.dump(table.id_to_token, file, ensure_ascii=False)
+
+    with open(os.path.join(out_dir, artifact_file), "w") as file:
+        json.dump({"format": export_format, "graph": graph_files[export_format], "context_length": context_length, "vector_size": table.vector_size,
+                   "vocab_size": table.vocab_size, "niv_id": embedding_table.niv_id, "not_in_vocab_token": not_in_vocab_token,
+                   "NIV_threshold": NIV_threshold, "source": source}, file, indent=4)
+
+    return graph_path
+
+if __name__ == "__main__":
+    import inference_server
+
+    parser = argparse.ArgumentParser(description="export a REAN checkpoint + its embeddings as a self contained cpu inference artifact (load it with rean_runtime.py)")
+    parser.add_argument("--checkpoint", required=True, help="checkpoint_manager checkpoint from the training run")
+    parser.add_argument("--embeddings-store", default="./embedding_models/b4cksh0t5_checkp3_store", help="embedding store (see embedding_table.py), used if --model isnt given")
+    parser.add_argument("--model", default=None, help="word2vec model instead of the store")
+    parser.add_argument("--out", required=True, help="artifact directory")
+    parser.add_argument("--format", default="torchscript", choices=list(graph_files))
+    parser.add_argument("--context-length", type=int, default=128, help="only used if the checkpoint doesnt record it")
+    parser.add_argument("--niv-threshold", type=float, default=0.01)
+    parser.add_argument("--niv-token", default="[NIV]")
+    args = parser.parse_args()
+
+    if args.model is not None:
+        from gensim.models import Word2Vec
+
+        table = embedding_table.embedding_table.from_model(Word2Vec.load(args.model))
+    else:
+        table = embedding_table.mapped_embedding_table(args.embeddings_store)
+
+    net, context_length = inference_server.load_net(args.checkpoint, torch.device("cpu"), args.context_length)
+
+    graph_path = export(net, table, args.out, context_length, args.format, args.niv_threshold, args.niv_token, source=os.path.abspath(args.checkpoint))
+
+    print(f"{args.checkpoint} ---> {graph_path} ({os.path.getsize(graph_path) / 1024 ** 2:.1f}MB, context_length {context_length}, vocab {table.vocab_size})")
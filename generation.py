@@ -0,0 +1,186 @@
+import torch
+from tqdm import tqdm
+import embedding_table
+import runtime
+
+def fit_ids(window: torch.Tensor, width: int) -> torch.Tensor:
+    """
+    keeps the last width columns of a (batch, positions) id window, left padding it with niv_id if it is shorter
+    """
+
+    if window.size(1) >= width:
+        return window[:, window.size(1) - width:]
+
+    padding = torch.full((window.size(0), width - window.size(1)), embedding_table.niv_id, dtype=window.dtype, device=window.device)
+
+    return torch.cat((padding, window), dim=1)
+
+def predict_sequences(prompts: list[list[str]], num_tokens: int, net, table: embedding_table.embedding_table, decoder: embedding_table.nearest_token_decoder, context_length: int = 128, batch_size: int = 64, display_tqdm=False) -> list[list[str]]:
+    """
+    batched version of predict_sequence: generates num_tokens tokens for many prompts at once, stepping the whole batch thru net.predict together.\n
+    every prompt keeps its last context_length tokens. the prompts are sorted by length and each batch runs at its length bucket (runtime.length_bucket),
+    the shorter rows left padded and masked (REAN's lengths), so each row gives the same tokens as predict_sequence on that prompt alone and short prompts run at short shapes.
+    the window is kept as token ids on the net's device, so a step is one gather + one forward + one decode for the whole batch
+
+    Args:
+        prompts (list[list[str]]): tokenized prompts, can all be different lengths
+        num_tokens (int): how many tokens to generate per prompt
+        net (REAN): the net
+        table (embedding_table): vocab table used to vectorize the windows
+        decoder (nearest_token_decoder): decoder used to turn predictions back into tokens
+        context_length (int): window length, keep at the net's context length
+        batch_size (int): max prompts per forward (more prompts than this are done in several batches)
+
+    Returns:
+        list[list[str]]: the generated tokens for every prompt (without the prompt), in the same order as prompts
+    """
+
+    used_device = next(net.parameters()).device
+
+    prompt_lengths = [min(len(prompt), context_length) for prompt in prompts]
+    order = sorted(range(len(prompts)), key=lambda prompt_idx: prompt_lengths[prompt_idx])
+
+    results = [None] * len(prompts)
+
+    for batch_start in range(0, len(prompts), batch_size):
+        batch_rows = order[batch_start:batch_start + batch_size]
+
+        # the shortest / longest row, tracked on the host so picking the shape never syncs
+        min_length = prompt_lengths[batch_rows[0]]
+        max_length = prompt_lengths[batch_rows[-1]]
+
+        # (batch, bucket) ids, left padded with niv_id
+        window = table.batch_ids([prompts[row] for row in batch_rows], runtime.length_bucket(max_length, context_length)).to(used_device)
+        lengths = torch.tensor([prompt_lengths[row] for row in batch_rows], device=used_device)
+        generated = torch.empty((len(batch_rows), num_tokens), dtype=torch.int64, device=used_device)
+
+        with torch.no_grad():
+            for step in tqdm(range(num_tokens), disable=not display_tqdm):
+                # a batch without any padding runs the plain (is_causal) path
+                prediction_vectors = net.predict(table.vectorize_ids(window), lengths if min_length < window.size(1) else None)
+
+                # tokens decoded as not in vocab are fed back as niv_id, just like the "[NIV]" string vectorizes to the default vector
+                generated[:, step] = decoder.decode_ids(prediction_vectors).to(used_device)
+
+                # add the new token, the window grows into the next bucket once the longest row fills it and slides once it is context_length
+                min_length = min(min_length + 1, context_length)
+                max_length = min(max_length + 1, context_length)
+                lengths = (lengths + 1).clamp(max=context_length)
+
+                window = fit_ids(torch.cat((window, generated[:, step:step + 1]), dim=1), runtime.length_bucket(max_length, context_length))
+
+        for row, tokens in zip(batch_rows, decoder.ids_to_tokens(generated.cpu().tolist())):
+            results[row] = tokens
+
+    return results
+
+class generation_session:
+    """
+    incremental generation for a single prompt with the same window as predict_sequences (the last context_length tokens),
+    but the window lives on the net's device as a ring buffer of token vectors: each step is one forward + one decode + an in place write of the new token's vector.
+    nothing goes thru the host per step (no re-vectorizing of the history, no pad / cat, no copy to the device), only stream() reads each token back as it comes out.\n
+    the ring is stored twice back to back, so the window (oldest ---> newest) is always a contiguous slice of it.
+    until the window is full only the real tokens are run (no padding), so a short prompt costs its own length and not context_length
+    """
+
+    def __init__(self, net, table: embedding_table.embedding_table, decoder: embedding_table.nearest_token_decoder, prompt: list[str] = None, context_length: int = 128):
+        """
+        Args:
+            net (REAN): the net
+            table (embedding_table): vocab table used to vectorize tokens
+            decoder (nearest_token_decoder): decoder used to turn predictions back into tokens
+            prompt (list[str]): tokenized prompt (None ---> start from an all padding window)
+            context_length (int): window length, keep at the net's context length
+        """
+
+        self.net = net
+        self.table = table
+        self.decoder = decoder
+        self.context_length = context_length
+        self.used_device = next(net.parameters()).device
+
+        self.ring = torch.zeros((2 * context_length, table.vector_size), dtype=torch.float32, device=self.used_device)
+        self.position = 0               # slot the next token goes into (the window starts right after it)
+        self.length = 0                 # real tokens in the window (up to context_length)
+        self.generated_ids = []         # (1,) id tensors on the device, one per generated token
+
+        if prompt:
+            self.append_ids(table.ids(prompt[-context_length:]).to(self.used_device))
+
+    def window(self) -> torch.Tensor:
+        """
+        returns the current (tokens, vector_size) window, oldest token first (a view into the ring, not a copy).\n
+        only the real tokens, an empty window is a single padding vector (like predict_sequence_cached's empty prompt)
+        """
+
+        return self.ring[self.position + self.context_length - max(self.length, 1):self.position + self.context_length]
+
+    def append_ids(self, ids: torch.Tensor):
+        """
+        writes the vectors of ids (1d, on the ring's device) into the ring in place, the oldest tokens fall out of the window
+        """
+
+        vectors = self.table.vectorize_ids(ids, self.used_device)
+
+        if len(ids) == 1:
+            self.ring[self.position] = vectors[0]
+            self.ring[self.position + self.context_length] = vectors[0]
+        else:
+            slots = (torch.arange(len(ids), device=self.used_device) + self.position) % self.context_length
+            self.ring[slots] = vectors
+            self.ring[slots + self.context_length] = vectors
+
+        self.position = (self.position + len(ids)) % self.context_length
+        self.length = min(self.length + len(ids), self.context_length)
+
+    def step(self) -> torch.Tensor:
+        """
+        generates one token and appends it to the window
+
+        Returns:
+            torch.Tensor: (1,) id of the token (niv_id if it was decoded as not in vocab), on the device
+        """
+
+        with torch.no_grad():
+            prediction_vector = self.net.predict(self.window().unsqueeze(0))
+
+        # not in vocab is fed back as niv_id, just like the "[NIV]" string vectorizes to the default vector
+        token_id = self.decoder.decode_ids(prediction_vector).to(self.used_device)
+
+        self.append_ids(token_id)
+        self.generated_ids.append(token_id)
+
+        return token_id
+
+    def stream(self, num_tokens: int):
+        """
+        generator version of generate(), yields every token as soon as it is decoded (one small device ---> host copy per token)
+
+        Args:
+            num_tokens (int): how many tokens to generate
+
+        Yields:
+            str: the next token
+        """
+
+        for _ in range(num_tokens):
+            yield self.decoder.ids_to_tokens(self.step().item())
+
+    def generate(self, num_tokens: int, display_tqdm=False) -> list[str]:
+        """
+        generates num_tokens tokens, the ids only come back to the host once at the end
+
+        Returns:
+            list[str]: the generated tokens
+        """
+
+        new_ids = [self.step() for _ in tqdm(range(num_tokens), disable=not display_tqdm)]
+
+        return self.decoder.ids_to_tokens(torch.cat(new_ids).cpu().tolist()) if new_ids else []
+
+    def tokens(self) -> list[str]:
+        """
+        everything generated in this session so far
+        """
+
+        return self.decoder.ids_to_tokens(torch.cat(self.generated_ids).cpu().tolist()) if self.generated_ids else []
@@ -0,0 +1,428 @@
+import json
+import time
+import asyncio
+import argparse
+from collections import deque
+import torch
+import tokenizer
+import embedding_table
+import runtime
+import quantization
+import generation
+from rean_model import REAN
+
+def load_net(path: str, device: torch.device, context_length: int=128) -> tuple[REAN, int]:
+    """
+    loads a REAN for inference from a checkpoint_manager checkpoint (state_dict + config)
+
+    Args:
+        path (str): checkpoint file
+        device (torch.device): device to put the net on
+        context_length (int): context length to use if the checkpoint config doesnt record it
+
+    Returns:
+        REAN: the net, in eval mode
+        int: its context length
+    """
+
+    checkpoint = torch.load(path, map_location=device, weights_only=False)
+    config = checkpoint["config"]
+    context_length = config.get("context_length", context_length)
+
+    net = REAN(vector_size=config["vector_size"], attn_heads=config["attn_heads"], max_context_length=context_length).to(device)
+    net.load_state_dict(checkpoint["model"])
+
+    return net.eval(), context_length
+
+class latency_stats:
+    """
+    counters + recent latencies (time to first token, total) for the /metrics endpoint
+    """
+
+    def __init__(self, window: int=10000):
+        self.start = time.perf_counter()
+
+        self.requests = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.failed = 0
+        self.tokens = 0
+        self.steps = 0
+        self.batched_rows = 0
+
+        self.first_token_latencies = deque(maxlen=window)
+        self.total_latencies = deque(maxlen=window)
+
+    @staticmethod
+    def percentiles(values) -> dict:
+        if not values:
+            return {}
+
+        values = sorted(values)
+
+        return {f"p{percentile}_ms": values[min(int(len(values) * percentile / 100), len(values) - 1)] * 1000 for percentile in (50, 90, 99)} | {"max_ms": values[-1] * 1000}
+
+    def report(self, active: int, waiting: int) -> dict:
+        uptime = time.perf_counter() - self.start
+
+        return {"uptime_s": uptime,
+                "requests": self.requests,
+                "completed": self.completed,
+                "cancelled": self.cancelled,
+                "failed": self.failed,
+                "active": active,
+                "waiting": waiting,
+                "tokens_generated": self.tokens,
+                "tokens_per_s": self.tokens / max(uptime, 1e-9),
+                "batch_steps": self.steps,
+                "mean_batch_size": self.batched_rows / max(self.steps, 1),
+                "time_to_first_token": self.percentiles(self.first_token_latencies),
+                "latency": self.percentiles(self.total_latencies)}
+
+class completion_request:
+    """
+    one prompt being completed: its id window on the device (the last context_length tokens, unpadded) and the queue its tokens are streamed thru
+    (None marks the end, an exception means its step failed and no more tokens come)
+    """
+
+    def __init__(self, window: torch.Tensor, max_tokens: int):
+        self.window = window
+        self.remaining = max_tokens
+        self.tokens = asyncio.Queue()
+        self.cancelled = False
+
+        self.arrived = time.perf_counter()
+        self.first_token = None
+
+class dynamic_batcher:
+    """
+    coalesces concurrent completion requests into batched net.predict steps.\n
+    every step runs ALL active requests (up to max_batch) together, new requests join at the next step and finished ones leave, so nobody waits for a whole batch to finish.
+    when the batcher is idle, the first request waits up to max_wait_ms for others to arrive, so a burst shares its steps from the start.
+    the requests of a step are grouped by length bucket (one forward per bucket), each row windowed / padded exactly like generation.predict_sequences,
+    so a request gets the same tokens as it would alone and short prompts dont pay for context_length positions
+    """
+
+    def __init__(self, net: REAN, table: embedding_table.embedding_table, decoder: embedding_table.nearest_token_decoder, context_length: int=128, max_batch: int=32, max_wait_ms: float=5, bf16: bool=False):
+        """
+        Args:
+            net (REAN): the net (eval mode)
+            table (embedding_table): vocab table for the windows
+            decoder (nearest_token_decoder): decoder for the predictions
+            context_length (int): window length, keep at the net's context length
+            max_batch (int): max requests per step (the rest wait in line)
+            max_wait_ms (float): how long an idle batcher waits for more requests before the first step
+            bf16 (bool): bfloat16 autocast on cpu (see runtime.autocast)
+        """
+
+        self.net = net
+        self.table = table
+        self.decoder = decoder
+        self.context_length = context_length
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.bf16 = bf16
+
+        self.device = next(net.parameters()).device
+
+        self.waiting = deque()
+        self.active = []
+        self.wakeup = asyncio.Event()
+
+        self.stats = latency_stats()
+
+    def submit(self, prompt: str, max_tokens: int) -> completion_request:
+        """
+        queues a prompt, the tokens come out of the returned request's .tokens queue
+        """
+
+        window = self.table.ids(tokenizer.tokenize_segment(prompt)[-self.context_length:]).to(self.device)
+        request = completion_request(window, max_tokens)
+
+        self.stats.requests += 1
+
+        if max_tokens <= 0:
+            request.tokens.put_nowait(None)
+            return request
+
+        self.waiting.append(request)
+        self.wakeup.set()
+
+        return request
+
+    def step(self, windows: list[torch.Tensor]) -> tuple[torch.Tensor, list[torch.Tensor]]:
+        # one forward per length bucket + one decode for the whole batch (runs in a worker thread, torch releases the gil)
+        buckets = {}
+
+        for row, window in enumerate(windows):
+            buckets.setdefault(runtime.length_bucket(len(window), self.context_length), []).append(row)
+
+        prediction_vectors = [None] * len(windows)
+
+        with torch.no_grad(), runtime.autocast(self.device, self.bf16):
+            for width, rows in buckets.items():
+                bucket_windows = torch.stack([generation.fit_ids(windows[row].unsqueeze(0), width)[0] for row in rows])
+                lengths = torch.tensor([len(windows[row]) for row in rows], device=self.device)
+
+                bucket_predictions = self.net.predict(self.table.vectorize_ids(bucket_windows), lengths if min(len(windows[row]) for row in rows) < width else None)
+
+                for row, prediction_vector in zip(rows, bucket_predictions):
+                    prediction_vectors[row] = prediction_vector
+
+        ids = self.decoder.decode_ids(torch.stack(prediction_vectors).float()).to(self.device)
+
+        # add the new token to every window (not in vocab ---> niv_id, like predict_sequences)
+        return ids, [torch.cat((window, ids[row:row + 1]))[-self.context_length:] for row, window in enumerate(windows)]
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            if not self.active and not self.waiting:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+
+                # idle ---> give a burst of requests a moment to arrive together
+                deadline = loop.time() + self.max_wait
+
+                while len(self.waiting) < self.max_batch and loop.time() < deadline:
+                    await asyncio.sleep(min(deadline - loop.time(), 0.001))
+
+            # drop requests whose clients went away, let waiting ones in
+            self.active = [request for request in self.active if not request.cancelled]
+
+            while self.waiting and len(self.active) < self.max_batch:
+                request = self.waiting.popleft()
+
+                if not request.cancelled:
+                    self.active.append(request)
+
+            if not self.active:
+                continue
+
+            try:
+                ids, windows = await loop.run_in_executor(None, self.step, [request.window for request in self.active])
+                tokens = self.decoder.ids_to_tokens(ids.cpu().tolist())
+            except Exception as error:
+                # only this step's requests fail (their handlers answer with the error), the batcher keeps serving the rest
+                for request in self.active:
+                    request.remaining = 0
+                    request.tokens.put_nowait(error)
+
+                self.stats.failed += len(self.active)
+                self.active = []
+
+                continue
+
+            self.stats.steps += 1
+            self.stats.batched_rows += len(self.active)
+            now = time.perf_counter()
+
+            still_active = []
+
+            for row, request in enumerate(self.active):
+                request.window = windows[row]
+                request.remaining -= 1
+                request.tokens.put_nowait(tokens[row])
+
+                self.stats.tokens += 1
+
+                if request.first_token is None:
+                    request.first_token = now
+                    self.stats.first_token_latencies.append(now - request.arrived)
+
+                if request.remaining == 0:
+                    request.tokens.put_nowait(None)
+
+                    self.stats.completed += 1
+                    self.stats.total_latencies.append(now - request.arrived)
+                else:
+                    still_active.append(request)
+
+            self.active = still_active
+
+class inference_server:
+    """
+    minimal asyncio HTTP/1.1 server (stdlib only) in front of a dynamic_batcher.\n
+    POST /complete   {"prompt": str, "max_tokens": int, "stream": bool}
+                     stream ---> chunked newline delimited json, one {"token": str} per token and a final {"done": true, "completion": str}
+                     else   ---> {"completion": str, "tokens": int, "latency_ms": float}
+                     a failed batch step ---> 500 {"error": str}, or a final {"error": str} chunk when streaming
+    GET /metrics     counters + time to first token / total latency percentiles
+    GET /health      {"ok": true}
+    """
+
+    def __init__(self, batcher: dynamic_batcher, max_tokens_limit: int=1024):
+        self.batcher = batcher
+        self.max_tokens_limit = max_tokens_limit
+
+    async def serve(self, host: str="127.0.0.1", port: int=8080):
+        batcher_task = asyncio.create_task(self.batcher.run())
+
+        server = await asyncio.start_server(self.handle, host, port, backlog=1024)
+        print(f"serving REAN on http://{host}:{port}   (max batch {self.batcher.max_batch}, max wait {self.batcher.max_wait * 1000:.1f}ms, device {self.batcher.device})")
+
+        async with server:
+            await asyncio.gather(server.serve_forever(), batcher_task)
+
+    @staticmethod
+    async def read_request(reader: asyncio.StreamReader) -> tuple[str, str, bytes]:
+        request_line = (await reader.readline()).decode("latin-1").split()
+
+        if len(request_line) < 2:
+            return None, None, None
+
+        headers = {}
+
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+
+            if not line:
+                break
+
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        # a ValueError here is the client's fault, handle answers it with a 400
+        try:
+            content_length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise ValueError(f"bad Content-Length: {headers['content-length']!r}") from None
+
+        if content_length < 0:
+            raise ValueError(f"bad Content-Length: {content_length}")
+
+        body = await reader.readexactly(content_length)
+
+        return request_line[0], request_line[1], body
+
+    @staticmethod
+    async def respond(writer: asyncio.StreamWriter, status: str, payload: dict):
+        body = json.dumps(payload).encode()
+
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        request = None
+
+        try:
+            try:
+                method, path, body = await self.read_request(reader)
+            except ValueError as error:
+                await self.respond(writer, "400 Bad Request", {"error": str(error)})
+                return
+
+            if method == "GET" and path == "/health":
+                await self.respond(writer, "200 OK", {"ok": True})
+
+            elif method == "GET" and path == "/metrics":
+                await self.respond(writer, "200 OK", self.batcher.stats.report(len(self.batcher.active), len(self.batcher.waiting)))
+
+            elif method == "POST" and path == "/complete":
+                try:
+                    payload = json.loads(body or b"{}")
+
+                    if not isinstance(payload, dict):
+                        raise TypeError(f"the body has to be a json object, got {type(payload).__name__}")
+
+                    prompt = str(payload.get("prompt", ""))
+                    max_tokens = min(int(payload.get("max_tokens", 64)), self.max_tokens_limit)
+                    stream = bool(payload.get("stream", False))
+                except (ValueError, TypeError, AttributeError) as error:
+                    await self.respond(writer, "400 Bad Request", {"error": str(error)})
+                    return
+
+                request = self.batcher.submit(prompt, max_tokens)
+
+                if stream:
+                    await self.stream_tokens(writer, request)
+                else:
+                    tokens = []
+
+                    while (token := await request.tokens.get()) is not None:
+                        if isinstance(token, Exception):
+                            await self.respond(writer, "500 Internal Server Error", {"error": f"generation failed: {token!r}"})
+                            return
+
+                        tokens.append(token)
+
+                    await self.respond(writer, "200 OK", {"completion": tokenizer.detokenize_segment(tokens), "tokens": len(tokens), "latency_ms": (time.perf_counter() - request.arrived) * 1000})
+
+            elif method is not None:
+                await self.respond(writer, "404 Not Found", {"error": f"no route for {method} {path}"})
+
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            # stop generating for clients that went away
+            if request is not None and request.remaining > 0:
+                request.cancelled = True
+                self.batcher.stats.cancelled += 1
+
+            writer.close()
+
+    @staticmethod
+    async def stream_tokens(writer: asyncio.StreamWriter, request: completion_request):
+        def chunk(payload: dict) -> bytes:
+            data = (json.dumps(payload) + "\n").encode()
+            return f"{len(data):x}\r\n".encode() + data + b"\r\n"
+
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+
+        tokens = []
+
+        while (token := await request.tokens.get()) is not None:
+            # the status line is already sent, a failed step ends the stream with an error chunk instead of the done one
+            if isinstance(token, Exception):
+                writer.write(chunk({"error": f"generation failed: {token!r}"}) + b"0\r\n\r\n")
+                await writer.drain()
+                return
+
+            tokens.append(token)
+
+            writer.write(chunk({"token": token}))
+            await writer.drain()
+
+        writer.write(chunk({"done": True, "completion": tokenizer.detokenize_segment(tokens), "latency_ms": (time.perf_counter() - request.arrived) * 1000}) + b"0\r\n\r\n")
+        await writer.drain()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="REAN completion server with dynamic request batching")
+    parser.add_argument("--checkpoint", required=True, help="checkpoint_manager checkpoint from the training run")
+    parser.add_argument("--embeddings-store", default="./embedding_models/b4cksh0t5_checkp3_store", help="embedding store (see embedding_table.py), shared with the other processes thru the page cache, used if --model isnt given")
+    parser.add_argument("--model", "--embeddings-model", dest="model", default=None, help="word2vec model instead of the store (its own copy per process)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--device", default=None, help="default: cuda if there is one, else cpu")
+    parser.add_argument("--context-length", type=int, default=128, help="only used if the checkpoint config doesnt record it")
+    parser.add_argument("--max-batch", type=int, default=32, help="max requests per batched step")
+    parser.add_argument("--max-wait-ms", type=float, default=5, help="how long an idle server waits to batch up a burst of requests")
+    parser.add_argument("--max-tokens-limit", type=int, default=1024, help="cap on max_tokens per request")
+    parser.add_argument("--bf16", action="store_true", help="bfloat16 autocast on cpu")
+    parser.add_argument("--quantize", choices=["int8", "fp16"], default=None, help="quantized net + embedding table (cpu only, see quantization.py)")
+    args = parser.parse_args()
+
+    run_device = runtime.pick_device(args.device)
+    runtime.configure_threads(run_device)
+
+    # everything is loaded once, up front
+    if args.model is not None:
+        from gensim.models import Word2Vec
+
+        table = embedding_table.embedding_table.from_model(Word2Vec.load(args.model))
+    else:
+        table = embedding_table.mapped_embedding_table(args.embeddings_store)
+
+    decoder = embedding_table.nearest_token_decoder(table, device=run_device)
+    net, context_length = load_net(args.checkpoint, run_device, args.context_length)
+
+    if args.quantize is not None:
+        if run_device.type != "cpu":
+            raise ValueError("--quantize only works on the cpu, pass --device cpu")
+
+        net, table, decoder = quantization.quantize_for_inference(net, table, args.quantize)
+
+    batcher = dynamic_batcher(net, table, decoder, context_length, args.max_batch, args.max_wait_ms, args.bf16)
+
+    asyncio.run(inference_server(batcher, args.max_tokens_limit).serve(args.host, args.port))
@@ -0,0 +1,194 @@
+import os
+import time
+import resource
+import contextlib
+from collections import defaultdict
+import torch
+
+class stage_timer:
+    """
+    opt-in wall time per stage of the training loop (data wait, host to device copy, forward, backward, optimizer step, eval, ...) + examples/sec, tokens/sec and peak memory.\n
+    when disabled, stage() hands back one shared no-op context and iterate() the iterable itself, so leaving the calls in the loop costs next to nothing.
+    when enabled, the device is synced at every stage boundary (otherwise gpu work just shows up in whatever stage syncs next), so it slows the run down a little
+    """
+
+    def __init__(self, device: torch.device, enabled: bool=False):
+        """
+        Args:
+            device (torch.device): the run device (synced around stages, peak memory is read from it)
+            enabled (bool): False ---> everything is a no-op
+        """
+
+        self.device = torch.device(device)
+        self.enabled = enabled
+
+        self.no_op = contextlib.nullcontext()
+
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.examples = 0
+        self.tokens = 0
+        self.start = time.perf_counter()
+
+    def sync(self):
+        if self.device.type == "cuda":
+            torch.cuda.synchronize(self.device)
+
+    def stage(self, name: str):
+        """
+        context manager timing the code inside it as stage name (also labels it in torch.profiler traces)
+        """
+
+        if not self.enabled:
+            return self.no_op
+
+        return self.timed(name)
+
+    @contextlib.contextmanager
+    def timed(self, name: str):
+        self.sync()
+        start = time.perf_counter()
+
+        with torch.profiler.record_function(name):
+            yield
+
+        self.sync()
+
+        self.seconds[name] += time.perf_counter() - start
+        self.calls[name] += 1
+
+    def iterate(self, iterable, name: str="data_wait"):
+        """
+        wraps an iterable (e.g. a DataLoader) and times every next() as stage name, which is how long the loop waited on the workers
+        """
+
+        if not self.enabled:
+            return iterable
+
+        return self.timed_iterate(iterable, name)
+
+    def timed_iterate(self, iterable, name: str):
+        iterator = iter(iterable)
+
+        while True:
+            start = time.perf_counter()
+
+            try:
+                with torch.profiler.record_function(name):
+                    item = next(iterator)
+            except StopIteration:
+                return
+
+            self.seconds[name] += time.perf_counter() - start
+            self.calls[name] += 1
+
+            yield item
+
+    def count(self, examples: int, tokens: int):
+        if self.enabled:
+            self.examples += examples
+            self.tokens += tokens
+
+    def peak_memory_mb(self) -> float:
+        """
+        peak memory since the last report: allocated device memory on cuda, else the peak rss of the process (over its whole life)
+        """
+
+        if self.device.type == "cuda":
+            return torch.cuda.max_memory_allocated(self.device) / 1024 ** 2
+
+        # ru_maxrss is in KB on linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    def report(self) -> dict:
+        """
+        returns {tensorboard tag: value} for everything since the last report and starts counting again
+
+        Returns:
+            dict[str, float]: stage_ms/<stage> (mean ms per call), stage_share/<stage> (fraction of the wall time), examples_per_sec, tokens_per_sec, peak_memory_mb
+        """
+
+        if not self.enabled:
+            return {}
+
+        now = time.perf_counter()
+        wall = max(now - self.start, 1e-9)
+
+        scalars = {}
+
+        for name, seconds in self.seconds.items():
+            scalars[f"stage_ms/{name}"] = seconds * 1000 / self.calls[name]
+            scalars[f"stage_share/{name}"] = seconds / wall
+
+        scalars["examples_per_sec"] = self.examples / wall
+        scalars["tokens_per_sec"] = self.tokens / wall
+        scalars["peak_memory_mb"] = self.peak_memory_mb()
+
+        if self.device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats(self.device)
+
+        self.seconds.clear()
+        self.calls.clear()
+        self.examples = 0
+        self.tokens = 0
+        self.start = now
+
+        return scalars
+
+class profiler_window:
+    """
+    runs torch.profiler for num_batches batches starting at start_batch, then writes a chrome trace (open in chrome://tracing or perfetto) to trace_dir.\n
+    call step(batch) once at the start of every batch. with start_batch=None it never does anything
+    """
+
+    def __init__(self, start_batch: int, num_batches: int, trace_dir: str, device: torch.device):
+        """
+        Args:
+            start_batch (int): first batch to capture (None ---> off)
+            num_batches (int): how many batches to capture
+            trace_dir (str): where the trace goes
+            device (torch.device): the run device (cuda activity is captured on gpu)
+        """
+
+        self.start_batch = start_batch
+        self.num_batches = num_batches
+        self.trace_dir = trace_dir
+        self.device = torch.device(device)
+
+        self.profiler = None
+
+    def step(self, batch: int):
+        if self.start_batch is None:
+            return
+
+        if batch == self.start_batch:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+
+            if self.device.type == "cuda":
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+
+            self.profiler = torch.profiler.profile(activities=activities, profile_memory=True)
+            self.profiler.start()
+
+        elif batch == self.start_batch + self.num_batches:
+            self.close()
+
+    def close(self):
+        """
+        stops the capture early (e.g. training ended inside the window) and writes what there is
+        """
+
+        if self.profiler is None:
+            return
+
+        self.profiler.stop()
+
+        os.makedirs(self.trace_dir, exist_ok=True)
+        trace_path = os.path.join(self.trace_dir, f"trace_batch_{self.start_batch}.json")
+        self.profiler.export_chrome_trace(trace_path)
+
+        sort_by = "cuda_time_total" if self.device.type == "cuda" else "cpu_time_total"
+        print(self.profiler.key_averages().table(sort_by=sort_by, row_limit=20))
+        print(f"profiler trace written to {trace_path}")
+
+        self.profiler = None
@@ -0,0 +1,319 @@
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+import traceback
+import multiprocessing
+import torch
+import runtime
+import checkpointing
+import embedding_table
+from rean_model import REAN
+
+class loss_accumulator:
+    """
+    sums losses on the device they were computed on, so logging the train loss every batch doesnt force a device sync (.item()) every batch.\n
+    mean() gives the average since the last mean() as a device tensor, it only gets synced when something reads it (e.g. the writer thread)
+    """
+
+    def __init__(self):
+        self.total = None
+        self.count = 0
+
+    def add(self, loss_value: torch.Tensor, weight: int=1):
+        """
+        Args:
+            loss_value (torch.Tensor): scalar loss (detached here, so the graph isnt kept alive)
+            weight (int): how many samples the loss is the mean over (1 ---> plain mean over add() calls)
+        """
+
+        loss_value = loss_value.detach().float() * weight
+
+        self.total = loss_value if self.total is None else self.total + loss_value
+        self.count += weight
+
+    def mean(self) -> torch.Tensor:
+        """
+        returns the mean since the last call (None if nothing was added) and starts again
+        """
+
+        if self.total is None:
+            return None
+
+        mean = self.total / self.count
+
+        self.total = None
+        self.count = 0
+
+        return mean
+
+class async_summary_writer:
+    """
+    SummaryWriter that does its work on a background thread: add_scalar / add_text only put the call on a queue.\n
+    scalar values can be device tensors, they are turned into floats (and synced) on the writer thread, not in the training loop
+    """
+
+    def __init__(self, log_dir: str, max_queue: int=4096):
+        # imported here, so only processes that actually log need tensorboard
+        from torch.utils.tensorboard import SummaryWriter
+
+        self.writer = SummaryWriter(log_dir=log_dir)
+        self.calls = queue.Queue(maxsize=max_queue)
+
+        self.writer_thread = threading.Thread(target=self.writer_loop, daemon=True)
+        self.writer_thread.start()
+
+    def writer_loop(self):
+        while True:
+            call = self.calls.get()
+
+            try:
+                if call is None:
+                    return
+
+                name, args = call
+
+                if name == "add_scalar":
+                    tag, value, step = args
+                    self.writer.add_scalar(tag, float(value), step)
+                elif name == "add_text":
+                    self.writer.add_text(*args)
+                elif name == "flush":
+                    self.writer.flush()
+            except Exception:
+                # a failed call only loses that call, the thread keeps draining the queue (otherwise training blocks on it once it is full)
+                print(f"async_summary_writer: {call[0]} failed")
+                traceback.print_exc()
+            finally:
+                self.calls.task_done()
+
+    def add_scalar(self, tag: str, value, step: int):
+        if value is not None:
+            self.calls.put(("add_scalar", (tag, value, step)))
+
+    def add_text(self, tag: str, text: str, step: int):
+        self.calls.put(("add_text", (tag, text, step)))
+
+    def flush(self):
+        """
+        blocks until everything queued so far is written to disk
+        """
+
+        self.calls.put(("flush", ()))
+        self.calls.join()
+
+    def close(self):
+        self.flush()
+        self.calls.put(None)
+        self.writer_thread.join()
+        self.writer.close()
+
+def tensorize_eval_set(dataset, budget: int=None, seed: int=0) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    reads (a fixed random subset of) the test set ONCE into a (examples, context_length + 1) int32 token id tensor.\n
+    the same examples are used for every eval, so the test loss stays comparable between evals, and nothing is re-read or re-tokenized
+
+    Args:
+        dataset (REAN_dataset): the test dataset (uses its construct_ids, works in both dataset modes)
+        budget (int): how many examples to keep (None ---> all of them)
+        seed (int): seed for picking the subset
+
+    Returns:
+        torch.Tensor: int32 token ids
+        torch.Tensor: (examples,) int64 real input positions of every example (context_length, except for the ones left padded at EOF), see evaluate
+    """
+
+    generator = torch.Generator()
+    generator.manual_seed(seed)
+
+    indices = torch.randperm(len(dataset), generator=generator)[:budget].sort().values
+
+    eval_ids = []
+    eval_lengths = []
+
+    for idx in indices.tolist():
+        eval_ids.append(dataset.construct_ids(idx))
+
+        # the last real id is only a target
+        eval_lengths.append(max(dataset.num_ids - 1, 0))
+
+    return torch.stack(eval_ids), torch.tensor(eval_lengths, dtype=torch.int64)
+
+def evaluate(net, loss, eval_ids: torch.Tensor, table, batch_size: int=768, autocast: bool=True, eval_lengths: torch.Tensor=None) -> torch.Tensor:
+    """
+    mean loss of net over a tensorized eval set (see tensorize_eval_set), next token prediction like in training.\n
+    with eval_lengths, the examples left padded at EOF are grouped by length bucket (runtime.length_bucket) and run at that shape with the padding masked,
+    their loss only covers the real positions (each counts as the fraction of a full example it is). without them every example is a full window, exactly like training sees it.
+    the loss is accumulated on the device, so there is no sync until the result is read
+
+    Args:
+        net (REAN): the net (put into eval mode by the caller)
+        loss: loss function (mean reduction)
+        eval_ids (torch.Tensor): (examples, context_length + 1) token ids, ideally already on the net's device
+        table (embedding_table): table to vectorize the ids with
+        batch_size (int): examples per forward
+        autocast (bool): bf16 autocast on cpu (see runtime.autocast)
+        eval_lengths (torch.Tensor): (examples,) real input positions from tensorize_eval_set, on the cpu (None ---> no example is padded)
+
+    Returns:
+        torch.Tensor: scalar mean loss over all examples, on the net's device (0 for an empty eval set, e.g. a rank's empty slice, which reduce_weighted_mean then weighs by 0)
+    """
+
+    used_device = next(net.parameters()).device
+    total = loss_accumulator()
+    context_length = eval_ids.size(1) - 1
+
+    example_lengths = eval_lengths.tolist() if eval_lengths is not None else [context_length] * len(eval_ids)
+    padded_rows = sorted((row for row, length in enumerate(example_lengths) if length < context_length), key=lambda row: example_lengths[row])
+
+    # the full windows (all of them, unless some examples ran into EOF) in order
+    full_ids = eval_ids
+
+    if padded_rows:
+        full_ids = eval_ids[torch.tensor([row for row, length in enumerate(example_lengths) if length >= context_length], dtype=torch.int64, device=eval_ids.device)]
+
+    with torch.no_grad():
+        for batch_start in range(0, len(full_ids), batch_size):
+            vectorized_batch = table.vectorize_ids(full_ids[batch_start:batch_start + batch_size], used_device)
+
+            with runtime.autocast(used_device, autocast):
+                outputs = net(vectorized_batch[:, :-1])
+                loss_value = loss(outputs, vectorized_batch[:, 1:])
+
+            total.add(loss_value, len(vectorized_batch))
+
+        for batch_start in range(0, len(padded_rows), batch_size):
+            batch_rows = padded_rows[batch_start:batch_start + batch_size]
+            batch_lengths = [example_lengths[row] for row in batch_rows]
+
+            if not sum(batch_lengths):
+                continue
+
+            width = runtime.length_bucket(batch_lengths[-1], context_length)
+            batch_ids = eval_ids[torch.tensor(batch_rows, dtype=torch.int64, device=eval_ids.device)][:, -width - 1:]
+            vectorized_batch = table.vectorize_ids(batch_ids, used_device)
+            lengths = torch.tensor(batch_lengths, device=used_device)
+
+            with runtime.autocast(used_device, autocast):
+                outputs = net(vectorized_batch[:, :-1], lengths)
+
+                real = torch.arange(width, device=used_device).unsqueeze(0) >= (width - lengths).unsqueeze(1)
+                loss_value = loss(outputs[real], vectorized_batch[:, 1:][real])
+
+            total.add(loss_value, sum(batch_lengths) / context_length)
+
+    mean = total.mean()
+
+    return mean if mean is not None else torch.zeros((), device=used_device)
+
+def save_eval_set(path: str, eval_ids: torch.Tensor, vectors: torch.Tensor, eval_lengths: torch.Tensor=None):
+    """
+    saves the tensorized eval set (ids + real lengths) + the embedding matrix for checkpoint_evaluator (which runs without the word2vec model / dataset)
+    """
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    torch.save({"eval_ids": eval_ids.cpu(), "eval_lengths": eval_lengths, "vectors": vectors.cpu()}, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+def checkpoint_evaluator(save_dir: str, eval_set_path: str, log_dir: str, device: str=None, batch_size: int=768, autocast: bool=True, poll_seconds: float=10, stop_event=None):
+    """
+    evaluates every new checkpoint in save_dir (as tracked by checkpoints.json, see checkpointing.py), logs "test_loss" at its batch
+    and reports it back to the run's checkpoint_manager (checkpointing.report_test_loss), so the best checkpoint is still tracked.\n
+    meant to run in its own process (or on another machine / gpu), so evals never pause training. with stop_event it does one last pass once the event is set and returns
+
+    Args:
+        save_dir (str): checkpoint directory of the training run
+        eval_set_path (str): file written by save_eval_set
+        log_dir (str): tensorboard log dir (the training run's, the scalars end up in the same run)
+        device (str): device to evaluate on (None ---> runtime.pick_device())
+        batch_size (int): examples per forward
+        autocast (bool): bf16 autocast on cpu
+        poll_seconds (float): how often to look for a new checkpoint
+        stop_event: multiprocessing.Event, None ---> run forever
+    """
+
+    used_device = runtime.pick_device(device)
+    eval_set = torch.load(eval_set_path, map_location="cpu")
+
+    eval_ids = eval_set["eval_ids"].to(used_device)
+    eval_lengths = eval_set.get("eval_lengths")
+    table = embedding_table.embedding_table({}, eval_set["vectors"].numpy())
+    loss = torch.nn.MSELoss()
+
+    writer = async_summary_writer(log_dir)
+    index_path = os.path.join(save_dir, "checkpoints.json")
+    last_file = None
+
+    while True:
+        stopping = stop_event is not None and stop_event.is_set()
+
+        latest = None
+        if os.path.exists(index_path):
+            with open(index_path) as file:
+                checkpoints = json.load(file)["checkpoints"]
+
+            latest = checkpoints[-1] if checkpoints else None
+
+        if latest is not None and latest["file"] != last_file:
+            try:
+                checkpoint = torch.load(os.path.join(save_dir, latest["file"]), map_location=used_device, weights_only=False)
+            except FileNotFoundError:
+                # rotated away before we got to it, the next one is already there
+                checkpoint = None
+
+            if checkpoint is not None:
+                config = checkpoint["config"]
+
+                net = REAN(vector_size=config["vector_size"], attn_heads=config["attn_heads"], max_context_length=config["context_length"]).to(used_device)
+                net.load_state_dict(checkpoint["model"])
+                net.eval()
+
+                test_loss = evaluate(net, loss, eval_ids, table, batch_size, autocast, eval_lengths)
+
+                writer.add_scalar("test_loss", test_loss, checkpoint["batch"])
+                writer.flush()
+
+                checkpointing.report_test_loss(save_dir, latest["file"], test_loss.item())
+
+                print(f"checkpoint {latest['file']}: test loss {test_loss.item():.6f}")
+
+            last_file = latest["file"]
+
+        if stopping:
+            break
+
+        time.sleep(poll_seconds)
+
+    writer.close()
+
+def start_checkpoint_evaluator(save_dir: str, eval_set_path: str, log_dir: str, **kwargs) -> tuple:
+    """
+    starts checkpoint_evaluator in a new (spawned) process
+
+    Returns:
+        multiprocessing.Process: the process
+        multiprocessing.Event: set it (then join the process) to make it evaluate the last checkpoint and exit
+    """
+
+    context = multiprocessing.get_context("spawn")
+    stop_event = context.Event()
+
+    process = context.Process(target=checkpoint_evaluator, args=(save_dir, eval_set_path, log_dir), kwargs=dict(kwargs, stop_event=stop_event), daemon=True)
+    process.start()
+
+    return process, stop_event
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="evaluate the checkpoints of a REAN training run as they are written")
+    parser.add_argument("--save-dir", required=True, help="checkpoint directory of the run, e.g. ./runs/exp1/weights")
+    parser.add_argument("--eval-set", required=True, help="eval set saved by the training run, e.g. ./runs/exp1/eval_set.pt")
+    parser.add_argument("--log-dir", required=True, help="tensorboard log dir, e.g. ./runs/exp1")
+    parser.add_argument("--device", default=None)
+    parser.add_argument("--batch-size", type=int, default=768)
+    parser.add_argument("--poll-seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    checkpoint_evaluator(args.save_dir, args.eval_set, args.log_dir, args.device, args.batch_size, poll_seconds=args.poll_seconds)
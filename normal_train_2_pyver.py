@@ -2,37 +2,63 @@
 ###   CONFIGURATION   ###
 
 # %%
-from gensim.models import Word2Vec
 import numpy as np
 from tqdm import tqdm
-import matplotlib.pyplot as plt
 import random
 import torch
 import torch.nn as nn
-import torch.nn.functional as F
 from torch.utils.data import Dataset, DataLoader
+from torch.nn.parallel import DistributedDataParallel
 from IPython.display import clear_output
 import tokenizer
+import token_shards
+import embedding_table
+import generation
+import runtime
+import samplers
+import block_shuffle
+import checkpointing
+import metrics
+import instrumentation
+import distributed
+import argparse
 import os
-import math
-from torch.utils.tensorboard import SummaryWriter
-from datetime import datetime, timedelta
+import contextlib
+
+# %%
+# importing this file has no side effects (nothing is loaded, built or trained), main() does the training run
 
 # %%
 model_file = fr"./embedding_models/b4cksh0t5_checkp3.model"
-embeddings_model = Word2Vec.load(model_file)
+embeddings_store_path = fr"./embedding_models/b4cksh0t5_checkp3_store"  # memory mapped copy of model_file, built from it on first use (delete it after changing model_file)
 
-vector_size = embeddings_model.vector_size        # aka embedding dim 
+vector_size = 28 * 28                             # aka embedding dim (has to match the embeddings model, checked in main())
 
 # neural net settings
-context_length = 128                              # tokens to consider
+context_length = 128                              # tokens to consider (for 1k+ contexts turn on activation_checkpointing and / or grad_accumulation_steps)
 attn_heads = 8                                    # num attention heads per mechanism (per transformer block)
 dropout_prob = 0.0                                # 0.0 ---> everything normal   |   1.0 ---> everything is random
+fused_attention = True                            # True ---> fused scaled_dot_product_attention   |   False ---> nn.MultiheadAttention (same weights)
+activation_checkpointing = False                  # True ---> every transformer_block's activations are recomputed in backward instead of stored (much less memory, ~1 extra forward per step)
 
 # dataset
 train_dataset_path = fr"./datasets/ultra_train.txt"
 test_dataset_path = fr"./datasets/ultra_test.txt"
 
+# True ---> the DataLoader moves context_length + 1 int32 token ids per example and the embedding lookup happens on the run device
+token_id_batches = True
+
+# pre tokenized id shards (build with: python token_shards.py), set to None to read the .txt files directly
+train_shards_path = fr"./datasets/ultra_train_shards"
+test_shards_path = fr"./datasets/ultra_test_shards"
+
+# block shuffled reading (block_shuffle.py): the train set is read in big sequential blocks on a readahead thread and shuffled thru a buffer,
+# instead of one random seek per example (for the .txt on network / spinning disks, works with the shards too)
+block_shuffle_reads = False
+block_examples = 65536                            # examples per sequential read (about block_examples * tokenizer.average_token_length bytes of .txt)
+shuffle_buffer_examples = 65536                   # examples mixed across blocks
+readahead_blocks = 4                              # blocks read ahead per DataLoader worker
+
 examples_train = 64 * 8 * 8 * 8 * 8 * 8 * 8 * 8
 examples_test = 64 * 8 * 8
 
@@ -44,18 +70,24 @@ final_lr = 0.000001
 
 loss = nn.MSELoss()
 
-optimizer = torch.optim.Adam
-scheduler = torch.optim.lr_scheduler.CosineAnnealingLR
+optimizer_class = torch.optim.Adam
+scheduler_class = torch.optim.lr_scheduler.CosineAnnealingLR
 
-train_batch_size = int(128 * 2 * 3.0)
+train_batch_size = int(128 * 2 * 3.0)              # per process, the effective batch is train_batch_size * number of processes
+grad_accumulation_steps = 1                       # each batch is run as this many micro batches (has to divide train_batch_size), same effective batch with 1/N the activation memory
+shuffle_seed = 0                                  # the shuffle order only depends on (shuffle_seed, epoch), so resumed runs see the same examples
 
 # eval
 eval_batch_size = int(128 * 2 * 3.0)
 eval_loop_batch = 64
+eval_examples = None                              # fixed eval budget: how many test examples every eval runs on (None ---> the whole test set)
+eval_in_process = False                           # True ---> evaluate each checkpoint in a separate process instead of pausing training (test_loss is then logged at checkpoint batches and reported back for the best checkpoint)
+log_loss_batch = 16                               # the train loss is summed on the device and logged (averaged) every this many batches
 
 # test
 test_loop_batch = 256
 completion_length = 128
+use_kv_cache = False                              # incremental decoding for predict_sequence (only the new token is run thru the net every step until context_length positions, same tokens)
 test_prompts = ["human: how do i cook poratoes and garlic? network: ",
                 "human: what are some good circuit training excercises? network: ",
                 "human: tell me about graphics cards and ",
@@ -63,17 +95,29 @@ test_prompts = ["human: how do i cook poratoes and garlic? network: ",
                 ""]
 
 # pytorch
-run_device = torch.device("cuda")
+run_device = runtime.pick_device()                # cuda if there is one, else cpu (or pass e.g. "cuda:1")
 storage_device = torch.device("cpu")
+bf16_autocast = True                              # bfloat16 autocast for the forward / backward on cpu (does nothing on gpu)
+loader_workers = 4                                # DataLoader worker processes per loader
+
+# distributed data parallel: torchrun --nproc_per_node=N normal_train_2_pyver.py (plain python ---> one process, nothing changes)
+# every process trains on its own shard of each epoch, rank 0 does the tensorboard logging, checkpoints and sample generations
+distributed_backend = None                        # None ---> nccl (one gpu per process) if there are gpus, else gloo on the cpu
+
+# instrumentation
+instrument_stages = False                         # wall time per stage, examples/sec, tokens/sec, peak memory ---> tensorboard (syncs the device at every stage, so a bit slower)
+profile_start_batch = None                        # torch.profiler capture starting at this batch (None ---> off), the trace goes to log_dir/run_name/profile
+profile_batches = 8                               # how many batches the capture lasts
 
 use_tensorboard = True
 log_dir = "./runs" # irrelevant if use_tensorboard = False
 run_name = "exp1" # irrelevant if use_tensorboard = False
 
 # checkpoints & backups
-save_cehckpoint_batch = 512
+save_cehckpoint_batch = 512                       # keep a multiple of eval_loop_batch, only checkpoints saved at an eval batch get a test loss (unless eval_in_process)
 save_dir = log_dir + "/" + run_name + "/" + "weights"
 checkpoint_name = "REAN_checkpoint_date_[DATE]_batch_[BATCH]_epoch_[EPOCH].pth"
+keep_last_checkpoints = 3                         # older ones are deleted (the best one by test loss is always kept)
 
 # %%
 # command to get freaky and bulldoze the entire server:
@@ -83,242 +127,101 @@ checkpoint_name = "REAN_checkpoint_date_[DATE]_batch_[BATCH]_epoch_[EPOCH].pth"
 ###   NEURAL NET ARCHITECTURE   ###
 
 # %%
-class leaky_tanh_smart(nn.Module):
-    def __init__(self, leaky_range=(0, 3), squishy_range=(0, 3)):
-        super(leaky_tanh_smart, self).__init__()
-        # register leakyness and squishyness as trainable parameters
-        self.leakyness = nn.Parameter(torch.rand(1, dtype=torch.float32) * (leaky_range[1] - leaky_range[0]) + leaky_range[0])
-        self.squishyness = nn.Parameter(torch.rand(1, dtype=torch.float32) * (squishy_range[1] - squishy_range[0]) + squishy_range[0])
-        
-    def forward(self, x: torch.Tensor) -> torch.Tensor:
-        """
-        applies the leaky tanh activation function over the input tensor x.\n
-        for more info on leaky tanh and its parameters go to: https://www.desmos.com/calculator/kpzsfbtqww
-        
-        Args:
-            x (torch.Tensor): tensor over which to apply activation function.
-        
-        Returns:
-            torch.Tensor: returns x after function applied, keeps the same shape.
-        """
-        
-        return F.tanh(x * self.squishyness) + self.leakyness * x
+# leaky_tanh_smart, attention_mech, positional_encoding, transformer_block and REAN live in rean_model.py
+from rean_model import REAN
 
 # %%
-class attention_mech(nn.Module):
-    def __init__(self, vector_size=vector_size, attn_heads=attn_heads):
-        super(attention_mech, self).__init__()
-        # MultiheadAttention module
-        self.multihead_attn = nn.MultiheadAttention(embed_dim=vector_size, num_heads=attn_heads)
-        
-        # Layer normalization
-        self.norm = nn.LayerNorm(vector_size)
-
-    def forward(self, x):
-        # Prepare for multi-head attention (transpose to (sentence_len, batch_size, embedding_dim))
-        x = x.transpose(0, 1)
-        
-        # Create causal mask
-        seq_len = x.size(0)
-        causal_mask = torch.triu(torch.ones((seq_len, seq_len), device=x.device), diagonal=1).bool()
-        
-        # Apply multi-head attention with the causal mask
-        attn_output, attn_weights = self.multihead_attn(x, x, x, attn_mask=causal_mask)
-        
-        # Apply layer normalization to the attention output
-        attn_output = self.norm(attn_output)
-        
-        # Transpose back to (batch_size, sentence_len, embedding_dim)
-        output = attn_output.transpose(0, 1)
-        
-        return output, attn_weights
+###   EMBEDDINGS   ###
 
 # %%
-class positional_encoding(nn.Module):
-    def __init__(self):
-        super(positional_encoding, self).__init__()
-
-    def forward(self, x):
-        batch_size, context_length, vector_size = x.size()
-
-        # Generate positions (shape: [context_length, 1])
-        position = torch.arange(0, context_length, dtype=torch.float).unsqueeze(1).to(x.device)
-
-        # Compute the divisor term (shape: [vector_size // 2])
-        div_term = torch.exp(torch.arange(0, vector_size, 2).float() * (-math.log(10000.0) / vector_size)).to(x.device)
-
-        # Initialize positional encoding tensor (shape: [context_length, vector_size])
-        pe = torch.zeros(context_length, vector_size, device=x.device)
-        
-        # Apply sine to even indices and cosine to odd indices
-        pe[:, 0::2] = torch.sin(position * div_term)  # sine for even indices
-        pe[:, 1::2] = torch.cos(position * div_term)  # cosine for odd indices
-
-        # Add positional encoding to the input
-        x = x + pe.unsqueeze(0)  # Add positional encoding, shape becomes (batch_size, context_length, vector_size)
-
-        return x
+# loaded on first use by get_embeddings() / get_decoder(), the net is set by main()
+embeddings_table = None
+embeddings_decoder = None
+net = None
 
-# %%
-class transformer_block(nn.Module):
-    def __init__(self, vector_size=vector_size):
-        super(transformer_block, self).__init__()
-        
-        self.activ_func = leaky_tanh_smart()
-        
-        self.attn = attention_mech()
-        
-        self.fc = nn.Linear(vector_size, vector_size)
-        
-        self.norm1 = nn.LayerNorm(vector_size)
-        self.norm2 = nn.LayerNorm(vector_size)
-        
-    def forward(self, x: torch.Tensor) -> torch.Tensor:
-        x = self.norm1(x + self.attn(x)[0])
-        x = self.norm2(x + self.activ_func(self.fc(x)))
-        
-        return x
-
-# %%
-class REAN(nn.Module):
-    def __init__(self):
-        super(REAN, self).__init__()
-        
-        self.pos_encoding = positional_encoding()
-        
-        self.tblock1 = transformer_block()
-        self.tblock2 = transformer_block()
-        self.tblock3 = transformer_block()
-        self.tblock4 = transformer_block()
-
-    def forward(self, segment: torch.Tensor) -> torch.Tensor:
-        """
-        this function is primarily used for training, where the network needs to predict the next token, for every token in the sequence
-        
-        Args:
-            segment (torch.Tensor): this is a tensor of size (batches, context_length, vector_size) representing a sequence of tokens (of course from the tokenizer and using the correct word2vec model)
-        
-        Returns:
-            torch.Tensor: a tensor of shape (batches, context_length, vector_size) (same as segment) representing the sequence predicted by the network shifted future-way
-        """
-        
-        ###                  INPUT                 ###
-        #    (batches, context_len, vector_size)
-        #                      ↓
-        
-        segment = self.pos_encoding(segment)
-        
-        segment = self.tblock1(segment)
-        segment = self.tblock2(segment)
-        segment = self.tblock3(segment)
-        segment = self.tblock4(segment)
-        
-        return segment
+def get_embeddings() -> embedding_table.embedding_table:
+    """
+    returns the embeddings table, loaded on first use from the memory mapped store at embeddings_store_path (which is built from model_file if it isnt there yet).\n
+    every process and DataLoader worker maps the same file read only, so the vectors are in memory once, and pickling the table to a worker only sends the path
+    """
     
-        #                      ↓
-        #    (batches, context_len, vector_size)
-        ###                 OUTPUT                 ###
-
-    def predict(self, segment: torch.Tensor) -> torch.Tensor:
-        """
-        function is for predicting the embeddings vector of the next token in a given sequence
-        
-        Args:
-            segment (torch.Tensor): this is a tensor of size (batches, context_length, vector_size) representing a sequence of tokens (of course from the tokenizer and using the correct word2vec model)
-        
-        Returns:
-            torch.Tensor: a tensor of shape (batches, vector_size) representing the embeddings vector of the next token to be added into the sequence
-        """
-        
-        ###                  INPUT                 ###
-        #    (batches, context_len, vector_size)
-        #                      ↓
-        
-        segment = self.forward(segment)
-        
-        return segment[:, -1, :]
+    global embeddings_table
+    
+    if embeddings_table is None:
+        if not os.path.exists(os.path.join(embeddings_store_path, embedding_table.store_vectors_file)):
+            from gensim.models import Word2Vec
+            
+            embedding_table.save_store(embedding_table.embedding_table.from_model(Word2Vec.load(model_file)), embeddings_store_path)
         
-        #                      ↓
-        #           (batches, vector_size)
-        ###                 OUTPUT                 ###
-
-# %%
-###   BUILD NET & DEPENDENCIES   ###
-
-# %%
-net = REAN()
-
-net.to(run_device)
+        embeddings_table = embedding_table.mapped_embedding_table(embeddings_store_path)
+    
+    return embeddings_table
 
-optimizer = optimizer(net.parameters(), lr=start_lr)
-scheduler = scheduler(optimizer, T_max=train_epochs, eta_min=final_lr)
+def get_decoder() -> embedding_table.nearest_token_decoder:
+    """
+    returns the decoder for turning predictions back into tokens, made on first use (keeps the normalised vocab matrix on the run device)
+    """
+    
+    global embeddings_decoder
+    
+    if embeddings_decoder is None:
+        embeddings_decoder = embedding_table.nearest_token_decoder(get_embeddings(), device=run_device, not_in_vocab_token="[NIV]", NIV_threshold=0.01)
+    
+    return embeddings_decoder
 
-print(f"neural net weight: {sum(param.numel() * param.element_size() for param in net.parameters()) / (1024 ** 3):.4f}GB")
+def default_net() -> REAN:
+    # the net main() trains, used by the predict functions when no net is passed
+    if net is None:
+        raise RuntimeError("no net yet, pass one in or run main()")
+    
+    return net
 
 # %%
 ###   UTIL FUNCS   ###
 
 # %%
-def vectorize_segment(segment: list[str], model: Word2Vec=embeddings_model, default: int = 0, used_device=storage_device) -> np.ndarray:
+def vectorize_segment(segment: list[str], table: embedding_table.embedding_table=None, default: int = 0, used_device=storage_device) -> torch.Tensor:
     """
-    encodes all words in a given list to corresponding vectors in given model.
-    words not found in the model will be given a vector with "default" value
+    encodes all words in a given list to corresponding vectors in given table.
+    words not found in the table will be given a vector with "default" value
     
     Args:
-        sentence (list): list of strings (tokenized sentence)
-        model (Word2Vec): model to use when encoding
+        segment (list): list of strings (tokenized sentence)
+        table (embedding_table): vocab table (built from the word2vec model) to use when encoding (None ---> get_embeddings())
         default (int): fill vector with this value if word is not found in model
     
     Returns:
-        np.array: 2d array with dim1 = len(sentence) and dim2 = model.vector_size
+        torch.Tensor: 2d float32 tensor with dim1 = len(segment) and dim2 = table.vector_size
     """
     
-    # generate inital array with default values
-    vectorized = np.ones((len(segment), model.vector_size)) * default
+    table = table if table is not None else get_embeddings()
     
-    # loop over every word in list
-    for current_word, current_word_idx in zip(segment, range(len(segment))):
-        # only add correct values if word is in model, otherwise leave as default
-        if current_word in model.wv:
-            # the try except block is needed because (current_word in model.wv) sometimes gives a false positive... yeah gensim
-            try:
-                vectorized[current_word_idx] = model.wv.get_vector(current_word, norm=False)
-            except:
-                pass
+    ids = table.ids(segment)
+    vectorized = table.vectorize_ids(ids, used_device)
     
-    vectorized = torch.tensor(vectorized, dtype=torch.float32, device=used_device)
+    # the table's not in vocab row is filled with the table default, only patch it up if asked for something else
+    if default != 0:
+        vectorized[ids.to(vectorized.device) == embedding_table.niv_id] = default
     
     return vectorized
 
 # %%
-def devectorize_segment(vectorized_segment: torch.Tensor, model: Word2Vec=embeddings_model, not_in_vocab_token="[NIV]", NIV_threshold=0.01) -> list:
+def devectorize_segment(vectorized_segment: torch.Tensor, decoder: embedding_table.nearest_token_decoder=None) -> list:
     """
-    decodes vectors into nearest word found in model, if no near words found, adds a not in vocab token
+    decodes vectors into nearest word found in the vocab, if no near words found, adds a not in vocab token (decoder.not_in_vocab_token, when the best similarity is under decoder.NIV_threshold)
     
     Args:
-        vectorized_sentence (np.array): 2d arrat with vectors of words to be decoded
-        model (Word2Vec): model to use when decoding
+        vectorized_segment (torch.Tensor): (words, vector_size) or (batches, words, vector_size) tensor with vectors of words to be decoded
+        decoder (nearest_token_decoder): decoder to use (keeps the normalised vocab matrix on its device), None ---> get_decoder()
     
     Returns:
-        list: list of strings (words) whos vectors most closely match those provided
+        list: list of strings (words) whos vectors most closely match those provided (list of lists for 3d input)
     """
     
-    result = []
+    decoder = decoder if decoder is not None else get_decoder()
     
-    # make sure vectors are ready to be processed
-    vectorized_segment = vectorized_segment.cpu().numpy()
-    
-    # go over all words and find closest match in model
-    for current_word in vectorized_segment:
-        similarities = model.wv.similar_by_vector(current_word)
-        
-        # check if its not a bullshit vector
-        if similarities[0][1] > NIV_threshold:
-            result.append(similarities[0][0])
-        else:
-            result.append(not_in_vocab_token)
-    
-    return result
+    # one matmul + argmax over the whole vocab for all the vectors at once
+    return decoder.decode(vectorized_segment)
 
 # %%
 def pad_or_truncate(suspected_tensor: torch.tensor, target_length: int, default: int=0) -> torch.Tensor:
@@ -368,9 +271,11 @@ def prepare_segment_for_net(segment: list[str], length: int=context_length, used
     return batched
 
 # %%
-def predict_word(segment: list[str], net: REAN=net):
-    # turn tokenized text into net's format
-    prepared_segment = prepare_segment_for_net(segment, used_device=next(net.parameters()).device)
+def predict_word(segment: list[str], net: REAN=None):
+    net = net if net is not None else default_net()
+    
+    # turn tokenized text into net's format, only the real tokens (a short segment runs at its own length, an empty one as a single padding vector)
+    prepared_segment = prepare_segment_for_net(segment, length=max(min(len(segment), context_length), 1), used_device=next(net.parameters()).device)
     
     # run net
     prediction_vector = net.predict(prepared_segment).detach()
@@ -381,11 +286,75 @@ def predict_word(segment: list[str], net: REAN=net):
     return predicted_token
 
 # %%
-def predict_sequence(segment: list[str], num_tokens: int, net: REAN=net, display_tqdm=False):
+def predict_sequence(segment: list[str], num_tokens: int, net: REAN=None, display_tqdm=False, use_kv_cache=False):
+    """
+    generates num_tokens tokens after segment, every one predicted from the last context_length tokens.\n
+    use_kv_cache ---> predict_sequence_cached (same tokens, only faster until the sequence reaches context_length tokens, see its NOTE)
+    """
+
+    net = net if net is not None else default_net()
+    
+    if use_kv_cache:
+        return predict_sequence_cached(segment, num_tokens, net=net, display_tqdm=display_tqdm)
+    
+    # same window as predict_word on the growing result, kept on the net's device (see generation.generation_session)
+    session = generation.generation_session(net, get_embeddings(), get_decoder(), segment, context_length)
+    
+    return session.generate(num_tokens, display_tqdm=display_tqdm)
+
+# %%
+def stream_sequence(segment: list[str], num_tokens: int, net: REAN=None):
+    """
+    predict_sequence as a generator, yields each token as soon as it is predicted (e.g. to print a completion while it is being made)
+    """
+    
+    net = net if net is not None else default_net()
+    
+    yield from generation.generation_session(net, get_embeddings(), get_decoder(), segment, context_length).stream(num_tokens)
+
+# %%
+def predict_sequence_cached(segment: list[str], num_tokens: int, net: REAN=None, display_tqdm=False, length: int=None):
+    """
+    same as predict_sequence, but keeps every transformer_block's keys / values cached, so each new token costs one position thru the net instead of a whole window forward.\n
+    NOTE: the speedup only lasts until the sequence is length positions long. after that the window slides like predict_sequence's, which a cache cant follow,
+    so every further step refills the cache with the last length tokens (a full forward, same cost as predict_sequence). the tokens match predict_sequence's throughout
+    
+    Args:
+        segment (list[str]): prompt tokens
+        num_tokens (int): how many tokens to generate
+        net (REAN): the net (None ---> the one main() trains)
+        length (int): max positions in the cache, keep at the net's context length (None ---> context_length)
+    
+    Returns:
+        list[str]: the generated tokens (without the prompt)
+    """
+    
+    net = net if net is not None else default_net()
+    length = length if length is not None else context_length
+    used_device = next(net.parameters()).device
     result = segment.copy()
     
-    for _ in tqdm(range(num_tokens), disable=not display_tqdm):
-        result += predict_word(result, net=net)
+    caches = None
+    new_tokens = result[-length:]
+    
+    with torch.no_grad():
+        for _ in tqdm(range(num_tokens), disable=not display_tqdm):
+            # (re)fill the cache at the start, and once the next token wouldnt fit anymore with the last length tokens (the window predict_sequence slides to)
+            if caches is None or caches[0].length + len(new_tokens) > length:
+                new_tokens = result[-length:]
+                caches = net.new_caches(1, length)
+            
+            # an empty prompt starts from a single padding vector
+            prepared_segment = pad_or_truncate(vectorize_segment(new_tokens, used_device=used_device), max(len(new_tokens), 1)).unsqueeze(0)
+            
+            prediction_vector = net.predict_cached(prepared_segment, caches)
+            
+            new_tokens = devectorize_segment(prediction_vector)
+            result += new_tokens
+            
+            # that padding vector isnt part of predict_sequence's window once there is a real token, so the cache starts over from the first token
+            if not segment and len(result) == len(new_tokens):
+                caches = None
     
     return result[len(segment):]
 
@@ -394,7 +363,7 @@ def predict_sequence(segment: list[str], num_tokens: int, net: REAN=net, display
 
 # %%
 class REAN_dataset(Dataset):
-    def pull_tokens(self, start_read_idx: int, requested_num_tokens: int):
+    def pull_tokens(self, start_read_idx: int, requested_num_tokens: int, block=None):
         """
         function returns a requested number of tokens from the dataset file, starting at APPROXIMATLY the start_read_idx token.\n
         attempts to return full words as much as possible, example:\n
@@ -402,16 +371,27 @@ class REAN_dataset(Dataset):
         YES:   this | is | a | sentence
         
         Args:
-            start_read_idx (int): the APPROXIMATE token at which to start the reading (determined from the avarage token length in the tokenizer vocab)
+            start_read_idx (int): the APPROXIMATE token at which to start the reading (determined from the avarage token length in the tokenizer vocab), EXACT token when reading from token shards
             requested_num_tokens (int): how many tokens to return
+            block (block_shuffle.data_block): an already read piece of the .txt to take the text from instead of the file (None ---> the file)
         
         Returns:
             tokenized text (list of str): the tokens of the dataset from start_read_idx to start_read_idx + requested_num_tokens
             is EOF hit (bool): if the requested args were outside of the dataset's range
         """
         
-        with open(self.path, errors="ignore") as self.dataset:
-            self.dataset.seek(start_read_idx * tokenizer.average_token_length)
+        # pre tokenized dataset: exact token index, O(1) slice
+        if self.shards is not None:
+            self.tokens = self.shards.slice_tokens(start_read_idx, requested_num_tokens)
+            
+            if len(self.tokens) < requested_num_tokens:
+                self.report_eof()
+                return self.tokens, True
+            
+            return self.tokens, False
+        
+        with (open(self.path, errors="ignore") if block is None else block.open_text()) as self.dataset:
+            self.dataset.seek(start_read_idx * tokenizer.average_token_length - (0 if block is None else block.start))
             
             # get an initial estimate to what text we will actually need
             self.buffer = self.dataset.read(requested_num_tokens * tokenizer.average_token_length)
@@ -424,7 +404,11 @@ class REAN_dataset(Dataset):
                 
                 # check eof
                 if not self.next_char:
-                    print("pull_tokens(): eof was hit")
+                    if block is not None and not block.at_end:
+                        # only the end of the block, not of the file
+                        return self.pull_tokens(start_read_idx, requested_num_tokens)
+                    
+                    self.report_eof()
                     return self.tokenized_buffer[-requested_num_tokens - 1:][:-1], True
                 
                 self.buffer += self.next_char
@@ -435,6 +419,43 @@ class REAN_dataset(Dataset):
         # regardless of if the estimate is too long / short, return theproper amount of tokens, with the end snipped of, because it might be a half token
         return self.tokenized_buffer[-requested_num_tokens - 1:][:-1], False
     
+    def report_eof(self):
+        # examples near the end of the data hit the eof on every read, so it only gets printed once per dataset (and worker)
+        if not self.eof_reported:
+            print("pull_tokens(): eof was hit")
+            self.eof_reported = True
+    
+    def construct_ids(self, start_read_idx: int, block=None):
+        """
+        function to make a full datapoint as token ids (question and answer are the same window shifted by one, so its only sent once)
+        
+        Args:
+            start_read_idx (int): at which token to start making the example
+            block (block_shuffle.data_block): an already read piece of the dataset that holds this example (None ---> read it from disk)
+        
+        Returns:
+            torch.Tensor: int32 tensor of self.context_length + 1 token ids (left padded with niv_id at EOF, like pad_or_truncate), self.num_ids says how many are real
+        """
+        
+        if self.shards is not None:
+            # token shards are already ids in the table's vocab
+            if block is not None:
+                self.ids_slice = torch.from_numpy(block.data[start_read_idx - block.start:start_read_idx - block.start + self.context_length + 1].astype(np.int32))
+            else:
+                self.ids_slice = torch.from_numpy(self.shards.slice(start_read_idx, self.context_length + 1).astype(np.int32))
+            
+            self.token_ids = torch.full((self.context_length + 1,), embedding_table.niv_id, dtype=torch.int32)
+            self.token_ids[self.context_length + 1 - len(self.ids_slice):] = self.ids_slice
+            self.num_ids = len(self.ids_slice)
+        else:
+            # pull neccesary amount of tokens for question / input and answer / output
+            self.tokens, _ = self.pull_tokens(start_read_idx, self.context_length + 1, block)
+            
+            self.token_ids = self.embeddings.batch_ids([self.tokens], self.context_length + 1)[0].to(torch.int32)
+            self.num_ids = min(len(self.tokens), self.context_length + 1)
+        
+        return self.token_ids
+    
     def construct_example(self, start_read_idx: int):
         """
         function to make a full datapoint, can be used as raw return for __getitem__()
@@ -443,14 +464,12 @@ class REAN_dataset(Dataset):
             start_read_idx (int): at which token to start making the example
         
         Returns:
-            tokenized text (list of str): the tokens of the dataset from start_read_idx to start_read_idx + self.context_length
+            question (torch.Tensor): (self.context_length, vector_size) vectors of the tokens from start_read_idx to start_read_idx + self.context_length
+            answer (torch.Tensor): the same, shifted one token forward
         """
         
-        # pull neccesary amount of tokens for question / input and answer / output
-        self.tokens, _ = self.pull_tokens(start_read_idx, self.context_length + 1)
-        
-        # encode the tokens to vectors (aka embeddings)
-        self.vectorized_tokens = prepare_segment_for_net(self.tokens, length=self.context_length + 1).squeeze(0)
+        # encode the tokens to vectors (aka embeddings), a single gather
+        self.vectorized_tokens = self.embeddings.vectorize_ids(self.construct_ids(start_read_idx))
         
         # split into network input and expected output
         self.question = self.vectorized_tokens[:-1] # everythinbg up to last word
@@ -469,6 +488,15 @@ class REAN_dataset(Dataset):
             returns how many usable examples there are, for __len__()
         """
         
+        # with token shards the size is known right away
+        if self.shards is not None:
+            self.current_check = max(min(self.num_examples, len(self.shards) - self.context_length), 0)
+            
+            if self.current_check < self.num_examples:
+                print("The requested size is bigger than the token shards provided, so the dataset might be smaller than what you expected.")
+            
+            return self.current_check
+        
         with tqdm(total=self.num_examples, desc="Calculating Dataset Size", unit="example") as pbar:
             for self.current_check in range(self.num_examples):
                 _, self.eof = self.pull_tokens(self.current_check, self.context_length)
@@ -483,13 +511,28 @@ class REAN_dataset(Dataset):
         
         return self.current_check - 1   # the -1 is just in case
     
-    def __init__(self, path, num_examples, context_length, embeddings_model, verify_dataset_size=True):
+    def __init__(self, path, num_examples, context_length, verify_dataset_size=True, shards_path=None, embeddings=None, token_ids=False):
         # transfer to object wide variables
         self.path = path
+        self.token_ids_mode = token_ids   # True ---> __getitem__ gives int32 token ids, vectorized on the run device by split_batch()
         self.context_length = context_length
-        self.embeddings_model = embeddings_model
+        
+        # a mapped_embedding_table pickles as just its store path, so the workers share one memory mapped copy of the vectors
+        self.embeddings = embeddings if embeddings is not None else get_embeddings()
         self.num_examples = num_examples
         
+        # token shards from token_shards.py (None ---> read the .txt file directly)
+        self.shards = None
+        
+        if shards_path is not None:
+            self.shards = token_shards.token_shard_reader(shards_path)
+            
+            # the shard ids only mean something with the same vocab they were built with
+            if self.shards.vocab_size != self.embeddings.vocab_size:
+                raise ValueError(f"token shards at {shards_path} were built with a vocab of {self.shards.vocab_size} ids, but the embeddings table has {self.embeddings.vocab_size}. rebuild them with token_shards.py")
+        
+        self.eof_reported = False
+        
         # get the size of the dataset txt file
         self.dataset_len = num_examples
         
@@ -500,118 +543,311 @@ class REAN_dataset(Dataset):
         return self.dataset_len
     
     def __getitem__(self, index):
+        if self.token_ids_mode:
+            return self.construct_ids(index)
+        
         return self.construct_example(index)
 
 # %%
-train_dataset = REAN_dataset(train_dataset_path, examples_train, context_length, embeddings_model, verify_dataset_size=False)
-test_dataset = REAN_dataset(test_dataset_path, examples_test, context_length, embeddings_model, verify_dataset_size=False)
+def split_batch(current_batch, used_device: torch.device=None):
+    """
+    turns a batch from the DataLoader into (question, answer) on the device, for both dataset modes
+    
+    Args:
+        current_batch: (batches, context_length + 1) token ids if token_id_batches, else a (question, answer) pair of (batches, context_length, vector_size) tensors
+        used_device (torch.device): device to put the batch on, None ---> run_device (read at call time, main() sets it per process)
+    
+    Returns:
+        torch.Tensor: question / net input (batches, context_length, vector_size)
+        torch.Tensor: answer / expected output (batches, context_length, vector_size)
+    """
+    
+    used_device = used_device if used_device is not None else run_device
+    
+    if token_id_batches:
+        # only the ids go to the device, the embedding lookup happens there
+        vectorized_batch = get_embeddings().vectorize_ids(current_batch.to(used_device, non_blocking=True), used_device)
+        
+        return vectorized_batch[:, :-1], vectorized_batch[:, 1:]
+    
+    current_segment, target = current_batch
+    
+    return current_segment.to(used_device), target.to(used_device)
 
 # %%
-print("please validate dataset: does this look correct?\n")
+###   TRAIN   ###
 
-with torch.no_grad():
-    rnd_offset = random.randint(0, 10000)
+# %%
+def main():
+    """
+    the whole training run: builds the net, optimizer and datasets, trains (resuming with --resume), then prints a sample completion
+    """
     
-    for idx in range(0):
-        print(f"sample {idx}:[nline]{tokenizer.detokenize_segment(devectorize_segment(train_dataset[idx + rnd_offset][0].detach(), embeddings_model))}[nline]------------------------------------------------------------[nline]{tokenizer.detokenize_segment(devectorize_segment(train_dataset[idx + rnd_offset][1].detach(), embeddings_model))}".replace("\n", " ").replace("[nline]", "\n"))
+    global net, run_device
+    
+    # joins the torchrun process group (if launched with torchrun), every gpu process gets its own cuda:LOCAL_RANK
+    rank, world_size, run_device = distributed.setup(run_device, distributed_backend)
+    main_process = distributed.is_main_process()
+    
+    # command line (parse_known_args so the script still runs inside jupyter)
+    parser = argparse.ArgumentParser(description="train REAN")
+    parser.add_argument("--resume", nargs="?", const="latest", default=None, help="resume training from a checkpoint file (no value ---> the latest one in save_dir)")
+    args, _ = parser.parse_known_args()
 
-# %%
-# if num_workers arg is used
-os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    # on cpu, leave cores for the DataLoader workers
+    intra_op_threads, inter_op_threads = runtime.configure_threads(run_device, loader_workers=loader_workers, processes=distributed.local_world_size())
+    print(f"rank {rank}/{world_size}   run device: {run_device}   intra-op threads: {intra_op_threads}   inter-op threads: {inter_op_threads}")
 
-train_loader = DataLoader(dataset=train_dataset, batch_size=train_batch_size, shuffle=True, num_workers=4, persistent_workers=True)
-test_loader = DataLoader(dataset=test_dataset, batch_size=eval_batch_size, shuffle=True, num_workers=4, persistent_workers=True)
+    # only rank 0 builds the embeddings store if its missing, the others wait and then map it
+    if main_process:
+        get_embeddings()
+    
+    distributed.barrier()
 
-# %%
-net.train()
-clear_output()
+    if get_embeddings().vector_size != vector_size:
+        raise ValueError(f"vector_size is {vector_size}, but the embeddings at {embeddings_store_path} are {get_embeddings().vector_size} dims")
 
-# %%
-if use_tensorboard:
-    writer = SummaryWriter(log_dir = log_dir + "/" + run_name)
+    if train_batch_size % grad_accumulation_steps != 0:
+        raise ValueError(f"grad_accumulation_steps ({grad_accumulation_steps}) has to divide train_batch_size ({train_batch_size})")
 
-# %%
-batch = 0
-    
-for epoch in range(train_epochs):
-    # training loop
-    for current_segment, target in train_loader:
-        batch += 1
-        
-        # move batch to gpu
-        current_segment = current_segment.to(run_device)
-        target = target.to(run_device)
-        
-        # train batch
-        train_outputs = net(current_segment)
-        train_loss_value = loss(train_outputs, target)
-        train_loss_value.backward()
-        optimizer.step()
-        optimizer.zero_grad()
-        
-        if use_tensorboard:
-            # Log training loss to TensorBoard
-            writer.add_scalar('train_loss', train_loss_value.item(), batch)
-        
-        # eval loop
-        if batch % eval_loop_batch == 0:
-            net.eval()
+    net = REAN(vector_size=vector_size, attn_heads=attn_heads, max_context_length=context_length, fused_attention=fused_attention, activation_checkpointing=activation_checkpointing)
+
+    net.to(run_device)
+
+    optimizer = optimizer_class(net.parameters(), lr=start_lr)
+    scheduler = scheduler_class(optimizer, T_max=train_epochs, eta_min=final_lr)
+
+    # writes checkpoints on a background thread, keeps the last few + the best
+    checkpoints = checkpointing.checkpoint_manager(save_dir, checkpoint_name, keep_last=keep_last_checkpoints)
+
+    start_epoch = 0
+    batch = 0
+    resume_epoch_batch = 0
+    resume_world_size = world_size
+    sampler_seed = shuffle_seed
+
+    if args.resume is not None:
+        resume_path = checkpoints.latest() if args.resume == "latest" else args.resume
+
+        if resume_path is None:
+            raise FileNotFoundError(f"--resume: no checkpoint in {save_dir} to resume from, train without --resume first")
+
+        resume_state = checkpointing.load_checkpoint(resume_path, net, optimizer, scheduler, map_location=run_device)
+        
+        start_epoch, batch, resume_epoch_batch = resume_state["epoch"], resume_state["batch"], resume_state["epoch_batch"]
+        resume_world_size = resume_state.get("world_size", 1)
+        sampler_seed = resume_state["shuffle_seed"]
+        
+        if main_process:
+            print(f"resumed from {resume_path}: epoch {start_epoch}, batch {batch}")
+
+    # the gradients are averaged over all processes in backward() (every process starts from rank 0's weights)
+    train_net = DistributedDataParallel(net, device_ids=[run_device] if run_device.type == "cuda" else None) if world_size > 1 else net
+
+    if main_process:
+        print(f"neural net weight: {sum(param.numel() * param.element_size() for param in net.parameters()) / (1024 ** 3):.4f}GB")
+
+    train_dataset = REAN_dataset(train_dataset_path, examples_train, context_length, verify_dataset_size=train_shards_path is not None, shards_path=train_shards_path, token_ids=token_id_batches)
+    test_dataset = REAN_dataset(test_dataset_path, examples_test, context_length, verify_dataset_size=test_shards_path is not None, shards_path=test_shards_path, token_ids=token_id_batches)
+
+    if main_process:
+        print("please validate dataset: does this look correct?\n")
+
+    with torch.no_grad():
+        rnd_offset = random.randint(0, 10000)
+        
+        for idx in range(0):
+            question, answer = train_dataset.construct_example(idx + rnd_offset)
+            print(f"sample {idx}:[nline]{tokenizer.detokenize_segment(devectorize_segment(question))}[nline]------------------------------------------------------------[nline]{tokenizer.detokenize_segment(devectorize_segment(answer))}".replace("\n", " ").replace("[nline]", "\n"))
+
+    # if num_workers arg is used
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+    # every process gets its own shard of the (seed, epoch) shuffle
+    if block_shuffle_reads:
+        # the stream makes the batches itself, set_epoch / skip work like on the sampler
+        train_sampler = block_shuffle.block_shuffled_dataset(train_dataset, train_batch_size // grad_accumulation_steps, block_examples, shuffle_buffer_examples, readahead_blocks,
+                                                             num_workers=loader_workers, num_replicas=world_size, rank=rank, seed=sampler_seed)
+    else:
+        train_sampler = samplers.sharded_resumable_sampler(len(train_dataset), num_replicas=world_size, rank=rank, seed=sampler_seed)
+
+    # pick up mid epoch where the checkpoint left off (counted over all processes of the run that saved it)
+    train_sampler.set_epoch(start_epoch)
+    train_sampler.skip(resume_epoch_batch * train_batch_size * resume_world_size)
+
+    # the loader hands out micro batches, grad_accumulation_steps of them make up one batch
+    if block_shuffle_reads:
+        # not persistent, the workers need a fresh copy of the stream (with the new epoch) every epoch
+        train_loader = DataLoader(dataset=train_sampler, batch_size=None, num_workers=loader_workers, pin_memory=run_device.type == "cuda")
+    else:
+        train_loader = DataLoader(dataset=train_dataset, batch_size=train_batch_size // grad_accumulation_steps, sampler=train_sampler, num_workers=loader_workers, persistent_workers=loader_workers > 0, pin_memory=run_device.type == "cuda")
+
+    # the test set is read ONCE (or a fixed eval_examples subset of it) and kept on the device as token ids (its real lengths stay on the cpu)
+    test_ids, test_lengths = metrics.tensorize_eval_set(test_dataset, eval_examples)
+    test_ids = test_ids.to(run_device)
+    
+    # every process evaluates its slice, the losses are averaged over processes
+    eval_ids = test_ids[rank::world_size]
+    eval_lengths = test_lengths[rank::world_size]
+
+    net.train()
+    clear_output()
+
+    # only rank 0 logs (the collectives behind the logged numbers still run on every process)
+    log_to_tensorboard = use_tensorboard and main_process
+    
+    if log_to_tensorboard:
+        # all the tensorboard writing happens on a background thread
+        writer = metrics.async_summary_writer(log_dir + "/" + run_name)
+
+    if eval_in_process and main_process:
+        eval_set_path = log_dir + "/" + run_name + "/eval_set.pt"
+        metrics.save_eval_set(eval_set_path, test_ids, get_embeddings().vectors, test_lengths)
+        
+        eval_process, eval_stop = metrics.start_checkpoint_evaluator(save_dir, eval_set_path, log_dir + "/" + run_name, device=str(run_device), batch_size=eval_batch_size, autocast=bf16_autocast)
+
+    train_throughput = runtime.throughput_meter()
+    train_losses = metrics.loss_accumulator()
+    stages = instrumentation.stage_timer(run_device, enabled=instrument_stages)
+    profiler = instrumentation.profiler_window(profile_start_batch if main_process else None, profile_batches, log_dir + "/" + run_name + "/profile", run_device)
+        
+    for epoch in range(start_epoch, train_epochs):
+        train_sampler.set_epoch(epoch)
+        epoch_batch = resume_epoch_batch if epoch == start_epoch else 0
+        
+        # training loop
+        for micro_batches in runtime.grouped(stages.iterate(train_loader), grad_accumulation_steps):
+            batch += 1
+            epoch_batch += 1
+            
+            profiler.step(batch)
+            
+            # only set if the eval runs at this batch, a checkpoint never gets an older batch's test loss
+            test_loss = None
+            
+            batch_examples = sum(len(current_batch) if token_id_batches else len(current_batch[0]) for current_batch in micro_batches)
+            
+            for micro_idx, current_batch in enumerate(micro_batches):
+                # move batch to gpu
+                with stages.stage("to_device"):
+                    current_segment, target = split_batch(current_batch, run_device)
+                
+                # train batch
+                with stages.stage("forward"), runtime.autocast(run_device, bf16_autocast):
+                    train_outputs = train_net(current_segment)
+                    train_loss_value = loss(train_outputs, target)
+                
+                # the micro batch gradients add up to the whole batch's gradient, only the last backward all-reduces between processes
+                last_micro_batch = micro_idx == len(micro_batches) - 1
+                
+                with stages.stage("backward"), (train_net.no_sync() if world_size > 1 and not last_micro_batch else contextlib.nullcontext()):
+                    (train_loss_value * (len(current_segment) / batch_examples)).backward()
+                
+                train_throughput.update(current_segment.shape[0] * current_segment.shape[1])
+                stages.count(current_segment.shape[0], current_segment.shape[0] * current_segment.shape[1])
+                
+                # stays on the device, no sync per batch
+                train_losses.add(train_loss_value, len(current_segment))
+            
+            with stages.stage("optimizer"):
+                optimizer.step()
+                optimizer.zero_grad()
+            
+            if use_tensorboard and batch % log_loss_batch == 0:
+                # mean since the last log, averaged over all processes (still on the device)
+                train_loss_mean = distributed.reduce_mean(train_losses.mean())
+                
+                if log_to_tensorboard:
+                    # Log training loss to TensorBoard
+                    writer.add_scalar('train_loss', train_loss_mean, batch)
+                    
+                    # per stage timings of rank 0 (empty if instrument_stages = False)
+                    for tag, value in stages.report().items():
+                        writer.add_scalar(tag, value, batch)
             
-            with torch.no_grad():
-                for test_current_segment, test_target in test_loader:
-                    # move batch to gpu
-                    test_current_segment = test_current_segment.to(run_device)
-                    test_target = test_target.to(run_device)
+            # eval loop
+            if batch % eval_loop_batch == 0:
+                if use_tensorboard:
+                    # training tokens/sec of all processes together since the last eval (eval time not included)
+                    train_tokens_per_sec = distributed.reduce_sum(torch.tensor(train_throughput.report(), device=run_device))
+                    
+                    if log_to_tensorboard:
+                        writer.add_scalar('train_tokens_per_sec', train_tokens_per_sec, batch)
+                
+                if not eval_in_process:
+                    net.eval()
                     
-                    # run test
-                    test_outputs = net(test_current_segment)
-                    test_loss_value = loss(test_outputs, test_target)
+                    # one sync per eval, also used to pick the best checkpoint
+                    with stages.stage("eval"):
+                        eval_loss = metrics.evaluate(net, loss, eval_ids, get_embeddings(), eval_batch_size, bf16_autocast, eval_lengths)
+                        test_loss = distributed.reduce_weighted_mean(eval_loss, len(eval_ids)).item()
                     
-                    if use_tensorboard:
+                    if log_to_tensorboard:
                         # Log test loss to TensorBoard
-                        writer.add_scalar('test_loss', test_loss_value.item(), batch)
-            
-            net.train()
-    
-        # test loop
-        if batch % test_loop_batch == 0:
-            if use_tensorboard:
-                for current_prompt in test_prompts:
-                    prediction = tokenizer.detokenize_segment(
-                        predict_sequence(tokenizer.tokenize_segment(current_prompt), completion_length)
-                    ).replace("\n", "/n")
+                        writer.add_scalar('test_loss', test_loss, batch)
                     
-                    # Log predictions along with the prompt to TensorBoard with enhanced formatting
-                    formatted_text = (
-                        f"---PROMPT---\n{current_prompt}"
-                        "\n\n==========================================================================================================\n\n"
-                        f"---PREDICTION---\n{prediction}"
-                    )
-                    # Overwrite the previous entry for the same prompt
-                    writer.add_text(f'Predictions/{current_prompt}', formatted_text, batch)
-        
-        # save checkpoint
-        if batch % save_cehckpoint_batch == 0:
-            os.makedirs(save_dir, exist_ok=True)
+                    net.train()
+                    train_throughput.report()
+        
+            # test loop
+            if batch % test_loop_batch == 0:
+                if log_to_tensorboard:
+                    # all prompts are generated together as one batch
+                    with stages.stage("generation"):
+                        predictions = generation.predict_sequences([tokenizer.tokenize_segment(current_prompt) for current_prompt in test_prompts], completion_length,
+                                                                   net, get_embeddings(), get_decoder(), context_length=context_length)
+                    
+                    for current_prompt, prediction in zip(test_prompts, predictions):
+                        prediction = tokenizer.detokenize_segment(prediction).replace("\n", "/n")
+                        
+                        # Log predictions along with the prompt to TensorBoard with enhanced formatting
+                        formatted_text = (
+                            f"---PROMPT---\n{current_prompt}"
+                            "\n\n==========================================================================================================\n\n"
+                            f"---PREDICTION---\n{prediction}"
+                        )
+                        # Overwrite the previous entry for the same prompt
+                        writer.add_text(f'Predictions/{current_prompt}', formatted_text, batch)
             
-            torch.save(net, save_dir + "/" + checkpoint_name
-                       .replace("[DATE]", (datetime.utcnow() + timedelta(hours=3)).strftime('%Y-%m-%d %H:%M:%S'))
-                       .replace("[BATCH]", str(batch))
-                       .replace("[EPOCH]", str(epoch)))
-    
-    # Update the learning rate scheduler
-    scheduler.step()
-    
-    if use_tensorboard:
-        # Log learning rate to TensorBoard
-        writer.add_scalar('learning_rate', optimizer.param_groups[0]['lr'], epoch)
+            # save checkpoint (only the copy to cpu happens here, the write is on a background thread)
+            # with eval_in_process the test loss is None here, the evaluator process reports it back to the checkpoint manager later
+            if batch % save_cehckpoint_batch == 0 and main_process:
+                with stages.stage("checkpoint"):
+                    checkpoints.save(net, optimizer, scheduler, batch=batch, epoch=epoch, test_loss=test_loss,
+                                     epoch_batch=epoch_batch, shuffle_seed=sampler_seed, world_size=world_size,
+                                     config={"vector_size": vector_size, "attn_heads": attn_heads, "context_length": context_length})
+        
+        # Update the learning rate scheduler
+        scheduler.step()
+        
+        if log_to_tensorboard:
+            # Log learning rate to TensorBoard
+            writer.add_scalar('learning_rate', optimizer.param_groups[0]['lr'], epoch)
 
-# %%
-net.eval()
-clear_output()
+    # in case training ended inside the profiler window
+    profiler.close()
 
-# %%
-print(tokenizer.detokenize_segment(predict_sequence(tokenizer.tokenize_segment("human: what are some good training exercises for fitness? network: "), 128 * 3)))
+    # make sure the last checkpoint is on disk
+    checkpoints.wait()
+
+    if eval_in_process and main_process:
+        # evaluates the last checkpoint, then exits
+        eval_stop.set()
+        eval_process.join()
+        
+        # the test losses reported since the last save (at least the last checkpoint's) ---> checkpoints.json
+        checkpoints.collect_test_losses()
+
+    if log_to_tensorboard:
+        writer.close()
+
+    distributed.cleanup()
+
+    net.eval()
+    clear_output()
+
+    if main_process:
+        print(tokenizer.detokenize_segment(predict_sequence(tokenizer.tokenize_segment("human: what are some good training exercises for fitness? network: "), 128 * 3, use_kv_cache=use_kv_cache)))
 
 # %%
 #torch.save(net, './REAN_nets/meth_abuser6969123_attn_stack.pth')
@@ -620,6 +856,5 @@ print(tokenizer.detokenize_segment(predict_sequence(tokenizer.tokenize_segment("
 # rec: 34 train 36 test
 
 # %%
-
-
-
+if __name__ == "__main__":
+    main()
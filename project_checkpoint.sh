@@ -1,10 +1,16 @@
 #!/bin/bash
 
+# source only, runs/ embedding_models/ and datasets/ are in .gitignore
 git add .
 git commit -m "automated project checkpoint backup commit"
 git push
+
+# the big artifacts: new chunks only, into the local store and (if ARTIFACT_TARGET is set, e.g. a mounted drive / the training box's store) pushed there
+if [ -n "$ARTIFACT_TARGET" ]; then
+    python artifact_sync.py sync --target "$ARTIFACT_TARGET"
+else
+    python artifact_sync.py snapshot
+fi
   
 # Echo a message with the timestamp
 echo "### ### ### ### ### ### ### ### ### ### ### ###   Checkpoint finished   ### ### ### ### ### ### ### ### ### ### ### ###"
-
-done
\ No newline at end of file
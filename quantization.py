@@ -0,0 +1,170 @@
+import copy
+import torch
+import torch.nn as nn
+import embedding_table
+from rean_model import REAN, attention_mech
+
+def split_attention_projections(net: REAN):
+    """
+    gives every attention_mech standalone nn.Linear copies of its q, k, v and out projections and drops the nn.MultiheadAttention module.\n
+    quantize_dynamic only swaps plain nn.Linear modules, but the fused / cached paths read in_proj_weight directly and out_proj is a NonDynamicallyQuantizableLinear.
+    afterwards the net only has the fused and cached attention paths (set_fused_attention(False) is not possible anymore)
+    """
+
+    for module in net.modules():
+        if not isinstance(module, attention_mech) or module.multihead_attn is None:
+            continue
+
+        multihead_attn = module.multihead_attn
+        vector_size = multihead_attn.embed_dim
+
+        module.in_proj = nn.Linear(vector_size, 3 * vector_size)
+        module.in_proj.weight = nn.Parameter(multihead_attn.in_proj_weight.detach().clone())
+        module.in_proj.bias = nn.Parameter(multihead_attn.in_proj_bias.detach().clone())
+
+        module.out_proj = nn.Linear(vector_size, vector_size)
+        module.out_proj.weight = nn.Parameter(multihead_attn.out_proj.weight.detach().clone())
+        module.out_proj.bias = nn.Parameter(multihead_attn.out_proj.bias.detach().clone())
+
+        module.multihead_attn = None
+        module.fused_attention = True
+
+def quantize_net(net: REAN, dtype: str="int8") -> REAN:
+    """
+    inference only copy of net with dynamically quantized linear layers (the transformer_block fc's and the attention projections).\n
+    int8: weights stored as int8, activations quantized on the fly per batch. fp16: weights stored as float16. runs on cpu only
+
+    Args:
+        net (REAN): the trained net (not modified)
+        dtype (str): "int8" or "fp16"
+
+    Returns:
+        REAN: the quantized net, in eval mode on the cpu
+    """
+
+    quantized_dtypes = {"int8": torch.qint8, "fp16": torch.float16}
+
+    if dtype not in quantized_dtypes:
+        raise ValueError(f"dtype has to be one of {list(quantized_dtypes)}, got {dtype}")
+
+    net = copy.deepcopy(net).cpu().eval()
+    split_attention_projections(net)
+
+    return torch.ao.quantization.quantize_dynamic(net, {nn.Linear}, dtype=quantized_dtypes[dtype])
+
+class quantized_embedding_table(embedding_table.embedding_table):
+    """
+    embedding_table with the vector matrix stored as float16, or as int8 with one scale per row (symmetric, scale = max |value| / 127).\n
+    vectorize_ids dequantizes only the gathered rows, and quantized_nearest_token_decoder decodes straight from the same matrix,
+    so one small copy serves both the lookup and the decoding (the float32 path keeps the raw matrix + a normalised copy)
+    """
+
+    def __init__(self, table: embedding_table.embedding_table, dtype: str="int8", device=torch.device("cpu")):
+        """
+        Args:
+            table (embedding_table): the float32 table to quantize (its token maps are shared, not copied)
+            dtype (str): "int8" or "fp16"
+            device (torch.device): device to keep the quantized matrix on
+        """
+
+        if dtype not in ("int8", "fp16"):
+            raise ValueError(f"dtype has to be int8 or fp16, got {dtype}")
+
+        self.token_ids = table.token_ids
+        self.id_to_token = table.id_to_token
+        self.vector_size = table.vector_size
+        self.vocab_size = table.vocab_size
+        self.dtype = dtype
+        self.device = torch.device(device)
+
+        vectors = table.vectors
+
+        if dtype == "int8":
+            self.scales = (vectors.abs().amax(dim=1) / 127).clamp_min(1e-12)
+            self.quantized = (vectors / self.scales.unsqueeze(1)).round().clamp(-127, 127).to(torch.int8)
+
+            # the not in vocab row stays exactly the table's default
+            self.scales[embedding_table.niv_id] = 1
+            self.quantized[embedding_table.niv_id] = 0
+            self.default_row = vectors[embedding_table.niv_id].clone()
+        else:
+            self.scales = None
+            self.quantized = vectors.to(torch.float16)
+            self.default_row = None
+
+        self.quantized = self.quantized.to(self.device)
+        self.scales = self.scales.to(self.device) if self.scales is not None else None
+
+    @property
+    def vectors(self) -> torch.Tensor:
+        # the plain embedding_table api (e.g. nearest_token_decoder, metrics.save_eval_set): the whole matrix dequantized on the cpu, see vectors_on
+        return self.vectors_on("cpu")
+
+    def vectors_on(self, device) -> torch.Tensor:
+        """
+        dequantizes the whole matrix to float32 on device. made again on every call and not kept, a kept float32 copy would undo the memory saving
+        """
+
+        return self.vectorize_ids(torch.arange(self.vocab_size, device=self.device), device)
+
+    def vectorize_ids(self, ids: torch.Tensor, used_device=None) -> torch.Tensor:
+        """
+        gathers and dequantizes the vectors of ids of any shape, returns a float32 tensor of shape (*ids.shape, vector_size)
+        """
+
+        used_device = ids.device if used_device is None else torch.device(used_device)
+        ids = ids.to(self.device, dtype=torch.int64)
+
+        vectorized = self.quantized[ids].float()
+
+        if self.scales is not None:
+            vectorized *= self.scales[ids].unsqueeze(-1)
+
+            if self.default_row.any():
+                vectorized[ids == embedding_table.niv_id] = self.default_row.to(self.device)
+
+        return vectorized.to(used_device)
+
+    def as_embedding(self) -> nn.Embedding:
+        return nn.Embedding.from_pretrained(self.vectors, freeze=True, padding_idx=embedding_table.niv_id)
+
+    def memory_bytes(self) -> int:
+        return self.quantized.numel() * self.quantized.element_size() + (self.scales.numel() * self.scales.element_size() if self.scales is not None else 0)
+
+class quantized_nearest_token_decoder(embedding_table.nearest_token_decoder):
+    """
+    nearest_token_decoder that works off a quantized_embedding_table's matrix, no normalised float32 copy is made.\n
+    each vocab chunk is dequantized on the fly, so set vocab_chunk_size to bound the temporary float32 memory
+    """
+
+    def __init__(self, table: quantized_embedding_table, not_in_vocab_token=embedding_table.niv_token, NIV_threshold=0.01, vocab_chunk_size=8192):
+        self.table = table
+        self.device = table.device
+        self.not_in_vocab_token = not_in_vocab_token
+        self.NIV_threshold = NIV_threshold
+        self.vocab_chunk_size = vocab_chunk_size
+        self.normed_vectors = None
+
+        # cosine similarity to a row is its dot product over the row's norm (the int8 row scale cancels out)
+        rows = table.quantized[embedding_table.niv_id + 1:]
+        self.inverse_norms = torch.cat([1 / rows[chunk_start:chunk_start + vocab_chunk_size].float().norm(dim=1).clamp_min(1e-12)
+                                        for chunk_start in range(0, len(rows), vocab_chunk_size)])
+
+    def chunk_similarities(self, queries: torch.Tensor, chunk_start: int, chunk_end: int) -> torch.Tensor:
+        rows = self.table.quantized[embedding_table.niv_id + 1 + chunk_start:embedding_table.niv_id + 1 + chunk_end].float()
+
+        return (queries @ rows.T) * self.inverse_norms[chunk_start:chunk_end]
+
+def quantize_for_inference(net: REAN, table: embedding_table.embedding_table, dtype: str="int8", vocab_chunk_size: int=8192, **decoder_kwargs) -> tuple:
+    """
+    the whole inference stack in one go: quantized net, quantized table and a decoder on top of that table
+
+    Returns:
+        REAN: quantize_net(net, dtype)
+        quantized_embedding_table: the table
+        quantized_nearest_token_decoder: the decoder
+    """
+
+    quantized_table = quantized_embedding_table(table, dtype)
+
+    return quantize_net(net, dtype), quantized_table, quantized_nearest_token_decoder(quantized_table, vocab_chunk_size=vocab_chunk_size, **decoder_kwargs)
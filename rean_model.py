@@ -0,0 +1,451 @@
+import math
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.utils.checkpoint import checkpoint
+
+class leaky_tanh_smart(nn.Module):
+    def __init__(self, leaky_range=(0, 3), squishy_range=(0, 3)):
+        super(leaky_tanh_smart, self).__init__()
+        # register leakyness and squishyness as trainable parameters
+        self.leakyness = nn.Parameter(torch.rand(1, dtype=torch.float32) * (leaky_range[1] - leaky_range[0]) + leaky_range[0])
+        self.squishyness = nn.Parameter(torch.rand(1, dtype=torch.float32) * (squishy_range[1] - squishy_range[0]) + squishy_range[0])
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        applies the leaky tanh activation function over the input tensor x.\n
+        for more info on leaky tanh and its parameters go to: https://www.desmos.com/calculator/kpzsfbtqww
+
+        Args:
+            x (torch.Tensor): tensor over which to apply activation function.
+
+        Returns:
+            torch.Tensor: returns x after function applied, keeps the same shape.
+        """
+
+        return F.tanh(x * self.squishyness) + self.leakyness * x
+
+class kv_cache:
+    """
+    keys and values of one attention_mech for every position seen so far, used for incremental decoding.\n
+    preallocated to max_length positions, so appending a token is an in place copy
+    """
+
+    def __init__(self, batch_size: int, max_length: int, attn_heads: int, head_dim: int, device=None, dtype=torch.float32):
+        self.keys = torch.zeros(batch_size, attn_heads, max_length, head_dim, device=device, dtype=dtype)
+        self.values = torch.zeros(batch_size, attn_heads, max_length, head_dim, device=device, dtype=dtype)
+        self.max_length = max_length
+        self.length = 0
+
+    def append(self, keys: torch.Tensor, values: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        """
+        adds keys / values of shape (batch_size, attn_heads, new_positions, head_dim) to the cache
+
+        Returns:
+            torch.Tensor: all cached keys (including the new ones)
+            torch.Tensor: all cached values (including the new ones)
+        """
+
+        new_length = self.length + keys.shape[2]
+
+        if new_length > self.max_length:
+            raise ValueError(f"kv_cache is full: {self.length} + {keys.shape[2]} positions > max_length {self.max_length}")
+
+        self.keys[:, :, self.length:new_length] = keys
+        self.values[:, :, self.length:new_length] = values
+        self.length = new_length
+
+        return self.keys[:, :, :new_length], self.values[:, :, :new_length]
+
+class attention_mech(nn.Module):
+    def __init__(self, vector_size=784, attn_heads=8, max_context_length=128, fused_attention=True):
+        super(attention_mech, self).__init__()
+        # MultiheadAttention module (its weights are also used by the fused and cached paths)
+        self.multihead_attn = nn.MultiheadAttention(embed_dim=vector_size, num_heads=attn_heads)
+        self.attn_heads = attn_heads
+
+        # True ---> batch first scaled_dot_product_attention, False ---> the nn.MultiheadAttention forward
+        self.fused_attention = fused_attention
+
+        # Layer normalization
+        self.norm = nn.LayerNorm(vector_size)
+
+        # standalone nn.Linear copies of the q, k, v / out projections (set by quantization.py so they can be quantized), None ---> multihead_attn's weights are used
+        self.in_proj = None
+        self.out_proj = None
+
+        # causal mask (True = may attend) precomputed once up to max_context_length and sliced per call, not saved in the state_dict
+        self.register_buffer("allowed_mask", torch.ones((max_context_length, max_context_length), dtype=torch.bool).tril(), persistent=False)
+
+    def causal_mask(self, query_start: int, query_length: int, key_length: int, device) -> torch.Tensor:
+        """
+        returns the (query_length, key_length) slice of the causal mask (True = may attend) for queries at positions query_start... and keys at positions 0...
+        """
+
+        if query_start + query_length <= len(self.allowed_mask) and key_length <= len(self.allowed_mask):
+            return self.allowed_mask[query_start:query_start + query_length, :key_length]
+
+        # longer than the precomputed table
+        return torch.arange(key_length, device=device).unsqueeze(0) <= torch.arange(query_start, query_start + query_length, device=device).unsqueeze(1)
+
+    def padded_mask(self, key_padding_mask: torch.Tensor) -> torch.Tensor:
+        """
+        returns the (batch_size, 1, seq_len, seq_len) mask (True = may attend) for left padded rows: causal and never to a padding key.\n
+        every position may still see itself, so padding queries (which have no real key before them) dont end up with nothing to attend to
+
+        Args:
+            key_padding_mask (torch.Tensor): (batch_size, seq_len) bool, True = padding
+        """
+
+        seq_len = key_padding_mask.size(1)
+        allowed = self.causal_mask(0, seq_len, seq_len, key_padding_mask.device) & ~key_padding_mask[:, None, None, :]
+
+        return allowed | torch.eye(seq_len, dtype=torch.bool, device=key_padding_mask.device)
+
+    def in_projection(self, x: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        projects a batch first (batch_size, positions, vector_size) tensor to q, k, v of shape (batch_size, attn_heads, positions, head_dim)
+        """
+
+        batch_size, positions, vector_size = x.size()
+
+        # in_proj_weight is q, k, v stacked
+        if self.in_proj is not None:
+            q, k, v = self.in_proj(x).chunk(3, dim=-1)
+        else:
+            q, k, v = F.linear(x, self.multihead_attn.in_proj_weight, self.multihead_attn.in_proj_bias).chunk(3, dim=-1)
+
+        return tuple(current.reshape(batch_size, positions, self.attn_heads, vector_size // self.attn_heads).transpose(1, 2) for current in (q, k, v))
+
+    def out_projection(self, attn_output: torch.Tensor) -> torch.Tensor:
+        """
+        merges the heads of (batch_size, attn_heads, positions, head_dim) back into (batch_size, positions, vector_size) and applies out_proj + norm
+        """
+
+        batch_size, attn_heads, positions, head_dim = attn_output.size()
+
+        attn_output = attn_output.transpose(1, 2).reshape(batch_size, positions, attn_heads * head_dim)
+        attn_output = self.out_proj(attn_output) if self.out_proj is not None else self.multihead_attn.out_proj(attn_output)
+
+        return self.norm(attn_output)
+
+    def forward(self, x, cache: kv_cache=None, need_weights: bool=False, key_padding_mask: torch.Tensor=None):
+        """
+        Args:
+            x (torch.Tensor): (batch_size, sentence_len, vector_size)
+            cache (kv_cache): incremental decoding, x only holds the positions after the cached ones
+            need_weights (bool): return the (batch_size, sentence_len, sentence_len) attention weights (nn.MultiheadAttention path only),
+                                 False ---> they are never materialised (that (seq, seq) matrix per block is what runs long contexts out of memory)
+            key_padding_mask (torch.Tensor): (batch_size, sentence_len) bool, True = left padding that no real position attends to (see padded_mask)
+
+        Returns:
+            torch.Tensor: (batch_size, sentence_len, vector_size) attention output
+            torch.Tensor: the attention weights, or None
+        """
+
+        if cache is not None:
+            if key_padding_mask is not None:
+                raise ValueError("key_padding_mask isnt supported with a kv_cache (cached sequences arent padded)")
+
+            return self.forward_cached(x, cache), None
+
+        if self.fused_attention and not need_weights:
+            return self.forward_fused(x, key_padding_mask), None
+
+        # Prepare for multi-head attention (transpose to (sentence_len, batch_size, embedding_dim))
+        x = x.transpose(0, 1)
+
+        # causal mask (True = masked out)
+        seq_len = x.size(0)
+
+        if key_padding_mask is not None:
+            # one (seq, seq) mask per row and head
+            causal_mask = (~self.padded_mask(key_padding_mask)).expand(-1, self.attn_heads, -1, -1).reshape(-1, seq_len, seq_len)
+        else:
+            causal_mask = ~self.causal_mask(0, seq_len, seq_len, x.device)
+
+        # Apply multi-head attention with the causal mask
+        attn_output, attn_weights = self.multihead_attn(x, x, x, attn_mask=causal_mask, need_weights=need_weights)
+
+        # Apply layer normalization to the attention output
+        attn_output = self.norm(attn_output)
+
+        # Transpose back to (batch_size, sentence_len, embedding_dim)
+        output = attn_output.transpose(0, 1)
+
+        return output, attn_weights
+
+    def forward_fused(self, x: torch.Tensor, key_padding_mask: torch.Tensor=None) -> torch.Tensor:
+        """
+        same math as the nn.MultiheadAttention path, but batch first (no transposes) and thru pytorch's fused scaled_dot_product_attention with is_causal.\n
+        the attention weights are never materialised, so none are returned
+
+        Args:
+            x (torch.Tensor): (batch_size, sentence_len, vector_size)
+            key_padding_mask (torch.Tensor): (batch_size, sentence_len) bool, True = left padding (None ---> plain is_causal)
+
+        Returns:
+            torch.Tensor: (batch_size, sentence_len, vector_size) attention output
+        """
+
+        q, k, v = self.in_projection(x)
+
+        if key_padding_mask is not None:
+            attn_output = F.scaled_dot_product_attention(q, k, v, attn_mask=self.padded_mask(key_padding_mask))
+        else:
+            attn_output = F.scaled_dot_product_attention(q, k, v, is_causal=True)
+
+        return self.out_projection(attn_output)
+
+    def forward_cached(self, x: torch.Tensor, cache: kv_cache) -> torch.Tensor:
+        """
+        same math as forward() (and the same weights, taken from self.multihead_attn), but only for the new positions in x.\n
+        keys and values of earlier positions come from the cache, and the new ones are added to it
+
+        Args:
+            x (torch.Tensor): (batch_size, new_positions, vector_size) the positions after the ones already in the cache
+            cache (kv_cache): this layer's cache
+
+        Returns:
+            torch.Tensor: (batch_size, new_positions, vector_size) attention output for the new positions
+        """
+
+        new_positions = x.size(1)
+        past_positions = cache.length
+
+        # project the new positions only
+        q, k, v = self.in_projection(x)
+
+        k, v = cache.append(k, v)
+
+        # causal mask shifted by the cached positions (a single new position can see everything)
+        attn_mask = None
+        if new_positions > 1:
+            attn_mask = self.causal_mask(past_positions, new_positions, past_positions + new_positions, x.device)
+
+        attn_output = F.scaled_dot_product_attention(q, k, v, attn_mask=attn_mask)
+
+        return self.out_projection(attn_output)
+
+class positional_encoding(nn.Module):
+    def __init__(self, vector_size=784, max_context_length=128):
+        super(positional_encoding, self).__init__()
+
+        # the sin / cos table is built once up to max_context_length and sliced per call, not saved in the state_dict
+        self.register_buffer("pe", self.build_table(0, max_context_length, vector_size), persistent=False)
+
+    @staticmethod
+    def build_table(start_position: int, context_length: int, vector_size: int, device=None) -> torch.Tensor:
+        # Generate positions (shape: [context_length, 1])
+        position = torch.arange(start_position, start_position + context_length, dtype=torch.float).unsqueeze(1).to(device)
+
+        # Compute the divisor term (shape: [vector_size // 2])
+        div_term = torch.exp(torch.arange(0, vector_size, 2).float() * (-math.log(10000.0) / vector_size)).to(device)
+
+        # Initialize positional encoding tensor (shape: [context_length, vector_size])
+        pe = torch.zeros(context_length, vector_size, device=device)
+
+        # Apply sine to even indices and cosine to odd indices
+        pe[:, 0::2] = torch.sin(position * div_term)  # sine for even indices
+        pe[:, 1::2] = torch.cos(position * div_term)  # cosine for odd indices
+
+        return pe
+
+    def forward(self, x, start_position: int=0, padding: torch.Tensor=None):
+        batch_size, context_length, vector_size = x.size()
+
+        if padding is not None:
+            # left padded rows: positions count from each row's first real token (padding positions all get position 0), so a padded row is encoded like the unpadded sequence
+            positions = (torch.arange(start_position, start_position + context_length, device=x.device).unsqueeze(0) - padding.unsqueeze(1)).clamp(min=0)
+            table = self.pe if start_position + context_length <= len(self.pe) and vector_size == self.pe.shape[1] else self.build_table(0, start_position + context_length, vector_size, device=x.device)
+
+            return x + table[positions]
+
+        # positions are shifted when only the newest positions are passed in (kv caching)
+        if start_position + context_length <= len(self.pe) and vector_size == self.pe.shape[1]:
+            pe = self.pe[start_position:start_position + context_length]
+        else:
+            # longer than the precomputed table
+            pe = self.build_table(start_position, context_length, vector_size, device=x.device)
+
+        # Add positional encoding to the input
+        x = x + pe.unsqueeze(0)  # Add positional encoding, shape becomes (batch_size, context_length, vector_size)
+
+        return x
+
+class transformer_block(nn.Module):
+    def __init__(self, vector_size=784, attn_heads=8, max_context_length=128, fused_attention=True):
+        super(transformer_block, self).__init__()
+
+        self.activ_func = leaky_tanh_smart()
+
+        self.attn = attention_mech(vector_size, attn_heads, max_context_length, fused_attention)
+
+        self.fc = nn.Linear(vector_size, vector_size)
+
+        self.norm1 = nn.LayerNorm(vector_size)
+        self.norm2 = nn.LayerNorm(vector_size)
+
+    def forward(self, x: torch.Tensor, cache: kv_cache=None, key_padding_mask: torch.Tensor=None) -> torch.Tensor:
+        x = self.norm1(x + self.attn(x, cache, key_padding_mask=key_padding_mask)[0])
+        x = self.norm2(x + self.activ_func(self.fc(x)))
+
+        return x
+
+class REAN(nn.Module):
+    def __init__(self, vector_size=784, attn_heads=8, max_context_length=128, fused_attention=True, activation_checkpointing=False):
+        """
+        Args:
+            vector_size (int): embedding dim (the word2vec model's vector_size)
+            attn_heads (int): num attention heads per mechanism
+            max_context_length (int): positional encoding / causal mask tables are precomputed up to this length (longer inputs still work, just slower)
+            fused_attention (bool): use the fused scaled_dot_product_attention path, False ---> the nn.MultiheadAttention modules (same weights)
+            activation_checkpointing (bool): recompute each transformer_block's activations in backward instead of keeping them (see set_activation_checkpointing)
+        """
+
+        super(REAN, self).__init__()
+
+        self.vector_size = vector_size
+        self.attn_heads = attn_heads
+        self.activation_checkpointing = activation_checkpointing
+
+        self.pos_encoding = positional_encoding(vector_size, max_context_length)
+
+        self.tblock1 = transformer_block(vector_size, attn_heads, max_context_length, fused_attention)
+        self.tblock2 = transformer_block(vector_size, attn_heads, max_context_length, fused_attention)
+        self.tblock3 = transformer_block(vector_size, attn_heads, max_context_length, fused_attention)
+        self.tblock4 = transformer_block(vector_size, attn_heads, max_context_length, fused_attention)
+
+    def set_fused_attention(self, fused_attention: bool):
+        """
+        switches every attention_mech between the fused path and the nn.MultiheadAttention path (weights are shared, so this can be done any time)
+        """
+
+        for module in self.modules():
+            if isinstance(module, attention_mech):
+                module.fused_attention = fused_attention
+
+    def set_activation_checkpointing(self, activation_checkpointing: bool):
+        """
+        True ---> during training only the input of every transformer_block is kept for backward, its activations are recomputed there.\n
+        activation memory drops to about one block's worth (instead of all four) for roughly one extra forward per step, inference is not affected
+        """
+
+        self.activation_checkpointing = activation_checkpointing
+
+    def run_block(self, block: transformer_block, segment: torch.Tensor, key_padding_mask: torch.Tensor=None) -> torch.Tensor:
+        # only checkpoint when a graph is being built (no_grad / inference just runs the block)
+        if self.activation_checkpointing and torch.is_grad_enabled():
+            return checkpoint(block, segment, key_padding_mask=key_padding_mask, use_reentrant=False)
+
+        return block(segment, key_padding_mask=key_padding_mask)
+
+    def forward(self, segment: torch.Tensor, lengths: torch.Tensor=None) -> torch.Tensor:
+        """
+        this function is primarily used for training, where the network needs to predict the next token, for every token in the sequence
+
+        Args:
+            segment (torch.Tensor): this is a tensor of size (batches, context_length, vector_size) representing a sequence of tokens (of course from the tokenizer and using the correct word2vec model)
+            lengths (torch.Tensor): (batches,) how many of the last positions of each row are real tokens, the ones before are left padding (like pad_or_truncate makes).
+                                    padding is never attended to and positions count from the first real token, so a padded row gives the same outputs at its real positions
+                                    as the unpadded sequence alone (a row with length 0 acts like a single padding vector). None ---> every position is a real token
+
+        Returns:
+            torch.Tensor: a tensor of shape (batches, context_length, vector_size) (same as segment) representing the sequence predicted by the network shifted future-way
+        """
+
+        ###                  INPUT                 ###
+        #    (batches, context_len, vector_size)
+        #                      ↓
+
+        padding = key_padding_mask = None
+
+        if lengths is not None:
+            padding = (segment.size(1) - lengths).clamp(min=0)
+            key_padding_mask = torch.arange(segment.size(1), device=segment.device).unsqueeze(0) < padding.unsqueeze(1)
+
+        segment = self.pos_encoding(segment, padding=padding)
+
+        segment = self.run_block(self.tblock1, segment, key_padding_mask)
+        segment = self.run_block(self.tblock2, segment, key_padding_mask)
+        segment = self.run_block(self.tblock3, segment, key_padding_mask)
+        segment = self.run_block(self.tblock4, segment, key_padding_mask)
+
+        return segment
+
+        #                      ↓
+        #    (batches, context_len, vector_size)
+        ###                 OUTPUT                 ###
+
+    def predict(self, segment: torch.Tensor, lengths: torch.Tensor=None) -> torch.Tensor:
+        """
+        function is for predicting the embeddings vector of the next token in a given sequence
+
+        Args:
+            segment (torch.Tensor): this is a tensor of size (batches, context_length, vector_size) representing a sequence of tokens (of course from the tokenizer and using the correct word2vec model)
+            lengths (torch.Tensor): (batches,) real tokens at the end of each left padded row, see forward() (None ---> no padding)
+
+        Returns:
+            torch.Tensor: a tensor of shape (batches, vector_size) representing the embeddings vector of the next token to be added into the sequence
+        """
+
+        ###                  INPUT                 ###
+        #    (batches, context_len, vector_size)
+        #                      ↓
+
+        segment = self.forward(segment, lengths)
+
+        return segment[:, -1, :]
+
+        #                      ↓
+        #           (batches, vector_size)
+        ###                 OUTPUT                 ###
+
+    def new_caches(self, batch_size: int, max_length: int) -> list[kv_cache]:
+        """
+        makes empty key / value caches (one per transformer_block) for forward_cached / predict_cached
+
+        Args:
+            batch_size (int): number of sequences decoded together
+            max_length (int): max number of positions the caches can hold (keep at the net's context length)
+
+        Returns:
+            list[kv_cache]: the caches, on the net's device
+        """
+
+        param = next(self.parameters())
+
+        return [kv_cache(batch_size, max_length, self.attn_heads, self.vector_size // self.attn_heads, device=param.device, dtype=param.dtype)
+                for _ in range(4)]
+
+    def forward_cached(self, segment: torch.Tensor, caches: list[kv_cache]) -> torch.Tensor:
+        """
+        incremental version of forward(): only the positions after the ones already in caches are passed in and computed.\n
+        feeding a sequence in any number of pieces gives the same outputs as forward() on the whole sequence (within float tolerance)
+
+        Args:
+            segment (torch.Tensor): (batches, new_positions, vector_size) the next positions of the sequence
+            caches (list[kv_cache]): from new_caches(), updated in place
+
+        Returns:
+            torch.Tensor: (batches, new_positions, vector_size) outputs for the new positions
+        """
+
+        segment = self.pos_encoding(segment, start_position=caches[0].length)
+
+        segment = self.tblock1(segment, caches[0])
+        segment = self.tblock2(segment, caches[1])
+        segment = self.tblock3(segment, caches[2])
+        segment = self.tblock4(segment, caches[3])
+
+        return segment
+
+    def predict_cached(self, segment: torch.Tensor, caches: list[kv_cache]) -> torch.Tensor:
+        """
+        incremental version of predict(), see forward_cached()
+
+        Returns:
+            torch.Tensor: a tensor of shape (batches, vector_size) representing the embeddings vector of the next token
+        """
+
+        return self.forward_cached(segment, caches)[:, -1, :]
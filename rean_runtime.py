@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import argparse
+import torch
+import tokenizer
+
+# deliberately nothing else from the project: no rean_model, embedding_table, gensim or training script, so loading is just torch + the artifact
+
+class rean_runtime:
+    """
+    minimal cpu inference for an artifact written by export_artifact.py: the graph does lookup + net + decoding, this only keeps the window of ids.\n
+    generation matches generation.predict_sequences (window of the last context_length ids, left padded with niv_id and masked by the rows' lengths).
+    the graph is traced at the full context_length, so unlike predict_sequences short prompts arent run at shorter shapes
+    """
+
+    def __init__(self, artifact_dir: str, threads: int=None):
+        """
+        Args:
+            artifact_dir (str): directory from export_artifact.py
+            threads (int): torch intra-op threads (None ---> torch's default)
+        """
+
+        if threads is not None:
+            torch.set_num_threads(threads)
+
+        with open(os.path.join(artifact_dir, "artifact.json")) as file:
+            self.config = json.load(file)
+
+        with open(os.path.join(artifact_dir, "vocab.json"), encoding="utf-8") as file:
+            self.id_to_token = json.load(file)
+
+        self.token_ids = {token: token_id for token_id, token in enumerate(self.id_to_token) if token_id != self.config["niv_id"]}
+        self.context_length = self.config["context_length"]
+        self.niv_id = self.config["niv_id"]
+
+        graph_path = os.path.join(artifact_dir, self.config["graph"])
+
+        if self.config["format"] == "onnx":
+            import onnxruntime
+
+            session = onnxruntime.InferenceSession(graph_path, providers=["CPUExecutionProvider"])
+            self.next_ids = lambda window, lengths: torch.from_numpy(session.run(None, {"window_ids": window.numpy(), "lengths": lengths.numpy()})[0])
+        else:
+            graph = torch.jit.load(graph_path, map_location="cpu")
+            self.next_ids = graph
+
+    def window(self, prompts: list[list[str]]) -> tuple[torch.Tensor, torch.Tensor]:
+        # (batch, context_length) ids of the last context_length tokens of every prompt, left padded with niv_id + (batch,) real tokens per row
+        window = torch.full((len(prompts), self.context_length), self.niv_id, dtype=torch.int64)
+        lengths = torch.tensor([min(len(prompt), self.context_length) for prompt in prompts], dtype=torch.int64)
+
+        for row, prompt in enumerate(prompts):
+            ids = [self.token_ids.get(token, self.niv_id) for token in prompt[-self.context_length:]]
+
+            if ids:
+                window[row, -len(ids):] = torch.tensor(ids, dtype=torch.int64)
+
+        return window, lengths
+
+    def token(self, token_id: int) -> str:
+        return self.config["not_in_vocab_token"] if token_id == self.niv_id else self.id_to_token[token_id]
+
+    def stream_batch(self, prompts: list[list[str]], num_tokens: int):
+        """
+        generates num_tokens tokens for every tokenized prompt at once, yields a list with each prompt's next token after every step
+        """
+
+        window, lengths = self.window(prompts)
+
+        with torch.inference_mode():
+            for _ in range(num_tokens):
+                next_ids = self.next_ids(window, lengths)
+
+                # slide the window by the new tokens
+                window = torch.cat((window[:, 1:], next_ids.unsqueeze(1)), dim=1)
+                lengths = (lengths + 1).clamp(max=self.context_length)
+
+                yield [self.token(token_id) for token_id in next_ids.tolist()]
+
+    def stream(self, prompt: str, num_tokens: int):
+        """
+        yields the tokens of one text prompt's completion as they are produced
+        """
+
+        for tokens in self.stream_batch([tokenizer.tokenize_segment(prompt)], num_tokens):
+            yield tokens[0]
+
+    def complete(self, prompt: str, num_tokens: int) -> str:
+        return tokenizer.detokenize_segment(list(self.stream(prompt, num_tokens)))
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+
+    parser = argparse.ArgumentParser(description="complete a prompt with an exported REAN artifact")
+    parser.add_argument("artifact", help="directory from export_artifact.py")
+    parser.add_argument("prompt")
+    parser.add_argument("--tokens", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    rean = rean_runtime(args.artifact, args.threads)
+    first_token_time = None
+
+    for current_idx, token in enumerate(rean.stream(args.prompt, args.tokens)):
+        if current_idx == 0:
+            first_token_time = time.perf_counter() - start
+
+        print(token, end="", flush=True)
+
+    # nothing to time with --tokens 0
+    if first_token_time is not None:
+        print(f"\n\nfirst token after {first_token_time * 1000:.0f}ms (since the script started), {args.tokens} tokens in {(time.perf_counter() - start) * 1000:.0f}ms")
@@ -0,0 +1,132 @@
+import os
+import time
+import contextlib
+import torch
+
+def pick_device(preferred: str=None) -> torch.device:
+    """
+    picks the device to run REAN on: preferred if given, else cuda if there is one, else cpu
+
+    Args:
+        preferred (str): e.g. "cuda", "cuda:1", "cpu" (None ---> auto)
+
+    Returns:
+        torch.device: the device
+    """
+
+    if preferred is not None:
+        return torch.device(preferred)
+
+    if torch.cuda.is_available():
+        return torch.device("cuda")
+
+    return torch.device("cpu")
+
+def configure_threads(device: torch.device, loader_workers: int=0, intra_op_threads: int=None, inter_op_threads: int=None, processes: int=1) -> tuple[int, int]:
+    """
+    sets torch's intra-op / inter-op thread counts.\n
+    on cpu the DataLoader worker processes compete with the math for the same cores, so the intra-op pool only gets the cores they leave over.
+    on gpu the host threads mostly just launch kernels, so torch's defaults are kept unless given
+
+    Args:
+        device (torch.device): the run device
+        loader_workers (int): total DataLoader worker processes (all loaders together)
+        intra_op_threads (int): override, None ---> cores / processes - loader_workers on cpu
+        inter_op_threads (int): override, None ---> 1 on cpu (REAN is one sequential chain of ops)
+        processes (int): training processes sharing this machine's cores (data parallel ranks per node)
+
+    Returns:
+        tuple[int, int]: the intra-op and inter-op thread counts now in use
+    """
+
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+
+    if device.type == "cpu":
+        intra_op_threads = intra_op_threads or max(cores // processes - loader_workers, 1)
+        inter_op_threads = inter_op_threads or 1
+
+    if intra_op_threads is not None:
+        torch.set_num_threads(intra_op_threads)
+
+    if inter_op_threads is not None:
+        # can only be set before the first parallel work in the process
+        try:
+            torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError:
+            pass
+
+    return torch.get_num_threads(), torch.get_num_interop_threads()
+
+def autocast(device: torch.device, enabled: bool=True):
+    """
+    bfloat16 autocast on cpu (forward + backward of REAN run in bf16 where its safe, weights stay fp32).\n
+    on other devices (or enabled=False) its a no-op context, so it can wrap the training step unconditionally
+    """
+
+    if enabled and device.type == "cpu":
+        return torch.autocast(device_type="cpu", dtype=torch.bfloat16)
+
+    return contextlib.nullcontext()
+
+class throughput_meter:
+    """
+    counts tokens between reports and returns tokens/sec
+    """
+
+    def __init__(self):
+        self.tokens = 0
+        self.start = time.perf_counter()
+
+    def update(self, tokens: int):
+        self.tokens += tokens
+
+    def report(self) -> float:
+        """
+        returns tokens/sec since the last report (and starts counting again)
+        """
+
+        now = time.perf_counter()
+        tokens_per_sec = self.tokens / max(now - self.start, 1e-9)
+
+        self.tokens = 0
+        self.start = now
+
+        return tokens_per_sec
+
+def grouped(iterable, size: int):
+    """
+    yields lists of size consecutive items of iterable (the last one can be shorter), e.g. the micro batches that make up one gradient accumulation step
+    """
+
+    group = []
+
+    for item in iterable:
+        group.append(item)
+
+        if len(group) == size:
+            yield group
+            group = []
+
+    if group:
+        yield group
+
+def length_bucket(length: int, max_length: int, min_bucket: int=16) -> int:
+    """
+    the padded length a sequence of length tokens runs at: the next power of two (at least min_bucket), capped at max_length.\n
+    grouping sequences by bucket keeps the number of distinct shapes small while short sequences run at short shapes
+
+    Args:
+        length (int): real tokens in the sequence
+        max_length (int): the longest shape (the net's context length)
+        min_bucket (int): smallest shape
+
+    Returns:
+        int: the bucket length
+    """
+
+    bucket = min_bucket
+
+    while bucket < length:
+        bucket *= 2
+
+    return min(bucket, max_length)
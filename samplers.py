@@ -0,0 +1,69 @@
+import math
+import torch
+from torch.utils.data import Sampler
+
+class resumable_random_sampler(Sampler):
+    """
+    shuffles like DataLoader(shuffle=True), but the order only depends on (seed, epoch), so a resumed run sees exactly the examples it would have seen.\n
+    skip(num_examples) makes the next epoch start that many examples in (for resuming mid epoch)
+    """
+
+    def __init__(self, data_len: int, seed: int=0):
+        self.data_len = data_len
+        self.seed = seed
+        self.epoch = 0
+        self.skip_examples = 0
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def skip(self, num_examples: int):
+        self.skip_examples = num_examples
+
+    def __len__(self):
+        return self.data_len - self.skip_examples
+
+    def epoch_order(self) -> torch.Tensor:
+        # this epoch's permutation minus the skipped examples (consumes the skip)
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+
+        order = torch.randperm(self.data_len, generator=generator)[self.skip_examples:]
+
+        # only skip once
+        self.skip_examples = 0
+
+        return order
+
+    def __iter__(self):
+        return iter(self.epoch_order().tolist())
+
+class sharded_resumable_sampler(resumable_random_sampler):
+    """
+    resumable_random_sampler for data parallel training: every rank draws the same (seed, epoch) permutation and takes every num_replicas-th example of it,
+    so the ranks see disjoint shards that together cover the epoch.\n
+    the order is padded (wrapping around) until it splits evenly, every rank has to run the same number of batches or the gradient all-reduce hangs.
+    skip(num_examples) counts examples of the whole epoch (all ranks together), so a run can resume on a different number of processes
+    """
+
+    def __init__(self, data_len: int, num_replicas: int=1, rank: int=0, seed: int=0):
+        super().__init__(data_len, seed=seed)
+
+        if not 0 <= rank < num_replicas:
+            raise ValueError(f"rank has to be in [0, {num_replicas}), got {rank}")
+
+        self.num_replicas = num_replicas
+        self.rank = rank
+
+    def __len__(self):
+        return math.ceil((self.data_len - self.skip_examples) / self.num_replicas)
+
+    def __iter__(self):
+        order = self.epoch_order()
+
+        padding = -len(order) % self.num_replicas
+
+        if padding and len(order):
+            order = torch.cat([order, order.repeat(math.ceil(padding / len(order)))[:padding]])
+
+        return iter(order[self.rank::self.num_replicas].tolist())
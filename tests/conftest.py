@@ -0,0 +1,52 @@
+import os
+import sys
+import pytest
+import torch
+
+# the tests import the project modules from the repo root and the synthetic corpus / model from benchmarks/
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(repo_root, "benchmarks"))
+
+import synthetic                  # also puts the repo root on sys.path
+import tokenizer
+import embedding_table
+from rean_model import REAN
+
+# small enough to run on a cpu in seconds, context_length short so generation runs past it
+vector_size = 32
+attn_heads = 4
+context_length = 16
+
+@pytest.fixture(scope="session")
+def text() -> str:
+    return synthetic.synthetic_text(num_words=20000)
+
+@pytest.fixture(scope="session")
+def tokens(text) -> list[str]:
+    return tokenizer.tokenize_segment(text)
+
+@pytest.fixture(scope="session")
+def table(text) -> embedding_table.embedding_table:
+    return embedding_table.embedding_table.from_model(synthetic.synthetic_model(text, vector_size=vector_size))
+
+@pytest.fixture(scope="session")
+def decoder(table) -> embedding_table.nearest_token_decoder:
+    return embedding_table.nearest_token_decoder(table, not_in_vocab_token="[NIV]", NIV_threshold=0.01)
+
+@pytest.fixture
+def net() -> REAN:
+    torch.manual_seed(0)
+
+    return REAN(vector_size, attn_heads, max_context_length=context_length).eval()
+
+@pytest.fixture
+def script(table, decoder, net):
+    # the training script (imports without side effects) with the synthetic table / decoder / net standing in for the real ones, like benchmarks/suite.py
+    import normal_train_2_pyver as script
+
+    saved = (script.embeddings_table, script.embeddings_decoder, script.net, script.context_length)
+    script.embeddings_table, script.embeddings_decoder, script.net, script.context_length = table, decoder, net, context_length
+
+    yield script
+
+    script.embeddings_table, script.embeddings_decoder, script.net, script.context_length = saved
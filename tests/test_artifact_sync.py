@@ -0,0 +1,26 @@
+import os
+import artifact_sync
+
+def test_snapshot_of_repeated_chunks_writes_each_once(tmp_path, monkeypatch):
+    # manifest keys are relative to the working directory
+    monkeypatch.chdir(tmp_path)
+
+    # all zeros ---> every chunk of the file has the same digest, and the 8 workers all see it at once
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "zeros.bin").write_bytes(bytes(64 * 1024))
+
+    for attempt in range(3):
+        store = artifact_sync.chunk_store(str(tmp_path / f"store_{attempt}"))
+        manifest, report = artifact_sync.snapshot(["data"], store, workers=8, average_size=1024, min_size=256, max_size=2048)
+
+        chunks = [name for _, _, names in os.walk(store.chunks_dir) for name in names]
+        (chunk_size,) = {size for entry in manifest["files"].values() for _, size in entry["chunks"]}
+
+        assert len(chunks) == 1 and report["new_chunks"] == 1
+        assert report["new_bytes"] == chunk_size
+        assert report["deduplicated_bytes"] == 64 * 1024 - chunk_size
+
+        artifact_sync.restore(store, str(tmp_path / f"restored_{attempt}"))
+        assert list(manifest["files"]) == ["data/zeros.bin"]
+        assert (tmp_path / f"restored_{attempt}" / "data" / "zeros.bin").read_bytes() == bytes(64 * 1024)
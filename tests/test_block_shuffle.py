@@ -0,0 +1,74 @@
+from collections import Counter
+import pytest
+from torch.utils.data import DataLoader
+import block_shuffle
+import token_shards
+from conftest import context_length
+
+# small blocks / buffer / batches, so a 200 example epoch has many blocks, spans the buffer and ends in a partial batch
+num_examples = 200
+batch_size = 6
+block_examples = 16
+shuffle_buffer = 8
+
+@pytest.fixture(params=["text", "shards"])
+def dataset(request, script, table, text, tmp_path):
+    path = tmp_path / "train.txt"
+    path.write_text(text, encoding="utf-8")
+
+    shards_path = None
+
+    if request.param == "shards":
+        shards_path = str(tmp_path / "shards")
+        token_shards.build_token_shards(str(path), shards_path, table.token_ids)
+
+    return script.REAN_dataset(str(path), num_examples, context_length, verify_dataset_size=False, shards_path=shards_path, token_ids=True)
+
+def rows(batches) -> list[tuple]:
+    return [tuple(row) for batch in batches for row in batch.tolist()]
+
+def stream(dataset, **kwargs) -> block_shuffle.block_shuffled_dataset:
+    return block_shuffle.block_shuffled_dataset(dataset, batch_size, block_examples, shuffle_buffer, readahead_blocks=2, seed=3, **kwargs)
+
+def test_every_example_once_per_epoch(dataset):
+    expected = Counter(tuple(dataset.construct_ids(index).tolist()) for index in range(len(dataset)))
+
+    current_stream = stream(dataset)
+    batches = list(current_stream)
+
+    assert len(batches) == len(current_stream)
+    assert Counter(rows(batches)) == expected
+
+def test_order_only_depends_on_seed_and_epoch(dataset):
+    current_stream = stream(dataset)
+    current_stream.set_epoch(1)
+    first = rows(current_stream)
+
+    assert rows(stream(dataset)) != first
+
+    other_stream = stream(dataset)
+    other_stream.set_epoch(1)
+
+    assert rows(other_stream) == first
+
+@pytest.mark.parametrize("skipped_batches", [0, 1, 7, 8])
+def test_skip_with_two_workers_resumes_the_epoch(dataset, skipped_batches):
+    current_stream = stream(dataset, num_workers=2)
+    current_stream.set_epoch(2)
+
+    loader = DataLoader(current_stream, batch_size=None, num_workers=2)
+    full = rows(loader)
+
+    # exactly the batches of the uninterrupted epoch after the skip point (only full batches come before it), in the same order
+    current_stream.skip(skipped_batches * batch_size)
+
+    assert rows(loader) == full[skipped_batches * batch_size:]
+    assert Counter(full) == Counter(tuple(dataset.construct_ids(index).tolist()) for index in range(len(dataset)))
+
+def test_ranks_get_equal_length_covering_shards(dataset):
+    streams = [stream(dataset, num_replicas=2, rank=rank) for rank in range(2)]
+    batches = [list(current_stream) for current_stream in streams]
+
+    # the same number of batches on every rank (or the all-reduce hangs), padded with repeats
+    assert len(batches[0]) == len(batches[1]) == len(streams[0]) == len(streams[1])
+    assert set(rows(batches[0]) + rows(batches[1])) == {tuple(dataset.construct_ids(index).tolist()) for index in range(len(dataset))}
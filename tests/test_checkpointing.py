@@ -0,0 +1,54 @@
+import json
+import threading
+import torch
+import checkpointing
+import metrics
+from conftest import vector_size, attn_heads, context_length
+
+def save(manager, net, batch: int, test_loss: float=None):
+    optimizer = torch.optim.Adam(net.parameters())
+
+    manager.save(net, optimizer, torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, 10), batch=batch, epoch=0, test_loss=test_loss,
+                 config={"vector_size": vector_size, "attn_heads": attn_heads, "context_length": context_length})
+    manager.wait()
+
+def test_reported_test_loss_picks_the_best_checkpoint(net, tmp_path):
+    manager = checkpointing.checkpoint_manager(str(tmp_path), "checkpoint_[BATCH].pth", keep_last=1)
+
+    save(manager, net, 1)
+    assert manager.best() is None
+
+    # the evaluator process reports the first checkpoint's loss, the next save takes it in (and keeps the first one as the best)
+    checkpointing.report_test_loss(str(tmp_path), "checkpoint_1.pth", 0.5)
+    save(manager, net, 2)
+    assert manager.best() == str(tmp_path / "checkpoint_1.pth")
+
+    # a better one, reported after the last save
+    checkpointing.report_test_loss(str(tmp_path), "checkpoint_2.pth", 0.25)
+    manager.collect_test_losses()
+    assert manager.best() == str(tmp_path / "checkpoint_2.pth")
+
+    # a checkpoint's own test loss is not overwritten by a report
+    save(manager, net, 3, test_loss=1.0)
+    checkpointing.report_test_loss(str(tmp_path), "checkpoint_3.pth", 0.1)
+    manager.collect_test_losses()
+    assert manager.best() == str(tmp_path / "checkpoint_2.pth")
+
+    with open(tmp_path / "checkpoints.json") as file:
+        assert [current["test_loss"] for current in json.load(file)["checkpoints"]] == [0.25, 1.0]
+
+def test_checkpoint_evaluator_reports_back(net, table, tokens, tmp_path):
+    save_dir = str(tmp_path / "weights")
+    manager = checkpointing.checkpoint_manager(save_dir, "checkpoint_[BATCH].pth")
+    save(manager, net, 1)
+
+    eval_ids = table.batch_ids([tokens[start:start + context_length + 1] for start in range(0, 70, 7)], context_length + 1)
+    metrics.save_eval_set(str(tmp_path / "eval_set.pt"), eval_ids, table.vectors)
+
+    # stop_event already set ---> one pass over the latest checkpoint
+    stop_event = threading.Event()
+    stop_event.set()
+    metrics.checkpoint_evaluator(save_dir, str(tmp_path / "eval_set.pt"), str(tmp_path / "logs"), device="cpu", autocast=False, stop_event=stop_event)
+
+    manager.collect_test_losses()
+    assert manager.best() == str(tmp_path / "weights" / "checkpoint_1.pth")
@@ -0,0 +1,46 @@
+import os
+import json
+import pytest
+import dataset_cleaner
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+fixture_path = os.path.join(repo_root, "tests", "fixtures", "comparison_sample.json")
+
+def notebook_clean(in_path: str, out_path: str):
+    # runs the cells of assWipe©_dataset_cleaner.ipynb as they are, on in_path instead of the real dump
+    with open(os.path.join(repo_root, "assWipe©_dataset_cleaner.ipynb"), encoding="utf-8") as file:
+        cells = ["".join(cell["source"]) for cell in json.load(file)["cells"] if cell["cell_type"] == "code"]
+
+    namespace = {}
+    exec(cells[0], namespace)
+    namespace.update(freaky_dataset_path=in_path, clean_dataset_path=out_path)
+
+    for cell in cells[1:]:
+        exec(cell, namespace)
+
+# the notebook's allowed_chars has a "\/" escape
+@pytest.mark.filterwarnings("ignore:invalid escape sequence:DeprecationWarning")
+@pytest.mark.parametrize("chunk_size", [7, 100, dataset_cleaner.chunk_size])
+def test_clean_file_matches_the_notebook(chunk_size, tmp_path):
+    notebook_clean(fixture_path, str(tmp_path / "notebook.txt"))
+    dataset_cleaner.clean_file(fixture_path, str(tmp_path / "cleaner.txt"), chunk_size=chunk_size, processes=1)
+
+    assert (tmp_path / "cleaner.txt").read_bytes() == (tmp_path / "notebook.txt").read_bytes()
+
+def test_merged_passes_fall_back_where_the_order_matters():
+    # the score / source fields are one regex pass, a deleted field joining the text around it into another one is still deleted like one by one
+    passes = dataset_cleaner.replace_passes()
+    assert len(passes) < len(dataset_cleaner.replace_sequences)
+
+    for text in ['"sco"score": 1.0,re": 2.0,', '"source":"source": "gpt4" "gpt4"', '"source": "gpt4"score": 3.0,', '"score": 5.0, "source": "gpt4"']:
+        expected = text
+
+        for current_replace, replacement in dataset_cleaner.replace_sequences.items():
+            expected = expected.replace(current_replace, replacement)
+
+        result = text
+
+        for current_pass in passes:
+            result = current_pass.apply(result)
+
+        assert result == expected
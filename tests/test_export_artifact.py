@@ -0,0 +1,23 @@
+import pytest
+import torch
+import export_artifact
+from rean_runtime import rean_runtime
+from conftest import context_length
+
+@pytest.mark.parametrize("export_format", list(export_artifact.graph_files))
+def test_exported_artifact_matches_the_eager_graph(net, table, tokens, tmp_path, export_format):
+    if export_format == "onnx":
+        pytest.importorskip("onnx")
+        pytest.importorskip("onnxruntime")
+
+    export_artifact.export(net, table, str(tmp_path), context_length, export_format)
+    rean = rean_runtime(str(tmp_path))
+
+    # short (padded), full and longer than the window, in one batch of another size than the traced one
+    window, lengths = rean.window([tokens[100:105], tokens[200:200 + context_length], tokens[300:300 + context_length + 7]])
+
+    with torch.no_grad():
+        expected = export_artifact.next_token_graph(net, table).eval()(window, lengths)
+
+    assert torch.equal(rean.next_ids(window, lengths), expected)
+    assert len(list(rean.stream_batch([tokens[100:105]], 3))) == 3
@@ -0,0 +1,23 @@
+import pytest
+import generation
+from conftest import context_length
+
+# prompt lengths: empty, short, exactly the context length, longer than it
+prompt_lengths = [0, 5, context_length, context_length + 7]
+
+@pytest.mark.parametrize("prompt_length", prompt_lengths)
+def test_kv_cache_matches_uncached(script, tokens, prompt_length):
+    # up to and well past context_length positions, where the cached path has to refill its cache every step
+    prompt = tokens[100:100 + prompt_length]
+    num_tokens = context_length * 2 + 3
+
+    assert script.predict_sequence(prompt, num_tokens, use_kv_cache=True) == script.predict_sequence(prompt, num_tokens)
+
+def test_predict_sequences_matches_predict_sequence(script, net, table, decoder, tokens):
+    # different lengths in one batch (left padded), batch_size 3 ---> several batches of different buckets
+    prompts = [tokens[100 + start:100 + start + prompt_length] for start, prompt_length in enumerate(prompt_lengths + [1, 9, 2])]
+    num_tokens = context_length + 5
+
+    batched = generation.predict_sequences(prompts, num_tokens, net, table, decoder, context_length=context_length, batch_size=3)
+
+    assert batched == [script.predict_sequence(prompt, num_tokens) for prompt in prompts]
@@ -0,0 +1,79 @@
+import json
+import asyncio
+import inference_server
+from conftest import context_length
+
+async def post_complete(port: int, payload: dict) -> tuple[str, bytes]:
+    body = json.dumps(payload).encode()
+
+    return await post_raw(port, f"POST /complete HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+
+async def post_raw(port: int, request: bytes) -> tuple[str, bytes]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+
+    writer.write(request)
+    await writer.drain()
+
+    response = await reader.read()
+    writer.close()
+
+    status_line, _, rest = response.partition(b"\r\n")
+
+    return status_line.decode(), rest.partition(b"\r\n\r\n")[2]
+
+def test_failed_step_answers_its_requests_and_the_batcher_keeps_serving(net, table, decoder):
+    batcher = inference_server.dynamic_batcher(net, table, decoder, context_length, max_wait_ms=1)
+    step = batcher.step
+    failures = [RuntimeError("out of memory")] * 2
+
+    def flaky_step(windows):
+        if failures:
+            raise failures.pop()
+
+        return step(windows)
+
+    batcher.step = flaky_step
+
+    async def scenario():
+        server = await asyncio.start_server(inference_server.inference_server(batcher).handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        batcher_task = asyncio.create_task(batcher.run())
+
+        try:
+            failed = await asyncio.wait_for(post_complete(port, {"prompt": "kato mira", "max_tokens": 4}), 10)
+            failed_stream = await asyncio.wait_for(post_complete(port, {"prompt": "kato mira", "max_tokens": 4, "stream": True}), 10)
+            served = await asyncio.wait_for(post_complete(port, {"prompt": "kato mira", "max_tokens": 4}), 10)
+        finally:
+            batcher_task.cancel()
+            server.close()
+
+        return failed, failed_stream, served
+
+    failed, failed_stream, served = asyncio.run(scenario())
+
+    assert failed[0].endswith("500 Internal Server Error") and "out of memory" in json.loads(failed[1])["error"]
+    assert failed_stream[0].endswith("200 OK") and b'"error"' in failed_stream[1] and b'"done"' not in failed_stream[1]
+    assert served[0].endswith("200 OK") and json.loads(served[1])["tokens"] == 4
+
+    assert batcher.stats.failed == 2 and batcher.stats.completed == 1 and batcher.stats.cancelled == 0
+
+def test_malformed_requests_get_a_400(net, table, decoder):
+    batcher = inference_server.dynamic_batcher(net, table, decoder, context_length, max_wait_ms=1)
+
+    requests = [b"POST /complete HTTP/1.1\r\nContent-Length: lots\r\n\r\n",
+                b"POST /complete HTTP/1.1\r\nContent-Length: -5\r\n\r\n",
+                b"POST /complete HTTP/1.1\r\nContent-Length: 9\r\n\r\n{\"prompt\"",
+                b"POST /complete HTTP/1.1\r\nContent-Length: 2\r\n\r\n[]",
+                b"POST /complete HTTP/1.1\r\nContent-Length: 18\r\n\r\n{\"max_tokens\": []}"]
+
+    async def scenario():
+        server = await asyncio.start_server(inference_server.inference_server(batcher).handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+
+        try:
+            return [await asyncio.wait_for(post_raw(port, request), 10) for request in requests]
+        finally:
+            server.close()
+
+    for status, body in asyncio.run(scenario()):
+        assert status.endswith("400 Bad Request") and "error" in json.loads(body)
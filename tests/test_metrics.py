@@ -0,0 +1,79 @@
+import torch
+import embedding_table
+import tokenizer
+import metrics
+from conftest import context_length
+
+def test_evaluate_without_lengths_is_the_training_loss(net, table, tokens):
+    # windows starting with out of vocab tokens (niv_id, like padding) are still full windows when no lengths are given
+    eval_ids = torch.stack([table.batch_ids([tokens[start:start + context_length + 1]], context_length + 1)[0] for start in range(0, 700, 7)])
+    eval_ids[:5, :3] = embedding_table.niv_id
+
+    loss = torch.nn.MSELoss()
+    vectors = table.vectorize_ids(eval_ids)
+
+    with torch.no_grad():
+        expected = loss(net(vectors[:, :-1]), vectors[:, 1:])
+
+    torch.testing.assert_close(metrics.evaluate(net, loss, eval_ids, table, batch_size=20, autocast=False), expected)
+
+def test_evaluate_masks_padded_examples(net, table, tokens):
+    # an example padded at EOF counts its real positions only, each as if run unpadded
+    eval_ids = torch.stack([table.batch_ids([tokens[start:start + context_length + 1]], context_length + 1)[0] for start in range(0, 70, 7)])
+    eval_lengths = torch.full((len(eval_ids),), context_length)
+
+    eval_ids[3] = table.batch_ids([tokens[500:506]], context_length + 1)[0]
+    eval_lengths[3] = 5
+
+    loss = torch.nn.MSELoss(reduction="sum")
+    full = table.vectorize_ids(eval_ids[torch.arange(len(eval_ids)) != 3])
+    short = table.vectorize_ids(eval_ids[3, -6:]).unsqueeze(0)
+
+    with torch.no_grad():
+        total = loss(net(full[:, :-1]), full[:, 1:]) + loss(net(short[:, :-1]), short[:, 1:])
+
+    expected = total / (((len(eval_ids) - 1) * context_length + 5) * table.vector_size)
+
+    torch.testing.assert_close(metrics.evaluate(net, torch.nn.MSELoss(), eval_ids, table, batch_size=4, autocast=False, eval_lengths=eval_lengths), expected)
+
+def test_tensorize_eval_set_lengths(script, table, text, tmp_path):
+    path = tmp_path / "test.txt"
+    path.write_text(text[:20000], encoding="utf-8")
+
+    num_examples = len(tokenizer.tokenize_segment(text[:20000]))
+    dataset = script.REAN_dataset(str(path), num_examples, context_length, verify_dataset_size=False, token_ids=True)
+
+    eval_ids, eval_lengths = metrics.tensorize_eval_set(dataset)
+
+    assert eval_lengths[0] == context_length
+    assert eval_lengths[-1] < context_length
+
+    # the padding in front of every example is exactly what the lengths say
+    for example_ids, length in zip(eval_ids, eval_lengths.tolist()):
+        assert (example_ids[:context_length - length] == embedding_table.niv_id).all()
+
+def test_evaluate_empty_eval_set_is_zero(net, table):
+    # a rank's empty eval slice: zero, so reduce_weighted_mean weighs it by its zero examples
+    eval_ids = torch.zeros((0, context_length + 1), dtype=torch.int64)
+
+    assert metrics.evaluate(net, torch.nn.MSELoss(), eval_ids, table, autocast=False).item() == 0
+
+def test_async_summary_writer_survives_a_failing_call(tmp_path):
+    writer = metrics.async_summary_writer(str(tmp_path), max_queue=2)
+    written = []
+
+    def add_scalar(tag, value, step):
+        if step == 0:
+            raise RuntimeError("disk full")
+
+        written.append(step)
+
+    writer.writer.add_scalar = add_scalar
+
+    # more calls than the queue holds, so a dead writer thread would block here
+    for step in range(5):
+        writer.add_scalar("loss", 1.0, step)
+
+    writer.close()
+
+    assert written == [1, 2, 3, 4]
@@ -0,0 +1,20 @@
+import pytest
+import torch
+import embedding_table
+import metrics
+import quantization
+
+@pytest.mark.parametrize("dtype", ["int8", "fp16"])
+def test_quantized_table_has_the_base_api(table, dtype, tmp_path):
+    quantized_table = quantization.quantized_embedding_table(table, dtype)
+
+    # dequantized on demand, within the quantization error of the float32 matrix
+    assert quantized_table.vectors.dtype == torch.float32
+    torch.testing.assert_close(quantized_table.vectors, table.vectors, atol=table.vectors.abs().max().item() / 127, rtol=0)
+    torch.testing.assert_close(quantized_table.vectors_on("cpu")[:10], quantized_table.vectorize_ids(torch.arange(10)))
+
+    # callers written for embedding_table
+    decoder = embedding_table.nearest_token_decoder(quantized_table)
+    assert decoder.decode_ids(quantized_table.vectors[1:50]).tolist() == quantization.quantized_nearest_token_decoder(quantized_table).decode_ids(quantized_table.vectors[1:50]).tolist()
+
+    metrics.save_eval_set(str(tmp_path / "eval_set.pt"), torch.zeros((2, 3), dtype=torch.int32), quantized_table.vectors)
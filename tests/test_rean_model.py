@@ -0,0 +1,29 @@
+import pytest
+import torch
+from conftest import vector_size, context_length
+
+@pytest.mark.parametrize("padded", [False, True])
+def test_fused_attention_matches_multihead_attention(net, padded):
+    torch.manual_seed(1)
+    segment = torch.randn(3, context_length, vector_size)
+    lengths = torch.tensor([context_length, 5, 1]) if padded else None
+
+    # same weights, only the attention path differs
+    with torch.no_grad():
+        fused = net(segment, lengths)
+        net.set_fused_attention(False)
+        unfused = net(segment, lengths)
+
+    torch.testing.assert_close(fused, unfused)
+
+def test_padded_rows_match_the_unpadded_sequences(net):
+    torch.manual_seed(2)
+    segment = torch.randn(4, context_length, vector_size)
+    lengths = [context_length, 9, 3, 1]
+
+    # the padding vectors (whatever they hold) are never attended to and the positions count from the first real token
+    with torch.no_grad():
+        padded = net(segment, torch.tensor(lengths))
+
+        for row, length in enumerate(lengths):
+            torch.testing.assert_close(padded[row, -length:], net(segment[row:row + 1, -length:])[0])
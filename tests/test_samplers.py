@@ -0,0 +1,53 @@
+import pytest
+import samplers
+
+# doesnt split evenly over 3 or 4 ranks
+data_len = 103
+
+@pytest.mark.parametrize("num_replicas", [1, 3, 4])
+def test_sharded_sampler_covers_the_epoch_in_equal_shards(num_replicas):
+    shards = []
+
+    for rank in range(num_replicas):
+        sampler = samplers.sharded_resumable_sampler(data_len, num_replicas, rank, seed=5)
+        sampler.set_epoch(2)
+
+        shards.append(list(sampler))
+        assert len(shards[-1]) == len(sampler)
+
+    # same length everywhere, or the all-reduce hangs
+    assert len({len(shard) for shard in shards}) == 1
+
+    # together they cover every example, and the only ones seen twice are the few padded ones
+    indices = [index for shard in shards for index in shard]
+    assert set(indices) == set(range(data_len))
+    assert len(indices) - data_len == -data_len % num_replicas
+
+@pytest.mark.parametrize("num_replicas", [1, 3, 4])
+@pytest.mark.parametrize("skip_examples", [0, 10, 50, 101])
+def test_sharded_sampler_skip_resumes_the_epoch(num_replicas, skip_examples):
+    full = samplers.resumable_random_sampler(data_len, seed=5)
+    full.set_epoch(2)
+    tail = list(full)[skip_examples:]
+
+    shards = []
+
+    for rank in range(num_replicas):
+        sampler = samplers.sharded_resumable_sampler(data_len, num_replicas, rank, seed=5)
+        sampler.set_epoch(2)
+        sampler.skip(skip_examples)
+
+        # len() before iterating (iterating consumes the skip)
+        expected_len = len(sampler)
+        shards.append(list(sampler))
+
+        assert len(shards[-1]) == expected_len
+
+        # the skip only applies once, the next epoch is whole again
+        assert len(sampler) == -(-data_len // num_replicas)
+
+    assert len({len(shard) for shard in shards}) == 1
+
+    # skip counts examples of the whole epoch: together the ranks see exactly the rest of it (plus padding)
+    assert set(index for shard in shards for index in shard) == set(tail)
+    assert sum(len(shard) for shard in shards) == len(tail) + -len(tail) % num_replicas
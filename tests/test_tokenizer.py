@@ -0,0 +1,30 @@
+import pytest
+import tokenizer
+
+# runs of every kind of whitespace, a token longer than the reads, punctuation glued to words and whitespace at both ends
+whitespace_text = "  \n\t kato   mira,\n\n\n  [human]  " + "a" * 50 + "  \t.,;  \n ok\t\t\n " * 20 + "   "
+
+def tokenize_file(tmp_path, text: str, **kwargs) -> list:
+    path = tmp_path / "corpus.txt"
+    path.write_text(text)
+
+    return [token for chunk in tokenizer.get_tokenizer().tokenize_file(str(path), **kwargs) for token in chunk]
+
+@pytest.mark.parametrize("read_size", [1, 2, 3, 7, 64, 1000])
+def test_tokenize_file_matches_tokenize_segment(text, tmp_path, read_size):
+    # tokens cut at read boundaries come out whole
+    for current_text in [text[:5000], whitespace_text]:
+        assert tokenize_file(tmp_path, current_text, read_size=read_size) == tokenizer.tokenize_segment(current_text)
+
+def test_tokenize_file_on_a_process_pool(text, tmp_path):
+    assert tokenize_file(tmp_path, text, read_size=1000, processes=2) == tokenizer.tokenize_segment(text)
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_tokenize_file_token_ids(text, tmp_path, processes):
+    tokens = tokenizer.tokenize_segment(text)
+
+    # half the vocab known, the rest gets the unknown id
+    token_ids = {token: idx + 1 for idx, token in enumerate(sorted(set(tokens))[::2])}
+    expected = [token_ids.get(token, 0) for token in tokens]
+
+    assert tokenize_file(tmp_path, text, read_size=7, token_ids=token_ids, processes=processes) == expected
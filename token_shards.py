@@ -0,0 +1,191 @@
+import os
+import json
+import argparse
+import numpy as np
+from tqdm import tqdm
+import tokenizer
+from embedding_table import niv_id, niv_token, token_ids_from_model
+
+index_file = "index.json"
+vocab_file = "vocab.json"
+shard_name = "shard_[IDX].bin"
+
+def build_token_shards(text_path: str, out_dir: str, token_ids: dict, shard_size: int = 1024 * 1024 * 64, read_size: int = 1024 * 1024 * 16, processes: int = 1):
+    """
+    tokenizes a whole dataset .txt file ONCE and writes it as int32 token id shards + an index, so REAN_dataset can slice it by exact token index
+
+    Args:
+        text_path (str): path to the dataset .txt file
+        out_dir (str): directory to write the shards, vocab and index into
+        token_ids (dict[str, int]): token -> id map (see embedding_table.token_ids_from_model)
+        shard_size (int): max number of tokens per shard file
+        read_size (int): how many chars to read from the text file at a time
+        processes (int): tokenizer worker processes
+
+    Returns:
+        dict: the index that was written to out_dir/index.json
+    """
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    shards = []
+    pending = []            # id arrays waiting to be written into the current shard
+    pending_len = 0
+
+    def flush(final=False):
+        nonlocal pending, pending_len
+
+        ids = np.concatenate(pending) if pending else np.zeros(0, dtype=np.int32)
+
+        # cut off as many full shards as we can, keep the rest for later (unless this is the end of the file)
+        while len(ids) >= shard_size or (final and len(ids)):
+            current_name = shard_name.replace("[IDX]", str(len(shards)).zfill(5))
+            ids[:shard_size].tofile(os.path.join(out_dir, current_name))
+            shards.append({"file": current_name, "num_tokens": int(min(len(ids), shard_size))})
+            ids = ids[shard_size:]
+
+        pending = [ids]
+        pending_len = len(ids)
+
+    # streamed straight to ids, the tokenizer only splits the file where a new token starts (same tokens as tokenizing it whole)
+    with tqdm(desc="Building Token Shards", unit="token", unit_scale=True) as pbar:
+        for ids in tokenizer.get_tokenizer().tokenize_file(text_path, read_size=read_size, token_ids=token_ids, unknown_id=niv_id, processes=processes):
+            pending.append(np.asarray(ids, dtype=np.int32))
+            pending_len += len(ids)
+
+            if pending_len >= shard_size:
+                flush()
+
+            pbar.update(len(ids))
+
+    flush(final=True)
+
+    # vocab in id order, so ids can be turned back into tokens without the embeddings model
+    vocab = [niv_token] + [None] * len(token_ids)
+    for token, token_id in token_ids.items():
+        vocab[token_id] = token
+
+    with open(os.path.join(out_dir, vocab_file), "w") as file:
+        json.dump(vocab, file)
+
+    index = {"source": os.path.abspath(text_path),
+             "dtype": "int32",
+             "niv_id": niv_id,
+             "vocab_size": len(vocab),
+             "num_tokens": sum(shard["num_tokens"] for shard in shards),
+             "shards": shards}
+
+    with open(os.path.join(out_dir, index_file), "w") as file:
+        json.dump(index, file, indent=4)
+
+    return index
+
+class token_shard_reader:
+    """
+    read only view over a directory written by build_token_shards.\n
+    shards are memory mapped lazily (on first access) so the reader can be pickled into DataLoader workers without copying anything
+    """
+
+    def __init__(self, shards_dir: str):
+        self.shards_dir = shards_dir
+
+        with open(os.path.join(shards_dir, index_file)) as file:
+            self.index = json.load(file)
+
+        self.num_tokens = self.index["num_tokens"]
+        self.vocab_size = self.index["vocab_size"]
+
+        # token index at which every shard starts (plus the total at the end)
+        self.shard_starts = np.cumsum([0] + [shard["num_tokens"] for shard in self.index["shards"]])
+
+        self.shards = None
+        self.vocab = None
+
+    def __len__(self):
+        return self.num_tokens
+
+    def __getstate__(self):
+        # dont pickle open memmaps, every worker maps the files itself
+        state = self.__dict__.copy()
+        state["shards"] = None
+        return state
+
+    def open_shards(self):
+        if self.shards is None:
+            self.shards = [np.memmap(os.path.join(self.shards_dir, shard["file"]), dtype=np.int32, mode="r", shape=(shard["num_tokens"],))
+                           for shard in self.index["shards"]]
+
+        return self.shards
+
+    def get_vocab(self) -> list:
+        """
+        returns the id -> token list the shards were built with (loaded on first call)
+        """
+
+        if self.vocab is None:
+            with open(os.path.join(self.shards_dir, vocab_file)) as file:
+                self.vocab = json.load(file)
+
+        return self.vocab
+
+    def slice(self, start: int, length: int) -> np.ndarray:
+        """
+        returns the token ids [start, start + length) in O(1), clipped at the end of the corpus
+
+        Args:
+            start (int): exact token index to start at
+            length (int): how many tokens to return
+
+        Returns:
+            np.ndarray: int32 array of at most length token ids
+        """
+
+        shards = self.open_shards()
+
+        stop = min(start + length, self.num_tokens)
+        shard_idx = int(np.searchsorted(self.shard_starts, start, side="right")) - 1
+
+        result = []
+
+        # a window can cross into the next shard(s)
+        while start < stop:
+            shard_start = self.shard_starts[shard_idx]
+            shard_stop = min(stop, self.shard_starts[shard_idx + 1])
+
+            result.append(shards[shard_idx][start - shard_start:shard_stop - shard_start])
+
+            start = shard_stop
+            shard_idx += 1
+
+        if len(result) == 1:
+            return np.asarray(result[0])
+
+        return np.concatenate(result) if result else np.zeros(0, dtype=np.int32)
+
+    def slice_tokens(self, start: int, length: int) -> list:
+        """
+        same as slice() but turns the ids back into token strings
+        """
+
+        vocab = self.get_vocab()
+
+        return [vocab[token_id] for token_id in self.slice(start, length)]
+
+if __name__ == "__main__":
+    from gensim.models import Word2Vec
+
+    parser = argparse.ArgumentParser(description="tokenize dataset .txt files once into memory mapped int32 token id shards for REAN_dataset")
+    parser.add_argument("--model", default="./embedding_models/b4cksh0t5_checkp3.model", help="word2vec model whos vocab gives the token ids")
+    parser.add_argument("--text", nargs="+", default=["./datasets/ultra_train.txt", "./datasets/ultra_test.txt"], help="dataset .txt files to tokenize")
+    parser.add_argument("--out", nargs="+", default=None, help="output dirs (default: <text without .txt>_shards)")
+    parser.add_argument("--shard-size", type=int, default=1024 * 1024 * 64, help="tokens per shard")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="tokenizer worker processes")
+    args = parser.parse_args()
+
+    out_dirs = args.out or [os.path.splitext(path)[0] + "_shards" for path in args.text]
+
+    token_ids = token_ids_from_model(Word2Vec.load(args.model))
+
+    for text_path, out_dir in zip(args.text, out_dirs):
+        index = build_token_shards(text_path, out_dir, token_ids, shard_size=args.shard_size, processes=args.processes)
+        print(f"{text_path} ---> {out_dir}: {index['num_tokens']} tokens in {len(index['shards'])} shards")
@@ -1,10 +1,15 @@
 import re
+import multiprocessing
+from collections import deque
+from functools import lru_cache
 
 # get misc info about tokenizer (i just made these numbers up, theyre for security / optimization in REAN code)
 max_token_size = 12
 average_token_length = 8
 
-def tokenize_segment(text, con_chars="abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ1234567890"):
+default_con_chars = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ1234567890"
+
+def tokenize_segment(text, con_chars=default_con_chars):
     """
     this function serves as the tokenizer for training and using both the word2vec, and REAN.
     breaks up string given into a list of tokens (substrings).
@@ -18,17 +23,7 @@ def tokenize_segment(text, con_chars="abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOP
         list[str]: a list of tokens, representing text arg
     """
     
-    # dunno chatgpt wrote it
-    pattern = fr"""
-        [{re.escape(con_chars)}]+        # Match one or more constant characters (words)
-        (?:[\s]+)?                       # Optionally include following whitespace
-      | [^\s{re.escape(con_chars)}]      # Match any single character not in constant characters or whitespace (punctuation)
-        (?:[\s]+)?                       # Optionally include following whitespace
-    """
-    
-    tokens = re.findall(pattern, text, re.VERBOSE)
-
-    return tokens
+    return get_tokenizer(con_chars).tokenize(text)
 
 def detokenize_segment(tokens):
     """
@@ -41,4 +36,208 @@ def detokenize_segment(tokens):
         (str): tokens sequence as normal string
     """
     
-    return "".join(tokens)
\ No newline at end of file
+    return "".join(tokens)
+
+def pattern_string(con_chars=default_con_chars):
+    # dunno chatgpt wrote it
+    return fr"""
+        [{re.escape(con_chars)}]+        # Match one or more constant characters (words)
+        (?:[\s]+)?                       # Optionally include following whitespace
+      | [^\s{re.escape(con_chars)}]      # Match any single character not in constant characters or whitespace (punctuation)
+        (?:[\s]+)?                       # Optionally include following whitespace
+    """
+
+@lru_cache(maxsize=None)
+def get_tokenizer(con_chars=default_con_chars):
+    """
+    returns a compiled_tokenizer for con_chars, built once and reused (that is what tokenize_segment uses)
+    """
+
+    return compiled_tokenizer(con_chars)
+
+# a token always starts at a non whitespace char right after whitespace, so text can be split there and tokenized in pieces with the same result
+token_boundary = re.compile(r"\s(?=\S)")
+
+def last_token_boundary(text: str, search_size: int = 4096):
+    """
+    returns the index of the last place in text where it can be split without changing the tokenization, None if there is none
+    """
+
+    search_start = max(len(text) - search_size, 0)
+
+    while True:
+        boundaries = list(token_boundary.finditer(text, search_start))
+
+        if boundaries:
+            return boundaries[-1].end()
+
+        if search_start == 0:
+            return None
+
+        search_start = max(search_start - search_size * 16, 0)
+
+# token ids dicts sent to the worker processes once (by the pool initializer) instead of with every chunk
+worker_token_ids = None
+
+def init_worker(token_ids):
+    global worker_token_ids
+    worker_token_ids = token_ids
+
+def tokenize_worker(args):
+    # process pool worker (has to be a top level function to be picklable)
+    con_chars, text, unknown_id = args
+    current_tokenizer = get_tokenizer(con_chars)
+
+    if worker_token_ids is None:
+        return current_tokenizer.tokenize(text)
+
+    return current_tokenizer.tokenize_ids(text, worker_token_ids, unknown_id)
+
+class compiled_tokenizer:
+    """
+    the same tokenizer as tokenize_segment, but the regex is compiled ONCE per con_chars.\n
+    also does batches, streaming over whole files, emitting vocab ids directly and tokenizing big inputs on a process pool.
+    every output is exactly equal to what tokenize_segment would give on the same (whole) text
+    """
+
+    def __init__(self, con_chars=default_con_chars):
+        self.con_chars = con_chars
+        self.pattern = re.compile(pattern_string(con_chars), re.VERBOSE)
+
+    def tokenize(self, text: str) -> list[str]:
+        """
+        same as tokenize_segment(text, self.con_chars)
+        """
+
+        return self.pattern.findall(text)
+
+    @staticmethod
+    def to_ids(tokens: list[str], token_ids: dict, unknown_id: int = 0) -> list[int]:
+        """
+        turns tokens into vocab ids (e.g. embedding_table.token_ids), tokens not in the vocab get unknown_id
+        """
+
+        get = token_ids.get
+
+        return [get(token, unknown_id) for token in tokens]
+
+    def tokenize_ids(self, text: str, token_ids: dict, unknown_id: int = 0) -> list[int]:
+        """
+        tokenizes text straight into vocab ids
+
+        Args:
+            text (str): the sequence to be tokenized
+            token_ids (dict[str, int]): token -> id (e.g. embedding_table.token_ids)
+            unknown_id (int): id for tokens not in token_ids (embedding_table.niv_id)
+
+        Returns:
+            list[int]: ids of the tokens of text
+        """
+
+        return self.to_ids(self.tokenize(text), token_ids, unknown_id)
+
+    def tokenize_batch(self, texts: list[str], token_ids: dict = None, unknown_id: int = 0, processes: int = 1) -> list[list]:
+        """
+        tokenizes many strings
+
+        Args:
+            texts (list[str]): strings to tokenize (each one on its own)
+            token_ids (dict[str, int]): if given, return ids instead of tokens
+            unknown_id (int): id for tokens not in token_ids
+            processes (int): > 1 ---> spread the strings over a process pool (only worth it for a lot of text)
+
+        Returns:
+            list[list]: tokens (or ids) per string, same order as texts
+        """
+
+        if processes > 1:
+            with multiprocessing.Pool(processes, initializer=init_worker, initargs=(token_ids,)) as pool:
+                return pool.map(tokenize_worker, [(self.con_chars, text, unknown_id) for text in texts], chunksize=max(len(texts) // (processes * 4), 1))
+
+        if token_ids is None:
+            return [self.tokenize(text) for text in texts]
+
+        return [self.tokenize_ids(text, token_ids, unknown_id) for text in texts]
+
+    def tokenize_file(self, path: str, read_size: int = 1024 * 1024 * 16, token_ids: dict = None, unknown_id: int = 0, processes: int = 1):
+        """
+        streams a text file thru the tokenizer, a chunk of tokens at a time.\n
+        the file is read in read_size pieces that are only ever split where a new token starts, so tokens cut at a read boundary come out the same as tokenizing the whole file at once
+
+        Args:
+            path (str): text file (opened with errors="ignore", like the datasets)
+            read_size (int): chars to read at a time
+            token_ids (dict[str, int]): if given, yield ids instead of tokens
+            unknown_id (int): id for tokens not in token_ids
+            processes (int): > 1 ---> tokenize the pieces on a process pool (output order is kept)
+
+        Yields:
+            list: the tokens (or ids) of the next piece of the file
+        """
+
+        return self.tokenize_pieces(self.read_pieces(path, read_size), token_ids, unknown_id, processes)
+
+    def tokenize_pieces(self, pieces, token_ids: dict = None, unknown_id: int = 0, processes: int = 1):
+        """
+        tokenize_file, but over any iterable of text pieces that are only cut where a token starts (see split_pieces)
+
+        Yields:
+            list: the tokens (or ids) of the next piece
+        """
+
+        if processes <= 1:
+            for piece in pieces:
+                yield self.tokenize(piece) if token_ids is None else self.tokenize_ids(piece, token_ids, unknown_id)
+            return
+
+        with multiprocessing.Pool(processes, initializer=init_worker, initargs=(token_ids,)) as pool:
+            in_flight = deque()
+
+            for piece in pieces:
+                in_flight.append(pool.apply_async(tokenize_worker, ((self.con_chars, piece, unknown_id),)))
+
+                # keep the order and only a few pieces in memory
+                while len(in_flight) >= processes * 2:
+                    yield in_flight.popleft().get()
+
+            while in_flight:
+                yield in_flight.popleft().get()
+
+    @staticmethod
+    def read_pieces(path: str, read_size: int):
+        """
+        reads a text file in about read_size pieces, each one ending right before a token start (see split_pieces)
+        """
+
+        with open(path, errors="ignore") as file:
+            yield from compiled_tokenizer.split_pieces(iter(lambda: file.read(read_size), ""))
+
+    @staticmethod
+    def split_pieces(blocks):
+        """
+        re-cuts any stream of text blocks so every piece ends right before a token start (see last_token_boundary).\n
+        tokenizing the pieces one by one then gives exactly the tokens of the whole text
+
+        Args:
+            blocks (iterable[str]): consecutive pieces of a text, cut anywhere
+
+        Yields:
+            str: consecutive pieces of the same text, cut only where a token starts
+        """
+
+        carry = ""
+
+        for data in blocks:
+            text = carry + data
+            cut = last_token_boundary(text)
+
+            # no token start at all yet (one giant token), keep reading
+            if cut is None:
+                carry = text
+                continue
+
+            yield text[:cut]
+            carry = text[cut:]
+
+        if carry:
+            yield carry
@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import codecs
+import argparse
+from collections import Counter
+from gensim.models import Word2Vec
+import tokenizer
+
+# dataset settings
+dataset_path = fr"./datasets/ultra_train.txt"
+model_path = fr"./embedding_models/b4cksh0t5_checkp4.model"
+read_size = 1024 * 1024 * 4
+sentence_length = 8192       # tokens per "sentence" handed to gensim (gensim cuts anything over 10000)
+
+# model hyperparams (same as word2vec_2.ipynb, except for the workers)
+vector_size = 28 * 28   # Dimensionality of the word vectors
+window = 10             # Maximum distance between the current and predicted word within a sentence
+min_count = 2           # Ignores all words with total frequency lower than this
+workers = os.cpu_count() # Number of worker threads to train the model
+sg = 0                  # Training algorithm: 1 for skip-gram; 0 for CBOW
+hs = 0                  # If 1, hierarchical softmax will be used for model training. If 0, and negative is non-zero, negative sampling will be used.
+negative = 16           # If > 0, negative sampling will be used. The int for negative specifies how many "noise words" should be drawn
+epochs = 6              # Number of iterations (epochs) over the corpus
+alpha = 0.025           # The initial learning rate
+min_alpha = 0.0001      # The minimum learning rate
+
+# checkpointing
+parts_per_epoch = 16    # the corpus is split into this many byte ranges, a checkpoint is saved after every one
+
+def part_boundary(file, position: int) -> int:
+    """
+    returns the first byte position >= position where a new token starts (ascii whitespace followed by an ascii non whitespace char), or the file size.\n
+    every part computes its start and end the same way, so neighbouring parts never overlap or drop a token
+    """
+
+    if position <= 0:
+        return 0
+
+    file.seek(position - 1)
+    offset = position - 1
+
+    while True:
+        block = file.read(65536)
+
+        if len(block) < 2:
+            return file.seek(0, os.SEEK_END)
+
+        for idx in range(len(block) - 1):
+            if block[idx:idx + 1].isspace() and block[idx + 1] < 128 and not block[idx + 1:idx + 2].isspace():
+                return offset + idx + 1
+
+        # re-read the last byte, it might be the whitespace of a boundary
+        offset += len(block) - 1
+        file.seek(offset)
+
+class streamed_corpus:
+    """
+    restartable iterable corpus for gensim: every __iter__ streams (a byte range of) the dataset again thru the tokenizer, nothing is held in memory.\n
+    yields "sentences" of sentence_length tokens
+    """
+
+    def __init__(self, path: str=dataset_path, part: int=0, num_parts: int=1, sentence_length: int=sentence_length, read_size: int=read_size):
+        """
+        Args:
+            path (str): dataset .txt file
+            part (int): which byte range of the file to stream
+            num_parts (int): how many byte ranges the file is split into (1 ---> the whole file)
+            sentence_length (int): tokens per sentence
+            read_size (int): bytes to read at a time
+        """
+
+        self.path = path
+        self.part = part
+        self.num_parts = num_parts
+        self.sentence_length = sentence_length
+        self.read_size = read_size
+
+    def byte_range(self) -> tuple[int, int]:
+        size = os.path.getsize(self.path)
+
+        with open(self.path, "rb") as file:
+            return part_boundary(file, size * self.part // self.num_parts), part_boundary(file, size * (self.part + 1) // self.num_parts)
+
+    def blocks(self):
+        start, end = self.byte_range()
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+
+        with open(self.path, "rb") as file:
+            file.seek(start)
+
+            while start < end:
+                data = file.read(min(self.read_size, end - start))
+
+                if not data:
+                    break
+
+                start += len(data)
+                yield decoder.decode(data, final=start >= end)
+
+    def __iter__(self):
+        current_tokenizer = tokenizer.get_tokenizer()
+        sentence = []
+
+        for tokens in current_tokenizer.tokenize_pieces(current_tokenizer.split_pieces(self.blocks())):
+            sentence += tokens
+
+            while len(sentence) >= self.sentence_length:
+                yield sentence[:self.sentence_length]
+                sentence = sentence[self.sentence_length:]
+
+        if sentence:
+            yield sentence
+
+def count_vocab(path: str=dataset_path, processes: int=os.cpu_count(), sentence_length: int=sentence_length) -> tuple[Counter, int]:
+    """
+    one counting pass over the whole dataset (tokenized on a process pool)
+
+    Returns:
+        Counter: token -> count
+        int: number of sentences the corpus will be cut into
+    """
+
+    counts = Counter()
+    total_tokens = 0
+
+    for tokens in tokenizer.get_tokenizer().tokenize_file(path, read_size=read_size, processes=processes):
+        counts.update(tokens)
+        total_tokens += len(tokens)
+
+    return counts, -(-total_tokens // sentence_length)
+
+def save_checkpoint(model: Word2Vec, path: str, state: dict):
+    """
+    saves the model as a single file and the training state next to it, both written to a temp file first and renamed, so a crash never leaves a half written checkpoint
+    """
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    model.save(path + ".tmp", separately=[])
+    os.replace(path + ".tmp", path)
+
+    with open(path + ".state.tmp", "w") as file:
+        json.dump(state, file, indent=4)
+    os.replace(path + ".state.tmp", path + ".state.json")
+
+def train(path: str=dataset_path, out_path: str=model_path, init_model: str=None, resume: bool=False, epochs: int=epochs, parts_per_epoch: int=parts_per_epoch, workers: int=workers):
+    """
+    trains (or keeps training) a Word2Vec model on the dataset with gensim's multi worker training, checkpointing after every part of every epoch.\n
+    the learning rate goes linearly from alpha to min_alpha over all epochs, the same way a single model.train(epochs=epochs) call would
+
+    Args:
+        path (str): dataset .txt file
+        out_path (str): where to save the model (a .state.json with the progress is saved next to it)
+        init_model (str): existing model to continue from (its vocab is updated with the new counts), None ---> new model
+        resume (bool): continue from out_path and its .state.json where the last run stopped
+        epochs (int): epochs over the corpus
+        parts_per_epoch (int): checkpoints per epoch
+        workers (int): gensim worker threads
+
+    Returns:
+        Word2Vec: the trained model
+    """
+
+    if resume:
+        model = Word2Vec.load(out_path)
+
+        with open(out_path + ".state.json") as file:
+            state = json.load(file)
+
+        print(f"resuming from epoch {state['epoch']} part {state['part']}")
+    else:
+        start = time.perf_counter()
+        counts, num_sentences = count_vocab(path, processes=workers)
+        print(f"vocab pass: {sum(counts.values())} tokens, {len(counts)} distinct, {time.perf_counter() - start:.1f}s")
+
+        if init_model is not None:
+            model = Word2Vec.load(init_model)
+            model.build_vocab_from_freq(counts, corpus_count=num_sentences, update=True)
+        else:
+            model = Word2Vec(vector_size=vector_size, window=window, min_count=min_count, workers=workers, sg=sg, hs=hs, negative=negative, alpha=alpha, min_alpha=min_alpha)
+            model.build_vocab_from_freq(counts, corpus_count=num_sentences)
+
+        # the schedule's ends are kept in the state, model.train(start_alpha=..., end_alpha=...) overwrites model.alpha / model.min_alpha with every part's values
+        state = {"epoch": 0, "part": 0, "epochs": epochs, "parts_per_epoch": parts_per_epoch, "total_words": sum(counts.values()), "dataset": os.path.abspath(path),
+                 "alpha": alpha, "min_alpha": min_alpha}
+
+    model.workers = workers
+    total_parts = state["epochs"] * state["parts_per_epoch"]
+
+    # states saved before the schedule was stored use the configured one
+    schedule_alpha = state.setdefault("alpha", alpha)
+    schedule_min_alpha = state.setdefault("min_alpha", min_alpha)
+
+    while state["epoch"] < state["epochs"]:
+        done_parts = state["epoch"] * state["parts_per_epoch"] + state["part"]
+
+        # this part's slice of the overall linear learning rate decay
+        start_alpha = schedule_alpha - (schedule_alpha - schedule_min_alpha) * done_parts / total_parts
+        end_alpha = schedule_alpha - (schedule_alpha - schedule_min_alpha) * (done_parts + 1) / total_parts
+
+        corpus = streamed_corpus(path, state["part"], state["parts_per_epoch"])
+
+        start = time.perf_counter()
+        _, raw_words = model.train(corpus_iterable=corpus, total_words=state["total_words"] // state["parts_per_epoch"], epochs=1, start_alpha=start_alpha, end_alpha=end_alpha)
+        seconds = time.perf_counter() - start
+
+        print(f"epoch {state['epoch'] + 1}/{state['epochs']} part {state['part'] + 1}/{state['parts_per_epoch']}: {raw_words} words in {seconds:.1f}s ({raw_words / max(seconds, 1e-9):.0f} words/sec)")
+
+        state["part"] += 1
+        if state["part"] == state["parts_per_epoch"]:
+            state["epoch"] += 1
+            state["part"] = 0
+
+        save_checkpoint(model, out_path, state)
+
+    return model
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="streaming, restartable, multi worker Word2Vec training for the REAN embeddings")
+    parser.add_argument("--dataset", default=dataset_path)
+    parser.add_argument("--out", default=model_path, help="model path (checkpoints are written here)")
+    parser.add_argument("--init-model", default=None, help="existing model to keep training, e.g. ./embedding_models/b4cksh0t5_checkp3.model")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted run from --out")
+    parser.add_argument("--epochs", type=int, default=epochs)
+    parser.add_argument("--parts-per-epoch", type=int, default=parts_per_epoch, help="checkpoints per epoch")
+    parser.add_argument("--workers", type=int, default=workers)
+    args = parser.parse_args()
+
+    train(args.dataset, args.out, init_model=args.init_model, resume=args.resume, epochs=args.epochs, parts_per_epoch=args.parts_per_epoch, workers=args.workers)